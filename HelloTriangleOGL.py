@@ -9,9 +9,10 @@ from OpenGL.GL import shaders
 
 
 class Engine:
-    def __init__(self):
+    def __init__(self, run = True, max_fps = 60, hidden = False):
         # Initialize general variables
         self.window_size = (640, 480)
+        self.max_fps = max_fps # 0 leaves the frame rate uncapped, which is what benchmarks want
         self.size_of_float = 4
 
         self.triangle_vertices = None
@@ -24,7 +25,11 @@ class Engine:
 
         # Initiate Pygame and its window 
         pg.init()
-        pg.display.set_mode(self.window_size, pg.DOUBLEBUF | pg.OPENGL | pg.RESIZABLE)
+        # A hidden window still gets a GL context, so the engine can run under a virtual display such as Xvfb
+        flags = pg.DOUBLEBUF | pg.OPENGL | pg.RESIZABLE
+        if hidden:
+            flags |= pg.HIDDEN
+        pg.display.set_mode(self.window_size, flags)
 
         # Setup OpenGL general parameters
         glClearColor(1.0, 0.5, 0.25, 1.0)
@@ -61,8 +66,9 @@ class Engine:
         glEnableVertexAttribArray(colorAttributeIndex)
         glVertexAttribPointer(colorAttributeIndex, 3, GL_FLOAT, GL_FALSE, 5 * self.size_of_float, ctypes.c_void_p(2 * self.size_of_float))
 
-        # Run loop
-        self.run()
+        # Run loop. Benchmarks drive the engine themselves, frame by frame
+        if run:
+            self.run()
 
     def initShaders(self):
         # Vertex shader source
@@ -114,9 +120,16 @@ class Engine:
             # change uniforms, for example, while running
            pass
     
-    def run(self):
-        while True:
-            delta = self.clock.tick(60) # This ensures that this runs at 60 frames per second
+    def render(self):
+        glClear(GL_COLOR_BUFFER_BIT)
+        glDrawArrays(GL_TRIANGLES, 0, 3)
+        pg.display.flip()
+
+    def run(self, frame_count = None):
+        # Runs until the window is closed, or for frame_count frames when given
+        frames = 0
+        while frame_count is None or frames < frame_count:
+            delta = self.clock.tick(self.max_fps) # This ensures that this runs at max_fps frames per second, when set
             self.process_events(pg.key.get_pressed())  # Checking already pressed keys
 
             for event in pg.event.get():
@@ -125,10 +138,13 @@ class Engine:
                     quit()
 
             # Render
-            glClear(GL_COLOR_BUFFER_BIT)
-            glDrawArrays(GL_TRIANGLES, 0, 3)
-            pg.display.flip()
+            self.render()
+            frames += 1
+
+    def close(self):
+        pg.quit()
 
 
 # MAIN
-my_engine = Engine()
\ No newline at end of file
+if __name__ == "__main__":
+    my_engine = Engine()
\ No newline at end of file
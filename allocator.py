@@ -0,0 +1,236 @@
+import threading
+
+from vulkan import *
+
+import memory
+
+# Memory is reserved from the driver in blocks of this size, and resources are placed inside them. Drivers only guarantee a few thousand
+# vkAllocateMemory calls (maxMemoryAllocationCount), so one allocation per resource doesn't scale
+DEFAULT_BLOCK_SIZE = 64 * 1024 * 1024
+
+class Allocation:
+
+    def __init__(self, memory, offset, size, memory_type, block = None):
+
+        self.memory = memory # VkDeviceMemory to bind to, shared with other allocations unless dedicated
+        self.offset = offset
+        self.size = size
+        self.memory_type = memory_type
+        self.block = block # MemoryBlock this came from, None for dedicated allocations
+        self.mapped = None # Set for host visible memory, a memoryview covering exactly this allocation
+
+class MemoryBlock:
+
+    # A single vkAllocateMemory, handed out in pieces through a sorted free list of (offset, size) ranges
+    def __init__(self, memory, size, memory_type):
+
+        self.memory = memory
+        self.size = size
+        self.memory_type = memory_type
+        self.free_ranges = [(0, size)]
+        self.used = 0
+        self.mapped = None # Host visible blocks are mapped once, for their whole lifetime
+
+    def allocate(self, size, alignment):
+
+        # First fit. Alignment padding in front of the allocation goes back into the free list so it isn't lost
+        for i, (offset, range_size) in enumerate(self.free_ranges):
+            aligned_offset = (offset + alignment - 1) // alignment * alignment
+            padding = aligned_offset - offset
+            if padding + size > range_size:
+                continue
+
+            remaining = []
+            if padding > 0:
+                remaining.append((offset, padding))
+            if padding + size < range_size:
+                remaining.append((aligned_offset + size, range_size - padding - size))
+            self.free_ranges[i:i + 1] = remaining
+
+            self.used += size
+            return aligned_offset
+
+        return None
+
+    def free(self, offset, size):
+
+        # Inserts the range back and merges it with its neighbours, so free space doesn't end up split into tiny pieces
+        index = 0
+        while index < len(self.free_ranges) and self.free_ranges[index][0] < offset:
+            index += 1
+        self.free_ranges.insert(index, (offset, size))
+
+        if index + 1 < len(self.free_ranges) and offset + size == self.free_ranges[index + 1][0]:
+            self.free_ranges[index] = (offset, size + self.free_ranges[index + 1][1])
+            del self.free_ranges[index + 1]
+        if index > 0 and self.free_ranges[index - 1][0] + self.free_ranges[index - 1][1] == offset:
+            self.free_ranges[index - 1] = (self.free_ranges[index - 1][0], self.free_ranges[index - 1][1] + self.free_ranges[index][1])
+            del self.free_ranges[index]
+
+        self.used -= size
+
+    def largest_free_range(self):
+        return max([range_size for offset, range_size in self.free_ranges], default = 0)
+
+class MemoryAllocator:
+
+    def __init__(self, device, physical_device, block_size = DEFAULT_BLOCK_SIZE, dedicated_threshold = None):
+
+        self.device = device
+        self.physical_device = physical_device
+        self.block_size = block_size
+
+        # Resources at least this big get their own vkAllocateMemory. They would waste most of a block and are usually long lived anyway
+        self.dedicated_threshold = dedicated_threshold if dedicated_threshold is not None else block_size // 2
+
+        # Buffers and optimally tiled images are kept in separate pools, so we never need to worry about bufferImageGranularity
+        self.pools = {} # (memory type, linear) -> [MemoryBlock]
+        self.dedicated = [] # Allocations with their own VkDeviceMemory
+        self.lock = threading.Lock()
+
+        self.memory_properties = vkGetPhysicalDeviceMemoryProperties(physical_device)
+
+    def is_host_visible(self, memory_type):
+        return bool(self.memory_properties.memoryTypes[memory_type].propertyFlags & VK_MEMORY_PROPERTY_HOST_VISIBLE_BIT)
+
+    def allocate(self, requirements, properties, fallback_properties = None, linear = True):
+
+        memory_type = memory.find_memory_type(self.physical_device, requirements.memoryTypeBits, properties)
+        if memory_type is None and fallback_properties is not None:
+            memory_type = memory.find_memory_type(self.physical_device, requirements.memoryTypeBits, fallback_properties)
+        if memory_type is None:
+            raise RuntimeError("No suitable memory type found")
+
+        with self.lock:
+            # Anything that can't fit a block gets its own memory too, even below a dedicated_threshold set higher than the block size
+            if requirements.size >= self.dedicated_threshold or requirements.size > self.block_size:
+                return self.allocate_dedicated(requirements.size, memory_type)
+
+            pool = self.pools.setdefault((memory_type, linear), [])
+            for block in pool:
+                offset = block.allocate(requirements.size, requirements.alignment)
+                if offset is not None:
+                    return self.make_allocation(block, offset, requirements.size)
+
+            # Every block is full, so a new one gets reserved
+            block = MemoryBlock(self.allocate_device_memory(self.block_size, memory_type), self.block_size, memory_type)
+            if self.is_host_visible(memory_type):
+                block.mapped = vkMapMemory(self.device, block.memory, 0, self.block_size, 0)
+            pool.append(block)
+
+            offset = block.allocate(requirements.size, requirements.alignment)
+            if offset is None:
+                raise RuntimeError("{} bytes with alignment {} don't fit a new {} byte block".format(requirements.size, requirements.alignment, self.block_size))
+            return self.make_allocation(block, offset, requirements.size)
+
+    def allocate_device_memory(self, size, memory_type):
+
+        alloc_info = VkMemoryAllocateInfo(allocationSize = size, memoryTypeIndex = memory_type)
+        return vkAllocateMemory(self.device, alloc_info, None)
+
+    def allocate_dedicated(self, size, memory_type):
+
+        allocation = Allocation(self.allocate_device_memory(size, memory_type), 0, size, memory_type)
+        if self.is_host_visible(memory_type):
+            allocation.mapped = vkMapMemory(self.device, allocation.memory, 0, size, 0)
+        self.dedicated.append(allocation)
+        return allocation
+
+    def make_allocation(self, block, offset, size):
+
+        allocation = Allocation(block.memory, offset, size, block.memory_type, block)
+        if block.mapped is not None:
+            # Zero copy view into the block's mapping, only valid while the allocation is alive
+            allocation.mapped = memoryview(block.mapped)[offset:offset + size]
+        return allocation
+
+    def free(self, allocation):
+
+        with self.lock:
+            if allocation.block is None:
+                if allocation.mapped is not None:
+                    allocation.mapped = None
+                    vkUnmapMemory(self.device, allocation.memory)
+                vkFreeMemory(self.device, allocation.memory, None)
+                self.dedicated.remove(allocation)
+            else:
+                allocation.mapped = None
+                allocation.block.free(allocation.offset, allocation.size)
+
+    def trim(self):
+
+        # Gives completely empty blocks back to the driver. Not done on free, so a resource that is recreated every so often doesn't
+        # keep allocating and releasing a whole block
+        with self.lock:
+            for key, pool in self.pools.items():
+                for block in [block for block in pool if block.used == 0]:
+                    self.release_block(block)
+                    pool.remove(block)
+
+    def release_block(self, block):
+
+        if block.mapped is not None:
+            block.mapped = None
+            vkUnmapMemory(self.device, block.memory)
+        vkFreeMemory(self.device, block.memory, None)
+
+    # Helpers creating a resource, with memory, already bound
+    def create_buffer(self, size, usage, properties, fallback_properties = None):
+
+        buffer_info = VkBufferCreateInfo(size = size, usage = usage, sharingMode = VK_SHARING_MODE_EXCLUSIVE)
+        buffer = vkCreateBuffer(self.device, buffer_info, None)
+
+        allocation = self.allocate(vkGetBufferMemoryRequirements(self.device, buffer), properties, fallback_properties, linear = True)
+        vkBindBufferMemory(self.device, buffer, allocation.memory, allocation.offset)
+
+        return buffer, allocation
+
+    def create_image(self, image_info, properties = VK_MEMORY_PROPERTY_DEVICE_LOCAL_BIT):
+
+        image = vkCreateImage(self.device, image_info, None)
+
+        linear = image_info.tiling == VK_IMAGE_TILING_LINEAR
+        allocation = self.allocate(vkGetImageMemoryRequirements(self.device, image), properties, linear = linear)
+        vkBindImageMemory(self.device, image, allocation.memory, allocation.offset)
+
+        return image, allocation
+
+    def stats(self):
+
+        with self.lock:
+            blocks = [block for pool in self.pools.values() for block in pool]
+
+            block_reserved = sum([block.size for block in blocks])
+            block_used = sum([block.used for block in blocks])
+            dedicated_bytes = sum([allocation.size for allocation in self.dedicated])
+
+            # Fragmentation compares the biggest free range with all free space. 0 means free space is contiguous in each block,
+            # values close to 1 mean it is scattered in pieces too small to be useful, which is when defragmenting would pay off
+            total_free = block_reserved - block_used
+            largest_free = sum([block.largest_free_range() for block in blocks])
+            fragmentation = 1.0 - largest_free / total_free if total_free > 0 else 0.0
+
+            return {
+                "bytes_used": block_used + dedicated_bytes,
+                "bytes_reserved": block_reserved + dedicated_bytes,
+                "block_count": len(blocks),
+                "dedicated_count": len(self.dedicated),
+                "free_range_count": sum([len(block.free_ranges) for block in blocks]),
+                "fragmentation": fragmentation,
+                "device_memory_allocations": len(blocks) + len(self.dedicated),
+            }
+
+    def destroy(self):
+
+        with self.lock:
+            for pool in self.pools.values():
+                for block in pool:
+                    self.release_block(block)
+            self.pools = {}
+
+            for allocation in self.dedicated:
+                if allocation.mapped is not None:
+                    allocation.mapped = None
+                    vkUnmapMemory(self.device, allocation.memory)
+                vkFreeMemory(self.device, allocation.memory, None)
+            self.dedicated = []
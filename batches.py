@@ -0,0 +1,154 @@
+import numpy
+
+from vulkan import *
+
+import buffers
+import pipeline
+
+# Per instance attributes. They follow the per vertex ones (buffers.VERTEX_DTYPE) in the shader, starting at location 2
+INSTANCE_DTYPE = numpy.dtype([("offset", numpy.float32, 2), ("scale", numpy.float32), ("color", numpy.float32, 3)])
+INSTANCE_BINDING = 1
+INSTANCE_FIRST_LOCATION = 2
+
+class InstanceBatch:
+
+    # Draws the same mesh many times with a single vkCmdDrawIndexed. The per instance data lives in its own vertex buffer with
+    # VK_VERTEX_INPUT_RATE_INSTANCE, so neither recording nor updating costs more Python work with more instances
+    def __init__(self, mesh, instance_buffer, capacity, count):
+
+        self.mesh = mesh
+        self.instance_buffer = instance_buffer
+        self.capacity = capacity # Instances the buffer can hold
+        self.count = count # Instances drawn. Recorded into command buffers, so changing it requires re-recording them
+
+        # Streamed updates, see stream_instance_batch. The staging ring is made by the first one
+        self.staging = None # Host visible, mapped, region_count regions of capacity instances each
+        self.region_count = 0
+        self.region = 0 # Region the next update is written into
+        self.pending = None # (region, instance count) of an update waiting to be copied by record_instance_copies
+
+def instanced_vertex_input():
+
+    per_vertex = buffers.vertex_input_from_dtype(buffers.VERTEX_DTYPE)
+    per_instance = buffers.vertex_input_from_dtype(INSTANCE_DTYPE, INSTANCE_BINDING, VK_VERTEX_INPUT_RATE_INSTANCE, INSTANCE_FIRST_LOCATION)
+    return buffers.merge_vertex_inputs(per_vertex, per_instance)
+
+def create_instanced_pipeline(device, image_format, vertex_filepath, fragment_filepath, final_layout=VK_IMAGE_LAYOUT_PRESENT_SRC_KHR,
+    pipeline_cache=VK_NULL_HANDLE, shader_cache=None, set_layouts=(), push_constant_ranges=()):
+
+    return pipeline.create_graphics_pipeline(device, image_format, vertex_filepath, fragment_filepath, final_layout, pipeline_cache, shader_cache,
+        instanced_vertex_input(), set_layouts, push_constant_ranges)
+
+def create_instance_batch(allocator, command_pool, queue, mesh, instances, capacity = None):
+
+    # instances is a structured array with INSTANCE_DTYPE. Extra capacity lets the batch grow later without creating a new buffer
+    instances = numpy.ascontiguousarray(instances, dtype = INSTANCE_DTYPE)
+    capacity = max(capacity or 0, len(instances), 1)
+
+    instance_buffer = buffers.create_buffer(allocator, capacity * INSTANCE_DTYPE.itemsize,
+        VK_BUFFER_USAGE_VERTEX_BUFFER_BIT | VK_BUFFER_USAGE_TRANSFER_DST_BIT, VK_MEMORY_PROPERTY_DEVICE_LOCAL_BIT)
+    my_batch = InstanceBatch(mesh, instance_buffer, capacity, 0)
+
+    update_instance_batch(allocator, command_pool, queue, my_batch, instances)
+    return my_batch
+
+def update_instance_batch(allocator, command_pool, queue, batch, instances):
+
+    # Returns True when the number of instances changed, in which case command buffers drawing the batch must be re-recorded
+    instances = numpy.ascontiguousarray(instances, dtype = INSTANCE_DTYPE)
+    if len(instances) > batch.capacity:
+        raise ValueError("Batch holds at most {} instances, got {}".format(batch.capacity, len(instances)))
+
+    if len(instances) > 0:
+        buffers.update_array(allocator, command_pool, queue, batch.instance_buffer, instances, VK_PIPELINE_STAGE_VERTEX_INPUT_BIT,
+            VK_ACCESS_VERTEX_ATTRIBUTE_READ_BIT)
+
+    count_changed = len(instances) != batch.count
+    batch.count = len(instances)
+    return count_changed
+
+def create_staging_ring(allocator, batch, region_count):
+
+    # A region is only written again region_count frames after its copy was submitted, so region_count has to be at least one more than
+    # the number of frames in flight
+    batch.staging = buffers.create_buffer(allocator, batch.capacity * INSTANCE_DTYPE.itemsize * region_count, VK_BUFFER_USAGE_TRANSFER_SRC_BIT,
+        VK_MEMORY_PROPERTY_HOST_VISIBLE_BIT | VK_MEMORY_PROPERTY_HOST_COHERENT_BIT)
+    batch.region_count = region_count
+    batch.region = 0
+
+def stream_instance_batch(batch, instances):
+
+    # Same as update_instance_batch, but never waits for the GPU and allocates nothing: the instances are written into the batch's staging ring,
+    # and record_instance_copies copies them over as part of the next frame. Several updates before that frame all go to the same region
+    instances = numpy.ascontiguousarray(instances, dtype = INSTANCE_DTYPE)
+    if len(instances) > batch.capacity:
+        raise ValueError("Batch holds at most {} instances, got {}".format(batch.capacity, len(instances)))
+
+    buffers.write_array(batch.staging, instances, batch.region * batch.capacity * INSTANCE_DTYPE.itemsize)
+    batch.pending = (batch.region, len(instances))
+
+    count_changed = len(instances) != batch.count
+    batch.count = len(instances)
+    return count_changed
+
+def record_instance_copies(command_buffer, pending_batches):
+
+    # Records the copies of every pending update into command_buffer, which is submitted ahead of the frame's draws. One barrier before
+    # the copies waits for the frames still reading the instance buffers, one after makes the new data visible to the vertex input
+    copies = []
+    for batch in pending_batches:
+        if batch.pending is not None:
+            region, count = batch.pending
+            if count > 0:
+                copies.append((batch, region, count))
+            batch.pending = None
+            batch.region = (region + 1) % batch.region_count
+
+    begin_info = VkCommandBufferBeginInfo(flags = VK_COMMAND_BUFFER_USAGE_ONE_TIME_SUBMIT_BIT)
+    vkBeginCommandBuffer(command_buffer, begin_info)
+
+    if copies:
+        before_copy = [VkBufferMemoryBarrier(srcAccessMask = VK_ACCESS_VERTEX_ATTRIBUTE_READ_BIT, dstAccessMask = VK_ACCESS_TRANSFER_WRITE_BIT,
+            srcQueueFamilyIndex = VK_QUEUE_FAMILY_IGNORED, dstQueueFamilyIndex = VK_QUEUE_FAMILY_IGNORED, buffer = batch.instance_buffer.buffer, offset = 0,
+            size = VK_WHOLE_SIZE) for batch, region, count in copies]
+        vkCmdPipelineBarrier(command_buffer, VK_PIPELINE_STAGE_VERTEX_INPUT_BIT, VK_PIPELINE_STAGE_TRANSFER_BIT, 0, 0, None, len(before_copy), before_copy, 0, None)
+
+        for batch, region, count in copies:
+            size = count * INSTANCE_DTYPE.itemsize
+            vkCmdCopyBuffer(command_buffer, batch.staging.buffer, batch.instance_buffer.buffer, 1,
+                [VkBufferCopy(srcOffset = region * batch.capacity * INSTANCE_DTYPE.itemsize, dstOffset = 0, size = size)])
+
+        after_copy = [VkBufferMemoryBarrier(srcAccessMask = VK_ACCESS_TRANSFER_WRITE_BIT, dstAccessMask = VK_ACCESS_VERTEX_ATTRIBUTE_READ_BIT,
+            srcQueueFamilyIndex = VK_QUEUE_FAMILY_IGNORED, dstQueueFamilyIndex = VK_QUEUE_FAMILY_IGNORED, buffer = batch.instance_buffer.buffer, offset = 0,
+            size = VK_WHOLE_SIZE) for batch, region, count in copies]
+        vkCmdPipelineBarrier(command_buffer, VK_PIPELINE_STAGE_TRANSFER_BIT, VK_PIPELINE_STAGE_VERTEX_INPUT_BIT, 0, 0, None, len(after_copy), after_copy, 0, None)
+
+    vkEndCommandBuffer(command_buffer)
+
+def record_instance_batch_draw(command_buffer, batch):
+
+    if batch.count == 0:
+        return
+
+    # Binding 0 has the mesh vertices, binding 1 the instances
+    vkCmdBindVertexBuffers(command_buffer, 0, 2, [batch.mesh.vertex_buffer.buffer, batch.instance_buffer.buffer], [0, 0])
+    vkCmdBindIndexBuffer(command_buffer, batch.mesh.index_buffer.buffer, 0, batch.mesh.index_type)
+    vkCmdDrawIndexed(command_buffer, batch.mesh.index_count, batch.count, 0, 0, 0)
+
+def destroy_instance_batch(allocator, batch):
+
+    # The mesh may be shared with other batches, so it is left to its owner
+    buffers.destroy_buffer(allocator, batch.instance_buffer)
+    if batch.staging is not None:
+        buffers.destroy_buffer(allocator, batch.staging)
+        batch.staging = None
+
+def random_instances(count, seed = 0):
+
+    # Instances scattered across the screen, mostly useful for testing and benchmarks
+    generator = numpy.random.default_rng(seed)
+    instances = numpy.empty(count, dtype = INSTANCE_DTYPE)
+    instances["offset"] = generator.uniform(-1.0, 1.0, (count, 2))
+    instances["scale"] = generator.uniform(0.01, 0.05, count)
+    instances["color"] = generator.uniform(0.2, 1.0, (count, 3))
+    return instances
@@ -0,0 +1,191 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+# Taken before anything else is imported, so startup includes loading each backend's modules
+PROCESS_START = time.perf_counter()
+
+# Benchmarks are run from the repository root, same as main.py, since shader paths are relative to it
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+BACKENDS = ("vulkan", "opengl")
+DEFAULT_BASELINE = os.path.join("benchmarks", "baseline.json")
+
+# Lower is better for all of them. A result is a regression when it exceeds the baseline by more than the tolerance
+METRICS = ("startup_s", "frame_p50_ms", "frame_p90_ms", "frame_p99_ms", "cpu_per_frame_ms", "peak_rss_mb")
+
+# Workers print their results on a line starting with this, everything else they print is passed through
+RESULT_PREFIX = "BENCHMARK_RESULT "
+
+class VulkanBackend:
+
+    # Headless, so it runs on lavapipe without any display
+    def __init__(self):
+        from main import Program
+        self.program = Program(headless = True)
+
+    def render(self):
+        self.program.render()
+
+    def finish(self):
+        from vulkan import vkDeviceWaitIdle
+        vkDeviceWaitIdle(self.program.logical_device)
+
+    def close(self):
+        self.program.engine_close()
+
+class OpenGLBackend:
+
+    # Needs a display, which can be a virtual one (xvfb-run) with llvmpipe as the driver
+    def __init__(self):
+        from HelloTriangleOGL import Engine
+        self.engine = Engine(run = False, max_fps = 0, hidden = True)
+
+    def render(self):
+        self.engine.render()
+
+    def finish(self):
+        from OpenGL.GL import glFinish
+        glFinish()
+
+    def close(self):
+        self.engine.close()
+
+def run_worker(backend_name, frames, warmup):
+
+    # Runs in its own process, so startup is cold and peak RSS only covers one backend
+    import numpy
+
+    backend = VulkanBackend() if backend_name == "vulkan" else OpenGLBackend()
+    backend.render()
+    backend.finish()
+    startup = time.perf_counter() - PROCESS_START
+
+    for i in range(warmup):
+        backend.render()
+    backend.finish()
+
+    # Time between consecutive render calls. With frames in flight this is the steady state throughput, not the latency of a single frame
+    frame_times = numpy.empty(frames)
+    cpu_start = time.process_time()
+    previous = time.perf_counter()
+    for i in range(frames):
+        backend.render()
+        now = time.perf_counter()
+        frame_times[i] = now - previous
+        previous = now
+    backend.finish()
+    cpu = time.process_time() - cpu_start
+
+    backend.close()
+
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    p50, p90, p99 = numpy.percentile(frame_times * 1000.0, [50, 90, 99])
+
+    result = {"startup_s": startup, "frame_p50_ms": p50, "frame_p90_ms": p90, "frame_p99_ms": p99, "cpu_per_frame_ms": cpu / frames * 1000.0,
+        "peak_rss_mb": peak_rss, "frames": frames}
+    print(RESULT_PREFIX + json.dumps(result), flush = True)
+
+def run_backend(backend_name, frames, warmup):
+
+    command = [sys.executable, os.path.abspath(__file__), "--worker", backend_name, "--frames", str(frames), "--warmup", str(warmup)]
+    process = subprocess.run(command, stdout = subprocess.PIPE, universal_newlines = True)
+
+    result = None
+    for line in process.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            result = json.loads(line[len(RESULT_PREFIX):])
+
+    if process.returncode != 0 or result is None:
+        print("ERROR: {} benchmark failed (exit code {})".format(backend_name, process.returncode))
+        print(process.stdout)
+        return None
+
+    return result
+
+def compare(results, baseline, tolerance):
+
+    # Returns the regressions as (backend, metric, value, baseline value) tuples
+    regressions = []
+    for backend_name, result in results.items():
+        for metric in METRICS:
+            reference = baseline.get(backend_name, {}).get(metric)
+            if reference is not None and result[metric] > reference * (1.0 + tolerance):
+                regressions.append((backend_name, metric, result[metric], reference))
+    return regressions
+
+def print_results(results, baseline):
+
+    print("{:>8} {:>18} {:>12} {:>12} {:>9}".format("Backend", "Metric", "Value", "Baseline", "Change"))
+    for backend_name, result in results.items():
+        for metric in METRICS:
+            reference = baseline.get(backend_name, {}).get(metric)
+            if reference:
+                print("{:>8} {:>18} {:>12.3f} {:>12.3f} {:>+8.1f}%".format(backend_name, metric, result[metric], reference, (result[metric] / reference - 1.0) * 100.0))
+            else:
+                print("{:>8} {:>18} {:>12.3f} {:>12} {:>9}".format(backend_name, metric, result[metric], "-", "-"))
+
+#BENCHMARK ENTRY POINT. On machines without a GPU, software drivers work for both backends:
+# VK_ICD_FILENAMES=/usr/share/vulkan/icd.d/lvp_icd.x86_64.json LIBGL_ALWAYS_SOFTWARE=1 xvfb-run python benchmarks/bench_backends.py
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", nargs = "+", choices = BACKENDS, default = list(BACKENDS))
+    parser.add_argument("--frames", type = int, default = 1000)
+    parser.add_argument("--warmup", type = int, default = 100)
+    parser.add_argument("--output", default = "benchmark_results.json", help = "Where the results are written, as JSON")
+    parser.add_argument("--baseline", default = DEFAULT_BASELINE, help = "Results to compare against, skipped when the file doesn't exist")
+    parser.add_argument("--tolerance", type = float, default = 0.10, help = "Allowed slowdown over the baseline, as a fraction")
+    parser.add_argument("--update-baseline", action = "store_true", help = "Store these results as the new baseline")
+    parser.add_argument("--worker", choices = BACKENDS, help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.frames, args.warmup)
+        sys.exit(0)
+
+    results = {}
+    for backend_name in args.backends:
+        result = run_backend(backend_name, args.frames, args.warmup)
+        if result is not None:
+            results[backend_name] = result
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent = 2)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    print_results(results, baseline)
+
+    if args.update_baseline:
+
+        # A failed backend would lose its entry, and compare() skips backends without one, which would quietly turn off its gate
+        if len(results) != len(args.backends):
+            print("ERROR: Baseline NOT updated, every backend has to succeed")
+            sys.exit(1)
+
+        # Backends that weren't run this time keep their entries
+        baseline.update(results)
+        with open(args.baseline, "w") as file:
+            json.dump(baseline, file, indent = 2)
+        print("Baseline written to " + args.baseline)
+        sys.exit(0)
+
+    # Fails loudly, so it can gate changes in CI
+    regressions = compare(results, baseline, args.tolerance)
+    for backend_name, metric, value, reference in regressions:
+        print("REGRESSION: {} {} is {:.3f}, baseline {:.3f} (+{:.1f}%, tolerance {:.0f}%)".format(backend_name, metric, value, reference,
+            (value / reference - 1.0) * 100.0, args.tolerance * 100.0))
+
+    if regressions or len(results) != len(args.backends):
+        sys.exit(1)
@@ -0,0 +1,56 @@
+import argparse
+import os
+import sys
+import time
+
+# Benchmarks are run from the repository root, same as main.py, since shader paths are relative to it
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from vulkan import *
+
+import batches
+from main import Program
+
+def measure(program, batch, count, frames):
+
+    instances = batches.random_instances(count)
+
+    # Upload cost, which should only grow with the bytes copied, not with Python work
+    update_start = time.perf_counter()
+    program.update_instance_batch(batch, instances)
+    update_time = time.perf_counter() - update_start
+
+    # A few frames first, so the command buffers get re-recorded for the new count before timing
+    for i in range(program.max_frames_in_flight * 2):
+        program.render()
+    vkDeviceWaitIdle(program.logical_device)
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    for i in range(frames):
+        program.render()
+    vkDeviceWaitIdle(program.logical_device)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    return update_time, wall / frames, cpu / frames
+
+#BENCHMARK ENTRY POINT. Runs headless, so it also works on software drivers such as lavapipe
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--counts", type = int, nargs = "+", default = [1, 1000, 10000, 100000, 1000000])
+    parser.add_argument("--frames", type = int, default = 100)
+    args = parser.parse_args()
+
+    program = Program(headless = True)
+    batch = program.add_instance_batch(batches.random_instances(1), capacity = max(args.counts))
+
+    print("{:>10} {:>14} {:>16} {:>16}".format("Instances", "Upload (ms)", "Frame time (ms)", "CPU/frame (ms)"))
+    for count in args.counts:
+        update_time, frame_time, cpu_time = measure(program, batch, count, args.frames)
+        print("{:>10} {:>14.3f} {:>16.3f} {:>16.3f}".format(count, update_time * 1000.0, frame_time * 1000.0, cpu_time * 1000.0))
+
+    program.engine_close()
@@ -0,0 +1,60 @@
+import argparse
+import os
+import sys
+import time
+
+# Benchmarks are run from the repository root, same as main.py, since shader paths are relative to it
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from vulkan import *
+
+from main import Program
+
+def measure(program, repeats):
+
+    # Records the command buffer of the first image over and over. The GPU is idle, so it can be reset at any time
+    vkDeviceWaitIdle(program.logical_device)
+    command_buffer = program.swapchain_bundle.frames[0].commandbuffer
+
+    start = time.perf_counter()
+    for i in range(repeats):
+        vkResetCommandBuffer(command_buffer, 0)
+        program.record_draw_commands(command_buffer, 0)
+    elapsed = time.perf_counter() - start
+
+    # Back to a state the render loop can use
+    program.mark_commandbuffers_dirty()
+    return elapsed / repeats
+
+#BENCHMARK ENTRY POINT. Runs headless, so it also works on software drivers such as lavapipe
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--draws", type = int, nargs = "+", default = [100, 1000, 10000])
+    parser.add_argument("--workers", type = int, nargs = "+", default = [0, 1, 2, 4, 8])
+    parser.add_argument("--repeats", type = int, default = 10)
+    args = parser.parse_args()
+
+    program = Program(headless = True)
+    triangle = program.triangle_mesh
+
+    print("{:>8} {:>8} {:>16} {:>10}".format("Draws", "Workers", "Recording (ms)", "Speedup"))
+    for draw_count in args.draws:
+
+        # The same mesh drawn many times, each one its own draw call
+        program.set_meshes([triangle] * draw_count)
+
+        inline_time = None
+        for worker_count in args.workers:
+            program.set_recording_workers(worker_count)
+            record_time = measure(program, args.repeats)
+            if inline_time is None:
+                inline_time = record_time
+            print("{:>8} {:>8} {:>16.3f} {:>9.2f}x".format(draw_count, worker_count, record_time * 1000.0, inline_time / record_time))
+
+    # engine_close destroys every mesh in the list, so the triangle must only be in it once
+    program.set_meshes([triangle])
+    program.set_recording_workers(0)
+    program.engine_close()
@@ -0,0 +1,217 @@
+import numpy
+
+from vulkan import *
+
+# Vertex attribute formats for each (scalar type, component count) a NumPy field can have
+ATTRIBUTE_FORMATS = {
+    (numpy.dtype(numpy.float32), 1): VK_FORMAT_R32_SFLOAT,
+    (numpy.dtype(numpy.float32), 2): VK_FORMAT_R32G32_SFLOAT,
+    (numpy.dtype(numpy.float32), 3): VK_FORMAT_R32G32B32_SFLOAT,
+    (numpy.dtype(numpy.float32), 4): VK_FORMAT_R32G32B32A32_SFLOAT,
+    (numpy.dtype(numpy.int32), 1): VK_FORMAT_R32_SINT,
+    (numpy.dtype(numpy.int32), 2): VK_FORMAT_R32G32_SINT,
+    (numpy.dtype(numpy.int32), 3): VK_FORMAT_R32G32B32_SINT,
+    (numpy.dtype(numpy.int32), 4): VK_FORMAT_R32G32B32A32_SINT,
+    (numpy.dtype(numpy.uint32), 1): VK_FORMAT_R32_UINT,
+    (numpy.dtype(numpy.uint32), 2): VK_FORMAT_R32G32_UINT,
+    (numpy.dtype(numpy.uint32), 3): VK_FORMAT_R32G32B32_UINT,
+    (numpy.dtype(numpy.uint32), 4): VK_FORMAT_R32G32B32A32_UINT,
+    (numpy.dtype(numpy.uint8), 4): VK_FORMAT_R8G8B8A8_UNORM,
+}
+
+# Same layout the OpenGL version uses for its triangle, a 2D position followed by an RGB color
+VERTEX_DTYPE = numpy.dtype([("position", numpy.float32, 2), ("color", numpy.float32, 3)])
+
+class BufferBundle:
+
+    def __init__(self, buffer, allocation, size):
+
+        self.buffer = buffer
+        self.allocation = allocation # allocator.Allocation the buffer is bound to
+        self.size = size
+
+class VertexInputDescription:
+
+    # What the pipeline needs to know about the vertex buffers bound to it
+    def __init__(self, bindings, attributes):
+
+        self.bindings = bindings
+        self.attributes = attributes
+
+class Mesh:
+
+    def __init__(self):
+
+        self.vertex_buffer = None
+        self.index_buffer = None
+        self.vertex_count = 0
+        self.index_count = 0
+        self.index_type = VK_INDEX_TYPE_UINT32
+        self.draw_data = None # One element array with uniforms.PUSH_CONSTANT_DTYPE, pushed before drawing. None keeps the mesh where it is
+
+def create_buffer(allocator, size, usage, properties):
+
+    # Memory comes from the allocator's pooled blocks instead of a vkAllocateMemory of its own
+    buffer, allocation = allocator.create_buffer(size, usage, properties)
+    return BufferBundle(buffer, allocation, size)
+
+def destroy_buffer(allocator, bundle):
+
+    vkDestroyBuffer(allocator.device, bundle.buffer, None)
+    allocator.free(bundle.allocation)
+
+def write_array(bundle, array, offset = 0):
+
+    # Copies the array's bytes into host visible memory, which the allocator keeps mapped. Going through NumPy views means a single memcpy,
+    # no matter how big the array is
+    data = numpy.ascontiguousarray(array).view(numpy.uint8).reshape(-1)
+    numpy.frombuffer(bundle.allocation.mapped, dtype = numpy.uint8, count = data.nbytes, offset = offset)[:] = data
+
+def begin_single_time_commands(device, command_pool):
+
+    alloc_info = VkCommandBufferAllocateInfo(commandPool = command_pool, level = VK_COMMAND_BUFFER_LEVEL_PRIMARY, commandBufferCount = 1)
+    command_buffer = vkAllocateCommandBuffers(device, alloc_info)[0]
+
+    begin_info = VkCommandBufferBeginInfo(flags = VK_COMMAND_BUFFER_USAGE_ONE_TIME_SUBMIT_BIT)
+    vkBeginCommandBuffer(command_buffer, begin_info)
+
+    return command_buffer
+
+def end_single_time_commands(device, command_pool, queue, command_buffer):
+
+    vkEndCommandBuffer(command_buffer)
+
+    # A fence is enough to know when the copy is done, and unlike vkQueueWaitIdle it doesn't wait for rendering submitted to the same queue
+    fence = vkCreateFence(device, VkFenceCreateInfo(), None)
+    submit_info = VkSubmitInfo(commandBufferCount = 1, pCommandBuffers = [command_buffer,])
+    vkQueueSubmit(queue, 1, submit_info, fence)
+    vkWaitForFences(device, 1, [fence,], VK_TRUE, 0xFFFFFFFFFFFFFFFF)
+
+    vkDestroyFence(device, fence, None)
+    vkFreeCommandBuffers(device, command_pool, 1, [command_buffer,])
+
+def check_array(array):
+
+    # Vulkan doesn't allow buffers of size 0
+    if array.nbytes == 0:
+        raise ValueError("Can't upload an empty array")
+
+def check_vertices(vertices):
+
+    # Anything but VERTEX_DTYPE would be read with the wrong layout by the pipelines
+    if vertices.dtype != VERTEX_DTYPE:
+        raise ValueError("Vertices must have buffers.VERTEX_DTYPE, got {}".format(vertices.dtype))
+    check_array(vertices)
+
+def upload_array(allocator, command_pool, queue, array, usage):
+
+    # Device local memory is the fastest for the GPU to read, but usually not visible to the CPU. The array is written into a host visible
+    # staging buffer first, then copied over by the GPU
+    check_array(array)
+    device = allocator.device
+    size = array.nbytes
+    staging = create_buffer(allocator, size, VK_BUFFER_USAGE_TRANSFER_SRC_BIT, VK_MEMORY_PROPERTY_HOST_VISIBLE_BIT | VK_MEMORY_PROPERTY_HOST_COHERENT_BIT)
+    write_array(staging, array)
+
+    destination = create_buffer(allocator, size, usage | VK_BUFFER_USAGE_TRANSFER_DST_BIT, VK_MEMORY_PROPERTY_DEVICE_LOCAL_BIT)
+
+    command_buffer = begin_single_time_commands(device, command_pool)
+    vkCmdCopyBuffer(command_buffer, staging.buffer, destination.buffer, 1, [VkBufferCopy(srcOffset = 0, dstOffset = 0, size = size)])
+    end_single_time_commands(device, command_pool, queue, command_buffer)
+
+    destroy_buffer(allocator, staging)
+    return destination
+
+def update_array(allocator, command_pool, queue, destination, array, stage_mask, access_mask):
+
+    # Overwrites a device local buffer that frames already submitted may still be reading. The barriers make the copy wait for every earlier
+    # use of the buffer on this queue (stage_mask/access_mask describe how it is used), and make the new data visible to later ones
+    device = allocator.device
+    size = array.nbytes
+    staging = create_buffer(allocator, size, VK_BUFFER_USAGE_TRANSFER_SRC_BIT, VK_MEMORY_PROPERTY_HOST_VISIBLE_BIT | VK_MEMORY_PROPERTY_HOST_COHERENT_BIT)
+    write_array(staging, array)
+
+    command_buffer = begin_single_time_commands(device, command_pool)
+
+    before_copy = VkBufferMemoryBarrier(srcAccessMask = access_mask, dstAccessMask = VK_ACCESS_TRANSFER_WRITE_BIT, srcQueueFamilyIndex = VK_QUEUE_FAMILY_IGNORED,
+        dstQueueFamilyIndex = VK_QUEUE_FAMILY_IGNORED, buffer = destination.buffer, offset = 0, size = VK_WHOLE_SIZE)
+    vkCmdPipelineBarrier(command_buffer, stage_mask, VK_PIPELINE_STAGE_TRANSFER_BIT, 0, 0, None, 1, [before_copy,], 0, None)
+
+    vkCmdCopyBuffer(command_buffer, staging.buffer, destination.buffer, 1, [VkBufferCopy(srcOffset = 0, dstOffset = 0, size = size)])
+
+    after_copy = VkBufferMemoryBarrier(srcAccessMask = VK_ACCESS_TRANSFER_WRITE_BIT, dstAccessMask = access_mask, srcQueueFamilyIndex = VK_QUEUE_FAMILY_IGNORED,
+        dstQueueFamilyIndex = VK_QUEUE_FAMILY_IGNORED, buffer = destination.buffer, offset = 0, size = VK_WHOLE_SIZE)
+    vkCmdPipelineBarrier(command_buffer, VK_PIPELINE_STAGE_TRANSFER_BIT, stage_mask, 0, 0, None, 1, [after_copy,], 0, None)
+
+    end_single_time_commands(device, command_pool, queue, command_buffer)
+
+    destroy_buffer(allocator, staging)
+
+def merge_vertex_inputs(*descriptions):
+
+    # Combines the descriptions of several vertex buffers, for pipelines that read from more than one binding
+    bindings = []
+    attributes = []
+    for description in descriptions:
+        bindings.extend(description.bindings)
+        attributes.extend(description.attributes)
+
+    return VertexInputDescription(bindings, attributes)
+
+def vertex_input_from_dtype(dtype, binding = 0, input_rate = VK_VERTEX_INPUT_RATE_VERTEX, first_location = 0):
+
+    # Every field of a structured dtype becomes a vertex attribute, with shader locations assigned in field order
+    dtype = numpy.dtype(dtype)
+    attributes = []
+    for location, name in enumerate(dtype.names):
+        field_dtype, offset = dtype.fields[name][:2]
+        scalar = field_dtype.base
+        components = int(numpy.prod(field_dtype.shape)) if field_dtype.shape else 1
+
+        vk_format = ATTRIBUTE_FORMATS.get((scalar, components))
+        if vk_format is None:
+            raise ValueError("Unsupported vertex attribute '{}' of type {}".format(name, field_dtype))
+
+        attributes.append(VkVertexInputAttributeDescription(location = first_location + location, binding = binding, format = vk_format, offset = offset))
+
+    bindings = [VkVertexInputBindingDescription(binding = binding, stride = dtype.itemsize, inputRate = input_rate)]
+    return VertexInputDescription(bindings, attributes)
+
+def prepare_indices(vertex_count, indices):
+
+    # indices defaults to drawing the vertices in order. Returns the index array to upload along with its VkIndexType
+    if indices is None:
+        indices = numpy.arange(vertex_count, dtype = numpy.uint32)
+
+    # 16 bit indices take half the memory and bandwidth whenever they are enough
+    indices = numpy.ascontiguousarray(indices)
+    if indices.dtype == numpy.uint16:
+        return indices, VK_INDEX_TYPE_UINT16
+
+    return indices.astype(numpy.uint32, copy = False), VK_INDEX_TYPE_UINT32
+
+def create_mesh(allocator, command_pool, queue, vertices, indices = None):
+
+    # vertices is a structured array (see VERTEX_DTYPE), indices defaults to drawing the vertices in order. Both are checked before anything is uploaded
+    check_vertices(vertices)
+    my_mesh = Mesh()
+    indices, my_mesh.index_type = prepare_indices(len(vertices), indices)
+    check_array(indices)
+
+    my_mesh.vertex_count = len(vertices)
+    my_mesh.vertex_buffer = upload_array(allocator, command_pool, queue, vertices, VK_BUFFER_USAGE_VERTEX_BUFFER_BIT)
+    my_mesh.index_count = len(indices)
+    my_mesh.index_buffer = upload_array(allocator, command_pool, queue, indices, VK_BUFFER_USAGE_INDEX_BUFFER_BIT)
+
+    return my_mesh
+
+def record_mesh_draw(command_buffer, mesh, instance_count = 1):
+
+    vkCmdBindVertexBuffers(command_buffer, 0, 1, [mesh.vertex_buffer.buffer,], [0,])
+    vkCmdBindIndexBuffer(command_buffer, mesh.index_buffer.buffer, 0, mesh.index_type)
+    vkCmdDrawIndexed(command_buffer, mesh.index_count, instance_count, 0, 0, 0)
+
+def destroy_mesh(allocator, mesh):
+
+    destroy_buffer(allocator, mesh.vertex_buffer)
+    destroy_buffer(allocator, mesh.index_buffer)
@@ -0,0 +1,290 @@
+import collections
+import queue
+import threading
+
+import numpy
+
+from vulkan import *
+
+import transfers
+
+# Readback buffers in the ring. One being copied into, one being read by the consumer and one spare is enough to never stall rendering
+DEFAULT_RING_SIZE = 3
+
+# 8 bit formats that store blue first. Every other format is taken to be RGBA
+BGRA_FORMATS = (VK_FORMAT_B8G8R8A8_UNORM, VK_FORMAT_B8G8R8A8_SRGB)
+
+class CaptureSlot:
+
+    # One readback buffer of the ring, with the command buffer that copies into it. The copy is part of the frame's submission, so the frame's
+    # fence says when it is done
+    def __init__(self, index):
+
+        self.index = index
+        self.buffer = None
+        self.allocation = None
+        self.pixels = None # NumPy view of the mapped readback memory, shaped (height, width, 4)
+        self.extent = None # (width, height) the buffer was made for
+        self.command_buffer = None
+        self.fence = None # Fence of the submission the copy went out with, owned by whoever submitted it
+        self.frame_number = 0 # Frame held by the slot, or being copied into it
+        self.channel_order = "rgba"
+        self.references = 0 # Consumers still reading the pixels, the slot is only reused once nobody does
+
+class CapturedFrame:
+
+    def __init__(self, capture, slot):
+
+        self.capture = capture
+        self.slot = slot
+        self.frame_number = slot.frame_number
+        self.pixels = slot.pixels # Zero copy, see FrameCapture.frames for how long it stays valid
+        self.channel_order = slot.channel_order # "rgba" or "bgra", as stored in the image
+
+    def retain(self):
+        # Keeps the pixels valid past the next step of FrameCapture.frames, until release() is called
+        self.capture.retain(self.slot)
+
+    def release(self):
+        self.capture.release(self.slot)
+
+class FrameCapture:
+
+    # Streams rendered frames back to the CPU without stalling. Each captured frame gets a slot of the ring: its copy is submitted along with
+    # the frame, under the frame's fence, and poll() hands it over once that frame is done, which is usually while the next frame renders.
+    # When every slot is still busy the frame is dropped and counted, rendering never waits for capture
+    def __init__(self, device, allocator, queue_family_index, ring_size = DEFAULT_RING_SIZE):
+
+        self.device = device
+        self.allocator = allocator
+        self.lock = threading.Lock() # Guards free_slots and the reference counts, consumers may release from other threads
+
+        # Slots re-record their copy every time, since the image and its size change along with the swapchain
+        pool_info = VkCommandPoolCreateInfo(flags = VK_COMMAND_POOL_CREATE_RESET_COMMAND_BUFFER_BIT, queueFamilyIndex = queue_family_index)
+        self.command_pool = vkCreateCommandPool(device, pool_info, None)
+        alloc_info = VkCommandBufferAllocateInfo(commandPool = self.command_pool, level = VK_COMMAND_BUFFER_LEVEL_PRIMARY, commandBufferCount = ring_size)
+        command_buffers = vkAllocateCommandBuffers(device, alloc_info)
+
+        self.slots = []
+        for i in range(ring_size):
+            slot = CaptureSlot(i)
+            slot.command_buffer = command_buffers[i]
+            self.slots.append(slot)
+
+        self.free_slots = collections.deque(self.slots)
+        self.pending = collections.deque() # Copies submitted, in submission order
+        self.ready = collections.deque() # Copies done, waiting to be handed out by frames()
+
+        self.captured = 0
+        self.dropped = 0
+
+    def allocate(self, slot, width, height):
+
+        # The slot is free, so neither the GPU nor a consumer uses the old buffer anymore
+        self.free_buffer(slot)
+
+        # Cached memory is preferred since the CPU reads every byte of it
+        size = width * height * 4
+        host_visible = VK_MEMORY_PROPERTY_HOST_VISIBLE_BIT | VK_MEMORY_PROPERTY_HOST_COHERENT_BIT
+        slot.buffer, slot.allocation = self.allocator.create_buffer(size, VK_BUFFER_USAGE_TRANSFER_DST_BIT, host_visible | VK_MEMORY_PROPERTY_HOST_CACHED_BIT,
+            host_visible)
+        slot.pixels = numpy.frombuffer(slot.allocation.mapped, dtype = numpy.uint8, count = size).reshape(height, width, 4)
+        slot.extent = (width, height)
+
+    def free_buffer(self, slot):
+
+        if slot.buffer is not None:
+            slot.pixels = None
+            vkDestroyBuffer(self.device, slot.buffer, None)
+            self.allocator.free(slot.allocation)
+            slot.buffer = None
+
+    def acquire(self, frame_number, extent):
+
+        # Returns the slot to copy frame_number into, or None when the frame has to be dropped
+        with self.lock:
+            if not self.free_slots:
+                self.dropped += 1
+                return None
+            slot = self.free_slots.popleft()
+
+        if slot.extent != (extent.width, extent.height):
+            self.allocate(slot, extent.width, extent.height)
+        slot.frame_number = frame_number
+        return slot
+
+    def record_copy(self, slot, image, layout, extent):
+
+        begin_info = VkCommandBufferBeginInfo(flags = VK_COMMAND_BUFFER_USAGE_ONE_TIME_SUBMIT_BIT)
+        vkBeginCommandBuffer(slot.command_buffer, begin_info)
+
+        # Waits for the render pass to finish writing the image. The color attachment output stage chains with the render pass's outgoing dependency,
+        # so the final layout transition is done as well. Frames left in VK_IMAGE_LAYOUT_TRANSFER_SRC_OPTIMAL keep their layout
+        subresource_range = VkImageSubresourceRange(aspectMask = VK_IMAGE_ASPECT_COLOR_BIT, baseMipLevel = 0, levelCount = 1, baseArrayLayer = 0, layerCount = 1)
+        to_transfer = VkImageMemoryBarrier(srcAccessMask = VK_ACCESS_COLOR_ATTACHMENT_WRITE_BIT, dstAccessMask = VK_ACCESS_TRANSFER_READ_BIT, oldLayout = layout,
+            newLayout = VK_IMAGE_LAYOUT_TRANSFER_SRC_OPTIMAL, srcQueueFamilyIndex = VK_QUEUE_FAMILY_IGNORED, dstQueueFamilyIndex = VK_QUEUE_FAMILY_IGNORED,
+            image = image, subresourceRange = subresource_range)
+        vkCmdPipelineBarrier(slot.command_buffer, VK_PIPELINE_STAGE_COLOR_ATTACHMENT_OUTPUT_BIT, VK_PIPELINE_STAGE_TRANSFER_BIT, 0, 0, None, 0, None, 1, [to_transfer,])
+
+        region = VkBufferImageCopy(bufferOffset = 0, bufferRowLength = 0, bufferImageHeight = 0,
+            imageSubresource = VkImageSubresourceLayers(aspectMask = VK_IMAGE_ASPECT_COLOR_BIT, mipLevel = 0, baseArrayLayer = 0, layerCount = 1),
+            imageOffset = VkOffset3D(0, 0, 0), imageExtent = VkExtent3D(extent.width, extent.height, 1))
+        vkCmdCopyImageToBuffer(slot.command_buffer, image, VK_IMAGE_LAYOUT_TRANSFER_SRC_OPTIMAL, slot.buffer, 1, [region,])
+
+        # Makes the copy visible to the host once the fence is signaled
+        to_host = VkBufferMemoryBarrier(srcAccessMask = VK_ACCESS_TRANSFER_WRITE_BIT, dstAccessMask = VK_ACCESS_HOST_READ_BIT, srcQueueFamilyIndex = VK_QUEUE_FAMILY_IGNORED,
+            dstQueueFamilyIndex = VK_QUEUE_FAMILY_IGNORED, buffer = slot.buffer, offset = 0, size = VK_WHOLE_SIZE)
+        vkCmdPipelineBarrier(slot.command_buffer, VK_PIPELINE_STAGE_TRANSFER_BIT, VK_PIPELINE_STAGE_HOST_BIT, 0, 0, None, 1, [to_host,], 0, None)
+
+        # Back to the layout the image is presented or read in, and the next frame rendering into the image waits for the copy to be done reading it
+        to_render = VkImageMemoryBarrier(srcAccessMask = 0, dstAccessMask = VK_ACCESS_COLOR_ATTACHMENT_WRITE_BIT, oldLayout = VK_IMAGE_LAYOUT_TRANSFER_SRC_OPTIMAL,
+            newLayout = layout, srcQueueFamilyIndex = VK_QUEUE_FAMILY_IGNORED, dstQueueFamilyIndex = VK_QUEUE_FAMILY_IGNORED, image = image,
+            subresourceRange = subresource_range)
+        vkCmdPipelineBarrier(slot.command_buffer, VK_PIPELINE_STAGE_TRANSFER_BIT, VK_PIPELINE_STAGE_COLOR_ATTACHMENT_OUTPUT_BIT, 0, 0, None, 0, None, 1, [to_render,])
+
+        vkEndCommandBuffer(slot.command_buffer)
+
+    def record(self, slot, image, image_format, layout, extent):
+
+        # Returns the command buffer copying image into the slot. It goes into the frame's own submission, right after the frame's command
+        # buffer, so the frame's fence and semaphores cover the copy as well
+        slot.channel_order = "bgra" if image_format in BGRA_FORMATS else "rgba"
+        self.record_copy(slot, image, layout, extent)
+        return slot.command_buffer
+
+    def submitted(self, slot, fence):
+        slot.fence = fence
+        self.pending.append(slot)
+
+    def done(self, slot, completed_frame):
+
+        # Frame fences are reused, but one that is signaled still means the slot's frame is done: it is only reset once that frame was waited for
+        return (completed_frame is not None and slot.frame_number <= completed_frame) or transfers.fence_signaled(self.device, slot.fence)
+
+    def poll(self, completed_frame = None):
+
+        # Called once per frame, never blocks. completed_frame is the last frame known to be finished. Copies finish in submission order, so only
+        # the oldest one needs checking each time
+        while self.pending and self.done(self.pending[0], completed_frame):
+            self.ready.append(self.pending.popleft())
+            self.captured += 1
+
+    def frames(self, wait = False):
+
+        # Yields every finished frame in order, as CapturedFrames viewing the readback memory directly. A frame's pixels are valid until the
+        # generator moves on to the next one, or until release() when retain() was called on it. With wait, frames still being copied are
+        # waited for, to drain the ring at the end of a capture
+        while True:
+            self.poll()
+            if not self.ready:
+                if not wait or not self.pending:
+                    return
+                vkWaitForFences(self.device, 1, [self.pending[0].fence,], VK_TRUE, 0xFFFFFFFFFFFFFFFF)
+                continue
+
+            slot = self.ready.popleft()
+            self.retain(slot)
+            try:
+                yield CapturedFrame(self, slot)
+            finally:
+                self.release(slot)
+
+    def retain(self, slot):
+        with self.lock:
+            slot.references += 1
+
+    def release(self, slot):
+        with self.lock:
+            slot.references -= 1
+            if slot.references == 0:
+                self.free_slots.append(slot)
+
+    def destroy(self):
+
+        # Frames nobody consumed are discarded. Writers have to be closed first, since they read straight from the buffers. The fences belong
+        # to the frames, so they have to outlive this
+        fences = [slot.fence for slot in self.pending]
+        if fences:
+            vkWaitForFences(self.device, len(fences), fences, VK_TRUE, 0xFFFFFFFFFFFFFFFF)
+
+        for slot in self.slots:
+            self.free_buffer(slot)
+        vkDestroyCommandPool(self.device, self.command_pool, None)
+
+def rgb_to_yuv444(pixels, channel_order = "rgba"):
+
+    # BT.601 limited range, what Y4M players assume when the header doesn't say otherwise. Returns the Y, U and V planes one after the other
+    if channel_order == "bgra":
+        red, green, blue = pixels[..., 2], pixels[..., 1], pixels[..., 0]
+    else:
+        red, green, blue = pixels[..., 0], pixels[..., 1], pixels[..., 2]
+    red, green, blue = red.astype(numpy.float32), green.astype(numpy.float32), blue.astype(numpy.float32)
+
+    planes = numpy.empty((3,) + pixels.shape[:2], dtype = numpy.float32)
+    planes[0] = 16.0 + (65.738 * red + 129.057 * green + 25.064 * blue) / 256.0
+    planes[1] = 128.0 + (-37.945 * red - 74.494 * green + 112.439 * blue) / 256.0
+    planes[2] = 128.0 + (112.439 * red - 94.154 * green - 18.285 * blue) / 256.0
+    return numpy.clip(numpy.rint(planes), 0, 255).astype(numpy.uint8)
+
+class CaptureWriter:
+
+    # Writes captured frames to a file on a background thread, either raw (the pixels as they are in memory, frames back to back) or as Y4M
+    # (YUV 4:4:4), which ffmpeg and most players open directly. Frames are written straight from the readback memory, and their slot is only
+    # freed once written, so a slow disk shows up as dropped frames instead of a slower render loop
+    def __init__(self, path, video_format = None, fps = 60):
+
+        self.path = path
+        self.video_format = video_format or ("y4m" if path.endswith(".y4m") else "raw")
+        self.fps = fps
+        self.size = None # (width, height) of the first frame, every frame of a Y4M stream has to match it
+        self.frames_written = 0
+        self.error = None
+
+        self.file = open(path, "wb")
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target = self.work, name = "capture writer", daemon = True)
+        self.thread.start()
+
+    def write(self, frame):
+        frame.retain()
+        self.queue.put(frame)
+
+    def work(self):
+
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                return
+
+            try:
+                if self.error is None:
+                    self.write_frame(frame)
+            except Exception as error:
+                self.error = error
+                print("ERROR: Capture writer failed, no more frames are written to {}: {}".format(self.path, error))
+            finally:
+                frame.release()
+
+    def write_frame(self, frame):
+
+        height, width = frame.pixels.shape[:2]
+        if self.size is None:
+            self.size = (width, height)
+            if self.video_format == "y4m":
+                self.file.write("YUV4MPEG2 W{} H{} F{}:1 Ip A1:1 C444\n".format(width, height, self.fps).encode())
+        elif self.video_format == "y4m" and self.size != (width, height):
+            raise ValueError("frame {} is {}x{}, the stream is {}x{}".format(frame.frame_number, width, height, *self.size))
+
+        if self.video_format == "y4m":
+            self.file.write(b"FRAME\n")
+            self.file.write(rgb_to_yuv444(frame.pixels, frame.channel_order).data)
+        else:
+            self.file.write(frame.pixels.data)
+        self.frames_written += 1
+
+    def close(self):
+
+        # Writes every frame queued so far before returning
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
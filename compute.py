@@ -0,0 +1,254 @@
+import os
+
+import numpy
+
+from vulkan import *
+
+import buffers
+import descriptors
+import pipeline
+import shader_library
+
+class ComputeBuffer:
+
+    # Storage buffer that stays on the GPU between dispatches, for data a simulation keeps updating every frame. Pass it to dispatch() in
+    # place of a NumPy array to skip the upload and readback
+    def __init__(self, bundle, dtype, shape):
+
+        self.bundle = bundle # buffers.BufferBundle, device local
+        self.dtype = dtype
+        self.shape = shape
+
+class Dispatch:
+
+    def __init__(self, shader, arrays, groups, push_constants):
+
+        self.shader = shader # Path of the GLSL source (.comp) or of compiled SPIR-V
+        self.arrays = arrays # NumPy arrays or ComputeBuffers, bound to bindings 0, 1, ... in order
+        self.groups = groups # (x, y, z) workgroup counts
+        self.push_constants = push_constants # NumPy array or None
+
+class ComputeBatch:
+
+    # Dispatches recorded into one command buffer and submitted together, so a whole frame's worth of simulation costs a single submit
+    # and a single wait. Dispatches run in order, with a barrier between them, so later ones can read what earlier ones wrote to a ComputeBuffer
+    def __init__(self, context):
+
+        self.context = context
+        self.dispatches = []
+
+    def add(self, shader, arrays, groups, push_constants = None):
+
+        # Returns the index of this dispatch's results in the list run() returns
+        if isinstance(groups, int):
+            groups = (groups, 1, 1)
+        groups = tuple(groups) + (1,) * (3 - len(groups))
+        self.dispatches.append(Dispatch(shader, list(arrays), groups, push_constants))
+        return len(self.dispatches) - 1
+
+    def run(self):
+        return self.context.run(self.dispatches)
+
+class ComputeContext:
+
+    # Runs compute shaders over NumPy arrays. Every array gets a device local storage buffer and a host visible staging buffer. Uploads, the
+    # dispatches and the readbacks all go into one command buffer, so a batch is a single submit. Works headless, including on lavapipe
+    def __init__(self, device, allocator, queue_family_index, queue, pipeline_cache = VK_NULL_HANDLE, shader_cache = None, layout_cache = None):
+
+        self.device = device
+        self.allocator = allocator
+        self.queue = queue
+        self.pipeline_cache = pipeline_cache
+        self.shader_cache = shader_cache
+        self.pipelines = {} # (shader, binding count, push constant size) -> pipeline.ComputeBundle
+
+        # Set layouts are shared with the rest of the program when given its layout cache. Sets only live for one batch, so their pools are reset
+        # after each one instead of being created and destroyed
+        self.owns_layout_cache = layout_cache is None
+        self.layout_cache = layout_cache if layout_cache is not None else descriptors.DescriptorLayoutCache(device)
+        self.descriptor_allocator = descriptors.DescriptorAllocator(device)
+
+        pool_info = VkCommandPoolCreateInfo(flags = VK_COMMAND_POOL_CREATE_TRANSIENT_BIT, queueFamilyIndex = queue_family_index)
+        self.command_pool = vkCreateCommandPool(device, pool_info, None)
+
+    def get_pipeline(self, shader, binding_count, push_constant_size):
+
+        # Pipelines are made the first time a shader is dispatched with a given layout, and reused after that
+        key = (shader, binding_count, push_constant_size)
+        bundle = self.pipelines.get(key)
+        if bundle is None:
+            # GLSL sources are compiled through the shader library's cache, or taken from the SPIR-V shipped next to them (shader + ".spv") when
+            # there is no compiler. Anything else is taken to be SPIR-V already
+            if os.path.splitext(shader)[1] in shader_library.SHADER_STAGES:
+                prebuilt = shader + ".spv"
+                spirv = shader_library.get_spirv_path(shader, prebuilt if os.path.exists(prebuilt) else None)
+            else:
+                spirv = shader
+            bundle = pipeline.create_compute_pipeline(self.device, spirv, binding_count, push_constant_size, self.pipeline_cache, self.shader_cache,
+                self.layout_cache)
+            self.pipelines[key] = bundle
+        return bundle
+
+    def create_buffer(self, array):
+
+        # Uploads array into a ComputeBuffer that stays on the GPU
+        array = numpy.ascontiguousarray(array)
+        bundle = buffers.upload_array(self.allocator, self.command_pool, self.queue, array, VK_BUFFER_USAGE_STORAGE_BUFFER_BIT | VK_BUFFER_USAGE_TRANSFER_SRC_BIT)
+        return ComputeBuffer(bundle, array.dtype, array.shape)
+
+    def read_buffer(self, compute_buffer):
+
+        # Copies a ComputeBuffer back into a new NumPy array. Waits for the GPU
+        staging = self.create_staging(compute_buffer.bundle.size)
+        command_buffer = buffers.begin_single_time_commands(self.device, self.command_pool)
+        self.record_download(command_buffer, compute_buffer.bundle, staging)
+        buffers.end_single_time_commands(self.device, self.command_pool, self.queue, command_buffer)
+
+        result = numpy.frombuffer(staging.allocation.mapped, dtype = compute_buffer.dtype, count = int(numpy.prod(compute_buffer.shape))).reshape(compute_buffer.shape).copy()
+        buffers.destroy_buffer(self.allocator, staging)
+        return result
+
+    def destroy_buffer(self, compute_buffer):
+        buffers.destroy_buffer(self.allocator, compute_buffer.bundle)
+
+    def create_staging(self, size):
+
+        # The CPU reads results back from it, so cached memory is preferred
+        host_visible = VK_MEMORY_PROPERTY_HOST_VISIBLE_BIT | VK_MEMORY_PROPERTY_HOST_COHERENT_BIT
+        buffer, allocation = self.allocator.create_buffer(size, VK_BUFFER_USAGE_TRANSFER_SRC_BIT | VK_BUFFER_USAGE_TRANSFER_DST_BIT,
+            host_visible | VK_MEMORY_PROPERTY_HOST_CACHED_BIT, host_visible)
+        return buffers.BufferBundle(buffer, allocation, size)
+
+    def record_download(self, command_buffer, source, staging):
+
+        # Shader writes -> copy into the staging buffer -> visible to the host once the fence is signaled
+        before_copy = VkMemoryBarrier(srcAccessMask = VK_ACCESS_SHADER_WRITE_BIT | VK_ACCESS_TRANSFER_WRITE_BIT, dstAccessMask = VK_ACCESS_TRANSFER_READ_BIT)
+        vkCmdPipelineBarrier(command_buffer, VK_PIPELINE_STAGE_COMPUTE_SHADER_BIT | VK_PIPELINE_STAGE_TRANSFER_BIT, VK_PIPELINE_STAGE_TRANSFER_BIT, 0, 1, [before_copy,],
+            0, None, 0, None)
+        vkCmdCopyBuffer(command_buffer, source.buffer, staging.buffer, 1, [VkBufferCopy(srcOffset = 0, dstOffset = 0, size = source.size)])
+        after_copy = VkMemoryBarrier(srcAccessMask = VK_ACCESS_TRANSFER_WRITE_BIT, dstAccessMask = VK_ACCESS_HOST_READ_BIT)
+        vkCmdPipelineBarrier(command_buffer, VK_PIPELINE_STAGE_TRANSFER_BIT, VK_PIPELINE_STAGE_HOST_BIT, 0, 1, [after_copy,], 0, None, 0, None)
+
+    def dispatch(self, shader, arrays, groups, push_constants = None):
+
+        # Single dispatch. Returns one entry per array: the array's contents after the shader ran, or the ComputeBuffer that was passed in
+        batch = self.batch()
+        batch.add(shader, arrays, groups, push_constants)
+        return batch.run()[0]
+
+    def batch(self):
+        return ComputeBatch(self)
+
+    def run(self, dispatches):
+
+        if not dispatches:
+            return []
+
+        # Every array is checked before anything is allocated, so a bad one doesn't leave buffers behind
+        arrays = [] # (dispatch index, array index, array)
+        for dispatch_index, dispatch in enumerate(dispatches):
+            for array_index, array in enumerate(dispatch.arrays):
+                if isinstance(array, ComputeBuffer):
+                    continue
+
+                array = numpy.ascontiguousarray(array)
+                if array.nbytes == 0:
+                    raise ValueError("Can't dispatch with an empty array (binding {})".format(array_index))
+                arrays.append((dispatch_index, array_index, array))
+
+        # Pipelines are resolved first, so a shader that fails to load or compile raises before anything is allocated
+        bundles = []
+        for dispatch in dispatches:
+            push_constant_size = dispatch.push_constants.nbytes if dispatch.push_constants is not None else 0
+            bundles.append(self.get_pipeline(dispatch.shader, len(dispatch.arrays), push_constant_size))
+
+        # Everything below is released even when recording or submitting fails
+        allocated = [] # Every buffer created for this batch
+        temporaries = [] # (dispatch index, array index, device buffer, staging buffer, array)
+        command_buffer = None
+        try:
+            # Temporary device local and staging buffers for every NumPy array
+            for dispatch_index, array_index, array in arrays:
+                device_buffer = buffers.create_buffer(self.allocator, array.nbytes, VK_BUFFER_USAGE_STORAGE_BUFFER_BIT | VK_BUFFER_USAGE_TRANSFER_SRC_BIT |
+                    VK_BUFFER_USAGE_TRANSFER_DST_BIT, VK_MEMORY_PROPERTY_DEVICE_LOCAL_BIT)
+                allocated.append(device_buffer)
+                staging = self.create_staging(array.nbytes)
+                allocated.append(staging)
+                buffers.write_array(staging, array)
+                temporaries.append((dispatch_index, array_index, device_buffer, staging, array))
+
+            device_buffers = {(dispatch_index, array_index): device_buffer for dispatch_index, array_index, device_buffer, staging, array in temporaries}
+            command_buffer = buffers.begin_single_time_commands(self.device, self.command_pool)
+
+            # Uploads, all before the first dispatch
+            for dispatch_index, array_index, device_buffer, staging, array in temporaries:
+                vkCmdCopyBuffer(command_buffer, staging.buffer, device_buffer.buffer, 1, [VkBufferCopy(srcOffset = 0, dstOffset = 0, size = array.nbytes)])
+            uploaded = VkMemoryBarrier(srcAccessMask = VK_ACCESS_TRANSFER_WRITE_BIT, dstAccessMask = VK_ACCESS_SHADER_READ_BIT | VK_ACCESS_SHADER_WRITE_BIT)
+            vkCmdPipelineBarrier(command_buffer, VK_PIPELINE_STAGE_TRANSFER_BIT, VK_PIPELINE_STAGE_COMPUTE_SHADER_BIT, 0, 1, [uploaded,], 0, None, 0, None)
+
+            for dispatch_index, dispatch in enumerate(dispatches):
+
+                push_constant_size = dispatch.push_constants.nbytes if dispatch.push_constants is not None else 0
+                bundle = bundles[dispatch_index]
+
+                # One descriptor set per dispatch
+                descriptor_set = self.descriptor_allocator.allocate(bundle.set_layout)
+
+                writes = []
+                for array_index, array in enumerate(dispatch.arrays):
+                    target = array.bundle if isinstance(array, ComputeBuffer) else device_buffers[(dispatch_index, array_index)]
+                    buffer_info = VkDescriptorBufferInfo(buffer = target.buffer, offset = 0, range = VK_WHOLE_SIZE)
+                    writes.append(VkWriteDescriptorSet(dstSet = descriptor_set, dstBinding = array_index, dstArrayElement = 0, descriptorCount = 1,
+                        descriptorType = VK_DESCRIPTOR_TYPE_STORAGE_BUFFER, pBufferInfo = [buffer_info,]))
+                if writes:
+                    vkUpdateDescriptorSets(self.device, len(writes), writes, 0, None)
+
+                # Every dispatch waits for the writes of the one before it
+                if dispatch_index > 0:
+                    previous = VkMemoryBarrier(srcAccessMask = VK_ACCESS_SHADER_WRITE_BIT, dstAccessMask = VK_ACCESS_SHADER_READ_BIT | VK_ACCESS_SHADER_WRITE_BIT)
+                    vkCmdPipelineBarrier(command_buffer, VK_PIPELINE_STAGE_COMPUTE_SHADER_BIT, VK_PIPELINE_STAGE_COMPUTE_SHADER_BIT, 0, 1, [previous,], 0, None, 0, None)
+
+                vkCmdBindPipeline(command_buffer, VK_PIPELINE_BIND_POINT_COMPUTE, bundle.pipeline)
+                vkCmdBindDescriptorSets(command_buffer, VK_PIPELINE_BIND_POINT_COMPUTE, bundle.pipeline_layout, 0, 1, [descriptor_set,], 0, None)
+                if push_constant_size:
+                    push_constants = numpy.ascontiguousarray(dispatch.push_constants)
+                    vkCmdPushConstants(command_buffer, bundle.pipeline_layout, VK_SHADER_STAGE_COMPUTE_BIT, 0, push_constant_size, ffi.from_buffer(push_constants))
+                vkCmdDispatch(command_buffer, *dispatch.groups)
+
+            # Readbacks, after the last dispatch. record_download's barrier covers every dispatch, so only the first copy needs it
+            for i, (dispatch_index, array_index, device_buffer, staging, array) in enumerate(temporaries):
+                if i == 0:
+                    self.record_download(command_buffer, device_buffer, staging)
+                else:
+                    vkCmdCopyBuffer(command_buffer, device_buffer.buffer, staging.buffer, 1, [VkBufferCopy(srcOffset = 0, dstOffset = 0, size = array.nbytes)])
+            if len(temporaries) > 1:
+                readback = VkMemoryBarrier(srcAccessMask = VK_ACCESS_TRANSFER_WRITE_BIT, dstAccessMask = VK_ACCESS_HOST_READ_BIT)
+                vkCmdPipelineBarrier(command_buffer, VK_PIPELINE_STAGE_TRANSFER_BIT, VK_PIPELINE_STAGE_HOST_BIT, 0, 1, [readback,], 0, None, 0, None)
+
+            # Single submit for the whole batch. The command buffer is freed once it completed
+            buffers.end_single_time_commands(self.device, self.command_pool, self.queue, command_buffer)
+            command_buffer = None
+
+            results = [list(dispatch.arrays) for dispatch in dispatches]
+            for dispatch_index, array_index, device_buffer, staging, array in temporaries:
+                results[dispatch_index][array_index] = numpy.frombuffer(staging.allocation.mapped, dtype = array.dtype, count = array.size).reshape(array.shape).copy()
+        finally:
+            if command_buffer is not None:
+                vkFreeCommandBuffers(self.device, self.command_pool, 1, [command_buffer,])
+            for temporary in allocated:
+                buffers.destroy_buffer(self.allocator, temporary)
+
+            # The batch is done, so are its descriptor sets
+            self.descriptor_allocator.reset()
+
+        return results
+
+    def destroy(self):
+
+        for bundle in self.pipelines.values():
+            pipeline.destroy_compute_pipeline(self.device, bundle)
+        self.pipelines = {}
+        self.descriptor_allocator.destroy()
+        if self.owns_layout_cache:
+            self.layout_cache.destroy()
+        vkDestroyCommandPool(self.device, self.command_pool, None)
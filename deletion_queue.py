@@ -0,0 +1,40 @@
+import collections
+
+class DeletionQueue:
+
+    # Resources released while frames in flight may still use them. Each entry is tagged with the number of the last frame that could use it,
+    # and destroyed once that frame is known to be finished, so replacing a resource never waits for the GPU. Frame numbers only grow,
+    # so the queue stays in order and flush() stops at the first entry that is still in use
+    def __init__(self):
+
+        self.entries = collections.deque() # (frame_number, destroy function, name) tuples
+        self.destroyed = 0
+
+    def push(self, frame_number, destroy, name = None):
+
+        # destroy is called without arguments. name is only for the report
+        if self.entries and frame_number < self.entries[-1][0]:
+            frame_number = self.entries[-1][0]
+        self.entries.append((frame_number, destroy, name))
+
+    def flush(self, completed_frame):
+
+        # Called every frame, once the fence of the frame slot was waited on
+        while self.entries and self.entries[0][0] <= completed_frame:
+            frame_number, destroy, name = self.entries.popleft()
+            destroy()
+            self.destroyed += 1
+
+    def drain(self):
+
+        # At shutdown, after vkDeviceWaitIdle. Everything still queued goes, oldest first
+        while self.entries:
+            frame_number, destroy, name = self.entries.popleft()
+            destroy()
+            self.destroyed += 1
+
+    def pending(self):
+        return [name for frame_number, destroy, name in self.entries]
+
+    def __len__(self):
+        return len(self.entries)
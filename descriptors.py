@@ -0,0 +1,221 @@
+import threading
+
+from vulkan import *
+
+# Descriptors of each type a pool gets, per set it can hold. Sets rarely use every type, so this is a mix rather than a sum
+DEFAULT_POOL_RATIOS = {
+    VK_DESCRIPTOR_TYPE_UNIFORM_BUFFER: 1.0,
+    VK_DESCRIPTOR_TYPE_UNIFORM_BUFFER_DYNAMIC: 1.0,
+    VK_DESCRIPTOR_TYPE_STORAGE_BUFFER: 2.0,
+    VK_DESCRIPTOR_TYPE_STORAGE_BUFFER_DYNAMIC: 0.5,
+    VK_DESCRIPTOR_TYPE_COMBINED_IMAGE_SAMPLER: 2.0,
+    VK_DESCRIPTOR_TYPE_SAMPLED_IMAGE: 1.0,
+    VK_DESCRIPTOR_TYPE_STORAGE_IMAGE: 0.5,
+    VK_DESCRIPTOR_TYPE_SAMPLER: 0.5,
+}
+
+# Each new pool holds half again as many sets as the previous one, up to this
+MAX_SETS_PER_POOL = 4096
+
+def handle_id(handle):
+    # Vulkan handles are cffi pointers, their address identifies them
+    return int(ffi.cast("uintptr_t", handle))
+
+def binding_key(binding):
+
+    # Bindings are given either as VkDescriptorSetLayoutBinding or as (binding, descriptor type, count, stages) tuples
+    if isinstance(binding, tuple):
+        return binding
+    return (binding.binding, binding.descriptorType, binding.descriptorCount, binding.stageFlags)
+
+class DescriptorLayoutCache:
+
+    # Descriptor set layouts keyed by their bindings, so every identical layout is created once and the handles can be compared directly.
+    # Layouts live as long as the cache, nobody else destroys them
+    def __init__(self, device):
+
+        self.device = device
+        self.layouts = {}
+        self.lock = threading.Lock()
+
+    def get(self, bindings):
+
+        key = tuple(sorted(binding_key(binding) for binding in bindings))
+        with self.lock:
+            set_layout = self.layouts.get(key)
+            if set_layout is None:
+                layout_bindings = [VkDescriptorSetLayoutBinding(binding = binding, descriptorType = descriptor_type, descriptorCount = count, stageFlags = stages)
+                    for binding, descriptor_type, count, stages in key]
+                layout_info = VkDescriptorSetLayoutCreateInfo(bindingCount = len(layout_bindings), pBindings = layout_bindings or None)
+                set_layout = self.layouts[key] = vkCreateDescriptorSetLayout(self.device, layout_info, None)
+            return set_layout
+
+    def destroy(self):
+
+        with self.lock:
+            for set_layout in self.layouts.values():
+                vkDestroyDescriptorSetLayout(self.device, set_layout, None)
+            self.layouts = {}
+
+class DescriptorAllocator:
+
+    # Hands out descriptor sets from a growing list of pools. Sets are never freed one by one: reset() gives every pool back at once, which
+    # is a single call per pool. Used either for sets that live as long as the program, never reset, or for sets of one frame slot, reset
+    # once the slot's fence says the GPU is done with them
+    def __init__(self, device, sets_per_pool = 64, pool_ratios = None):
+
+        self.device = device
+        self.sets_per_pool = sets_per_pool
+        self.pool_ratios = pool_ratios or DEFAULT_POOL_RATIOS
+
+        self.current_pool = None
+        self.full_pools = [] # Pools that ran out, given back by reset()
+        self.ready_pools = [] # Reset pools waiting to be used again
+        self.pool_count = 0
+        self.allocated = 0 # Sets allocated since the last reset
+
+    def create_pool(self):
+
+        pool_sizes = [VkDescriptorPoolSize(type = descriptor_type, descriptorCount = max(1, int(ratio * self.sets_per_pool)))
+            for descriptor_type, ratio in self.pool_ratios.items()]
+        pool_info = VkDescriptorPoolCreateInfo(maxSets = self.sets_per_pool, poolSizeCount = len(pool_sizes), pPoolSizes = pool_sizes)
+        pool = vkCreateDescriptorPool(self.device, pool_info, None)
+
+        self.pool_count += 1
+        self.sets_per_pool = min(self.sets_per_pool * 3 // 2, MAX_SETS_PER_POOL)
+        return pool
+
+    def next_pool(self):
+        return self.ready_pools.pop() if self.ready_pools else self.create_pool()
+
+    def allocate_from(self, pool, set_layout):
+        alloc_info = VkDescriptorSetAllocateInfo(descriptorPool = pool, descriptorSetCount = 1, pSetLayouts = [set_layout,])
+        return vkAllocateDescriptorSets(self.device, alloc_info)[0]
+
+    def allocate(self, set_layout):
+
+        if self.current_pool is None:
+            self.current_pool = self.next_pool()
+
+        try:
+            descriptor_set = self.allocate_from(self.current_pool, set_layout)
+        except (VkErrorOutOfPoolMemory, VkErrorFragmentedPool):
+            # Full, the next pool is either a reset one or a new, bigger one. A layout that doesn't fit an empty pool raises from here
+            self.full_pools.append(self.current_pool)
+            self.current_pool = self.next_pool()
+            descriptor_set = self.allocate_from(self.current_pool, set_layout)
+
+        self.allocated += 1
+        return descriptor_set
+
+    def reset(self):
+
+        # Every set handed out since the last reset becomes invalid. Pools that weren't used are left alone
+        if self.current_pool is not None:
+            self.full_pools.append(self.current_pool)
+            self.current_pool = None
+        for pool in self.full_pools:
+            vkResetDescriptorPool(self.device, pool, 0)
+        self.ready_pools.extend(self.full_pools)
+        self.full_pools = []
+        self.allocated = 0
+
+    def destroy(self):
+
+        pools = self.full_pools + self.ready_pools + ([self.current_pool] if self.current_pool is not None else [])
+        for pool in pools:
+            vkDestroyDescriptorPool(self.device, pool, None)
+        self.current_pool = None
+        self.full_pools = []
+        self.ready_pools = []
+
+def buffer_binding(binding, descriptor_type, buffer, offset = 0, size = VK_WHOLE_SIZE):
+    # What DescriptorSetCache.get writes into a binding, for buffers
+    return ("buffer", binding, descriptor_type, buffer, offset, size)
+
+def image_binding(binding, descriptor_type, image_view, sampler = None, layout = VK_IMAGE_LAYOUT_SHADER_READ_ONLY_OPTIMAL):
+    # Same, for images and samplers
+    return ("image", binding, descriptor_type, image_view, sampler, layout)
+
+class DescriptorSetCache:
+
+    # Descriptor sets keyed by their layout and contents, so the same buffers and images bound the same way reuse one set instead of allocating
+    # and writing a new one. Sets come from allocator, and the cache has to be cleared whenever the allocator is reset
+    def __init__(self, device, allocator):
+
+        self.device = device
+        self.allocator = allocator
+        self.sets = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, set_layout, bindings):
+
+        # bindings come from buffer_binding and image_binding
+        key = (handle_id(set_layout),) + tuple((kind, binding, descriptor_type, handle_id(resource), handle_id(extra) if kind == "image" and extra is not None else extra, last)
+            for kind, binding, descriptor_type, resource, extra, last in bindings)
+        descriptor_set = self.sets.get(key)
+        if descriptor_set is not None:
+            self.hits += 1
+            return descriptor_set
+
+        descriptor_set = self.allocator.allocate(set_layout)
+        writes = []
+        for kind, binding, descriptor_type, resource, extra, last in bindings:
+            if kind == "buffer":
+                buffer_info = VkDescriptorBufferInfo(buffer = resource, offset = extra, range = last)
+                writes.append(VkWriteDescriptorSet(dstSet = descriptor_set, dstBinding = binding, dstArrayElement = 0, descriptorCount = 1,
+                    descriptorType = descriptor_type, pBufferInfo = [buffer_info,]))
+            else:
+                image_info = VkDescriptorImageInfo(sampler = extra if extra is not None else VK_NULL_HANDLE, imageView = resource, imageLayout = last)
+                writes.append(VkWriteDescriptorSet(dstSet = descriptor_set, dstBinding = binding, dstArrayElement = 0, descriptorCount = 1,
+                    descriptorType = descriptor_type, pImageInfo = [image_info,]))
+        if writes:
+            vkUpdateDescriptorSets(self.device, len(writes), writes, 0, None)
+
+        self.sets[key] = descriptor_set
+        self.misses += 1
+        return descriptor_set
+
+    def evict(self, resource):
+
+        # Forgets every set that references resource (a buffer, image view or sampler), before it gets destroyed, so a later resource reusing
+        # its handle doesn't hit them. The sets themselves stay allocated until the allocator is reset
+        resource_id = handle_id(resource)
+        self.sets = {key: descriptor_set for key, descriptor_set in self.sets.items() if not any(self.references(entry, resource_id) for entry in key[1:])}
+
+    def references(self, entry, resource_id):
+
+        # Entries of a key are (kind, binding, descriptor type, resource id, offset or sampler id, size or layout)
+        kind, binding, descriptor_type, entry_resource, extra, last = entry
+        return entry_resource == resource_id or (kind == "image" and extra == resource_id)
+
+    def clear(self):
+        self.sets = {}
+
+class FrameDescriptors:
+
+    # One allocator and set cache per frame slot. begin_frame() resets the slot's pools, so it must only be called once the slot's fence
+    # was waited on. Sets from here only suit command buffers recorded during that frame, anything recorded once has to use a persistent allocator
+    def __init__(self, device, frame_count, sets_per_pool = 64):
+
+        self.allocators = [DescriptorAllocator(device, sets_per_pool) for i in range(frame_count)]
+        self.caches = [DescriptorSetCache(device, allocator) for allocator in self.allocators]
+        self.current = 0
+
+    def begin_frame(self, frame_slot):
+
+        self.current = frame_slot
+        if self.allocators[frame_slot].allocated:
+            self.allocators[frame_slot].reset()
+            self.caches[frame_slot].clear()
+
+    def get(self, set_layout, bindings):
+        return self.caches[self.current].get(set_layout, bindings)
+
+    def allocate(self, set_layout):
+        return self.allocators[self.current].allocate(set_layout)
+
+    def destroy(self):
+        for allocator in self.allocators:
+            allocator.destroy()
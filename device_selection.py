@@ -0,0 +1,135 @@
+import os
+
+from vulkan import *
+
+import queue_families
+
+# Overrides the automatic choice, with either the index of the device in enumeration order or part of its name
+DEVICE_ENVIRONMENT_VARIABLE = "HELLO_TRIANGLE_DEVICE"
+
+# Higher is better. Software rasterizers such as lavapipe report themselves as CPU devices
+DEVICE_TYPE_RANKS = {
+    VK_PHYSICAL_DEVICE_TYPE_DISCRETE_GPU: 4,
+    VK_PHYSICAL_DEVICE_TYPE_INTEGRATED_GPU: 3,
+    VK_PHYSICAL_DEVICE_TYPE_VIRTUAL_GPU: 2,
+    VK_PHYSICAL_DEVICE_TYPE_CPU: 1,
+    VK_PHYSICAL_DEVICE_TYPE_OTHER: 0,
+}
+
+DEVICE_TYPE_NAMES = {
+    VK_PHYSICAL_DEVICE_TYPE_DISCRETE_GPU: "discrete",
+    VK_PHYSICAL_DEVICE_TYPE_INTEGRATED_GPU: "integrated",
+    VK_PHYSICAL_DEVICE_TYPE_VIRTUAL_GPU: "virtual",
+    VK_PHYSICAL_DEVICE_TYPE_CPU: "cpu",
+    VK_PHYSICAL_DEVICE_TYPE_OTHER: "other",
+}
+
+# What each part of the score means, in the order they are compared
+SCORE_CRITERIA = ("device type", "device local memory", "dedicated queues", "max image size")
+
+class DeviceCandidate:
+
+    def __init__(self, index, device, name, device_type):
+
+        self.index = index # Position in vkEnumeratePhysicalDevices
+        self.device = device
+        self.name = name
+        self.device_type = device_type
+        self.problem = None # Why the device can't be used, None when it can
+        self.score = () # Compared as a tuple, following SCORE_CRITERIA
+
+def device_local_memory(device):
+
+    # Size of the biggest device local heap. Integrated GPUs usually report shared system memory here, but they are ranked below discrete ones anyway
+    memory_properties = vkGetPhysicalDeviceMemoryProperties(device)
+    sizes = [memory_properties.memoryHeaps[i].size for i in range(memory_properties.memoryHeapCount)
+        if memory_properties.memoryHeaps[i].flags & VK_MEMORY_HEAP_DEVICE_LOCAL_BIT]
+    return max(sizes) if sizes else 0
+
+def evaluate_device(index, device, dispatch, surface, required_extensions):
+
+    properties = vkGetPhysicalDeviceProperties(device)
+    candidate = DeviceCandidate(index, device, properties.deviceName, properties.deviceType)
+
+    # Must haves: the extensions we enable and the queues we need
+    supported_extensions = [extension.extensionName for extension in vkEnumerateDeviceExtensionProperties(device, None)]
+    for extension in required_extensions:
+        if extension not in supported_extensions:
+            candidate.problem = "missing extension " + extension
+            return candidate
+
+    indices = queue_families.find_queue_families(device, dispatch, surface)
+    if not indices.is_complete():
+        candidate.problem = "no graphics or present queue"
+        return candidate
+
+    # Nice to haves, compared in order
+    dedicated_queues = int(indices.transfer_family is not None) + int(indices.compute_family is not None)
+    candidate.score = (DEVICE_TYPE_RANKS.get(properties.deviceType, 0), device_local_memory(device), dedicated_queues, properties.limits.maxImageDimension2D)
+    return candidate
+
+def find_override(candidates, selection):
+
+    # selection is either an index in enumeration order or part of a device name (case insensitive)
+    selection = str(selection).strip()
+    if selection.isdigit():
+        matches = [candidate for candidate in candidates if candidate.index == int(selection)]
+    else:
+        matches = [candidate for candidate in candidates if selection.lower() in candidate.name.lower()]
+
+    if not matches:
+        print("ERROR: No device matches '{}', falling back to automatic selection".format(selection))
+        return None
+    if matches[0].problem is not None:
+        print("ERROR: Device '{}' can't be used ({}), falling back to automatic selection".format(matches[0].name, matches[0].problem))
+        return None
+
+    return matches[0]
+
+def describe_score(candidate):
+    return "{}, {} MiB device local, {} dedicated queues, max image {}".format(DEVICE_TYPE_NAMES.get(candidate.device_type, "other"), candidate.score[1] // (1024 * 1024),
+        candidate.score[2], candidate.score[3])
+
+def choose_physical_device(instance, dispatch, surface, required_extensions, selection = None):
+
+    # Returns the best suited physical device, or the one picked through selection or the environment variable. Logs every device seen
+    # and why the chosen one won, since ending up on the wrong GPU is otherwise easy to miss
+    if selection is None:
+        selection = os.environ.get(DEVICE_ENVIRONMENT_VARIABLE)
+
+    candidates = [evaluate_device(i, device, dispatch, surface, required_extensions) for i, device in enumerate(vkEnumeratePhysicalDevices(instance))]
+    usable = [candidate for candidate in candidates if candidate.problem is None]
+
+    for candidate in candidates:
+        if candidate.problem is None:
+            print("Device {}: {} ({})".format(candidate.index, candidate.name, describe_score(candidate)))
+        else:
+            print("Device {}: {} (unusable, {})".format(candidate.index, candidate.name, candidate.problem))
+
+    if not usable:
+        print("ERROR: No suitable physical device!")
+        return None
+
+    if selection is not None and selection != "":
+        chosen = find_override(candidates, selection)
+        if chosen is not None:
+            print("Using device {}: {}, selected by override '{}'".format(chosen.index, chosen.name, selection))
+            return chosen.device
+
+    # Sorting is stable, so ties go to the device enumerated first
+    usable.sort(key = lambda candidate: candidate.score, reverse = True)
+    chosen = usable[0]
+
+    if len(usable) == 1:
+        reason = "only suitable device"
+    else:
+        # The first criterion the winner beats the runner up on
+        runner_up = usable[1]
+        reason = "tied with {}, enumerated first".format(runner_up.name)
+        for criterion, ours, theirs in zip(SCORE_CRITERIA, chosen.score, runner_up.score):
+            if ours != theirs:
+                reason = "better {} than {}".format(criterion, runner_up.name)
+                break
+
+    print("Using device {}: {}, {}".format(chosen.index, chosen.name, reason))
+    return chosen.device
@@ -0,0 +1,133 @@
+import numpy
+
+from vulkan import *
+
+import buffers
+
+# Same memory layout as VkDrawIndexedIndirectCommand, so a NumPy array of these can be copied into an indirect buffer as it is
+DRAW_COMMAND_DTYPE = numpy.dtype([("indexCount", numpy.uint32), ("instanceCount", numpy.uint32), ("firstIndex", numpy.uint32), ("vertexOffset", numpy.int32),
+    ("firstInstance", numpy.uint32)])
+
+class GeometryPool:
+
+    # Many meshes packed into one vertex buffer and one index buffer, so a single bind covers every draw of a draw list.
+    # Meshes are added on the CPU side first, then uploaded together with upload()
+    def __init__(self):
+
+        self.vertex_arrays = []
+        self.index_arrays = []
+        self.vertex_buffer = None
+        self.index_buffer = None
+
+        # Indexed by mesh id. Appended to as Python lists, which is amortized O(1), and turned into arrays by mesh_table() once needed
+        self.index_counts = []
+        self.first_indices = []
+        self.vertex_offsets = []
+        self.table = None # (index counts, first indices, vertex offsets) arrays, None when meshes were added since
+        self.vertex_total = 0
+        self.index_total = 0
+
+    def add_mesh(self, vertices, indices):
+
+        # Returns the id used to refer to this mesh in draw lists. Indices stay relative to the mesh, vertexOffset takes care of the rest
+        if self.vertex_buffer is not None:
+            raise RuntimeError("Can't add meshes to a geometry pool after it was uploaded")
+
+        mesh_id = len(self.index_counts)
+        self.vertex_arrays.append(numpy.ascontiguousarray(vertices, dtype = buffers.VERTEX_DTYPE))
+        self.index_arrays.append(numpy.ascontiguousarray(indices, dtype = numpy.uint32))
+
+        self.index_counts.append(len(indices))
+        self.first_indices.append(self.index_total)
+        self.vertex_offsets.append(self.vertex_total)
+        self.table = None
+        self.vertex_total += len(vertices)
+        self.index_total += len(indices)
+
+        return mesh_id
+
+    def mesh_table(self):
+
+        # Converted once after a run of add_mesh calls, instead of copying the arrays on every add
+        if self.table is None:
+            self.table = (numpy.array(self.index_counts, dtype = numpy.uint32), numpy.array(self.first_indices, dtype = numpy.uint32),
+                numpy.array(self.vertex_offsets, dtype = numpy.int32))
+        return self.table
+
+    def upload(self, allocator, command_pool, queue):
+
+        # Happens once, the buffers are sized for exactly the meshes added so far
+        if self.vertex_buffer is not None:
+            raise RuntimeError("Geometry pool was already uploaded")
+        if not self.index_counts:
+            raise ValueError("Can't upload an empty geometry pool")
+
+        self.vertex_buffer = buffers.upload_array(allocator, command_pool, queue, numpy.concatenate(self.vertex_arrays), VK_BUFFER_USAGE_VERTEX_BUFFER_BIT)
+        self.index_buffer = buffers.upload_array(allocator, command_pool, queue, numpy.concatenate(self.index_arrays), VK_BUFFER_USAGE_INDEX_BUFFER_BIT)
+
+        # The CPU copies aren't needed anymore
+        self.vertex_arrays = []
+        self.index_arrays = []
+
+    def destroy(self, allocator):
+
+        buffers.destroy_buffer(allocator, self.vertex_buffer)
+        buffers.destroy_buffer(allocator, self.index_buffer)
+
+class DrawList:
+
+    def __init__(self, pool, indirect_buffer, commands):
+
+        self.pool = pool
+        self.indirect_buffer = indirect_buffer # None when there are no draws
+        self.commands = commands # NumPy array with DRAW_COMMAND_DTYPE, same content as the indirect buffer
+        self.draw_count = len(commands)
+
+def build_draw_commands(pool, mesh_ids, instance_counts = 1, first_instances = 0):
+
+    # Vectorized, so building thousands of draws costs a handful of NumPy operations instead of a Python loop
+    mesh_ids = numpy.asarray(mesh_ids, dtype = numpy.int64)
+    index_counts, first_indices, vertex_offsets = pool.mesh_table()
+    if len(mesh_ids) and (mesh_ids.min() < 0 or mesh_ids.max() >= len(index_counts)):
+        raise ValueError("Mesh ids must be in [0, {}), got {} to {}".format(len(index_counts), mesh_ids.min(), mesh_ids.max()))
+    commands = numpy.empty(len(mesh_ids), dtype = DRAW_COMMAND_DTYPE)
+    commands["indexCount"] = index_counts[mesh_ids]
+    commands["instanceCount"] = instance_counts
+    commands["firstIndex"] = first_indices[mesh_ids]
+    commands["vertexOffset"] = vertex_offsets[mesh_ids]
+    commands["firstInstance"] = first_instances
+    return commands
+
+def create_draw_list(allocator, command_pool, queue, pool, mesh_ids, instance_counts = 1, first_instances = 0):
+
+    commands = build_draw_commands(pool, mesh_ids, instance_counts, first_instances)
+    if len(commands) == 0:
+        # Nothing to draw, and Vulkan doesn't allow an empty buffer. record_draw_list skips these
+        return DrawList(pool, None, commands)
+    indirect_buffer = buffers.upload_array(allocator, command_pool, queue, commands, VK_BUFFER_USAGE_INDIRECT_BUFFER_BIT)
+    return DrawList(pool, indirect_buffer, commands)
+
+def record_draw_list(command_buffer, draw_list, multi_draw_indirect, max_draw_count = 1):
+
+    if draw_list.draw_count == 0:
+        return
+
+    vkCmdBindVertexBuffers(command_buffer, 0, 1, [draw_list.pool.vertex_buffer.buffer,], [0,])
+    vkCmdBindIndexBuffer(command_buffer, draw_list.pool.index_buffer.buffer, 0, VK_INDEX_TYPE_UINT32)
+
+    stride = DRAW_COMMAND_DTYPE.itemsize
+    if multi_draw_indirect:
+        # The GPU reads every draw from the buffer. Only maxDrawIndirectCount can make us split it into a few calls
+        for first in range(0, draw_list.draw_count, max_draw_count):
+            count = min(max_draw_count, draw_list.draw_count - first)
+            vkCmdDrawIndexedIndirect(command_buffer, draw_list.indirect_buffer.buffer, first * stride, count, stride)
+    else:
+        # Without the multiDrawIndirect feature, drawCount has to be 0 or 1, so there is one call per draw. Parameters still come from the buffer
+        for first in range(draw_list.draw_count):
+            vkCmdDrawIndexedIndirect(command_buffer, draw_list.indirect_buffer.buffer, first * stride, 1, stride)
+
+def destroy_draw_list(allocator, draw_list):
+
+    # The geometry pool may be shared with other draw lists, so it is left to its owner
+    if draw_list.indirect_buffer is not None:
+        buffers.destroy_buffer(allocator, draw_list.indirect_buffer)
@@ -0,0 +1,102 @@
+import time
+
+from vulkan import *
+
+# Extension functions are not exported directly by the loader, so they have to be looked up through vkGetInstanceProcAddr / vkGetDeviceProcAddr.
+# Doing that lookup every time a function is needed is wasteful, so every function listed here gets resolved once and stored in a DispatchTable
+INSTANCE_FUNCTIONS = (
+    "vkGetPhysicalDeviceSurfaceSupportKHR",
+    "vkGetPhysicalDeviceSurfaceCapabilitiesKHR",
+    "vkGetPhysicalDeviceSurfaceFormatsKHR",
+    "vkGetPhysicalDeviceSurfacePresentModesKHR",
+    "vkDestroySurfaceKHR",
+)
+
+DEVICE_FUNCTIONS = (
+    "vkCreateSwapchainKHR",
+    "vkDestroySwapchainKHR",
+    "vkGetSwapchainImagesKHR",
+    "vkAcquireNextImageKHR",
+    "vkQueuePresentKHR",
+)
+
+# Core functions called every frame. They don't need a lookup, but going through the table lets the tracing mode account for them too
+CORE_FUNCTIONS = (
+    "vkWaitForFences",
+    "vkResetFences",
+    "vkResetCommandBuffer",
+    "vkQueueSubmit",
+)
+
+class DispatchTable:
+
+    def __init__(self, trace = False):
+
+        self.trace = trace
+        self.instance = None
+        self.device = None
+
+        # Only used in tracing mode. Both are keyed by function name
+        self.call_counts = {}
+        self.call_times = {} # Cumulative wall time in seconds
+
+        for name in CORE_FUNCTIONS:
+            self._store(name, globals()[name])
+
+    def load_instance(self, instance):
+
+        self.instance = instance
+
+        # Functions whose extension was not enabled (no surface when running headless, for example) are simply left as None
+        for name in INSTANCE_FUNCTIONS:
+            try:
+                self._store(name, vkGetInstanceProcAddr(instance, name))
+            except ProcedureNotFoundError:
+                setattr(self, name, None)
+
+    def load_device(self, device):
+
+        self.device = device
+
+        for name in DEVICE_FUNCTIONS:
+            try:
+                self._store(name, vkGetDeviceProcAddr(device, name))
+            except ProcedureNotFoundError:
+                setattr(self, name, None)
+
+    def _store(self, name, function):
+
+        if self.trace:
+            function = self._traced(name, function)
+        setattr(self, name, function)
+
+    def _traced(self, name, function):
+
+        self.call_counts[name] = 0
+        self.call_times[name] = 0.0
+
+        def traced_function(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.call_times[name] += time.perf_counter() - start
+                self.call_counts[name] += 1
+
+        return traced_function
+
+    def report(self):
+        # Returns (name, calls, total seconds) for every traced function, most expensive first
+        rows = [(name, self.call_counts[name], self.call_times[name]) for name in self.call_counts if self.call_counts[name] > 0]
+        rows.sort(key = lambda row: row[2], reverse = True)
+        return rows
+
+    def print_report(self):
+
+        if not self.trace:
+            print("Dispatch tracing is disabled")
+            return
+
+        print("{:<45} {:>10} {:>12} {:>12}".format("Function", "Calls", "Total (ms)", "Avg (us)"))
+        for name, calls, total in self.report():
+            print("{:<45} {:>10} {:>12.3f} {:>12.3f}".format(name, calls, total * 1000.0, total / calls * 1000000.0))
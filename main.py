@@ -1,84 +1,307 @@
-from vulkan import *
+import time
+
+# Startup timeline starts here, so it includes the time spent importing
+MODULE_START = time.perf_counter()
 
-import glfw
-import glfw.GLFW as GLFW_CONSTANTS
+from vulkan import *
 
+import numpy
+
+import allocator
+import batches
+import buffers
+import capture
+import compute
+import deletion_queue
+import descriptors
+import device_selection
+import draw_list
+import loader
+import offscreen
+import pipeline_cache
+import pipeline_factory
+import profiler
+import recording
+import shader_library
 import queue_families
 import swapchain
+import transfers
+import uniforms
 import pipeline
+import startup
+
+# Frames run() renders when headless and no count is given
+DEFAULT_HEADLESS_FRAMES = 1000
+
+# GLFW is only needed with a window, so it is imported on first use and headless runs never load it
+glfw = None
+GLFW_CONSTANTS = None
+
+def import_glfw():
+
+    global glfw, GLFW_CONSTANTS
+    if glfw is None:
+        import glfw as glfw_module
+        import glfw.GLFW as glfw_constants
+        glfw, GLFW_CONSTANTS = glfw_module, glfw_constants
+    return glfw
 
 class Program:
-    def __init__(self):
+    def __init__(self, max_frames_in_flight = 2, trace_dispatch = False, headless = False, pipeline_cache_dir = ".pipeline_cache", recording_workers = 0,
+        physical_device_selection = None, present_policy = "low_latency", swapchain_images = None, profile = False, profile_dump = None, profile_dump_every = 0, init_workers = 4,
+        pipeline_workers = 2):
         # Throughout the code, vk stands for Vulkan
+        init_start = time.perf_counter()
 
         self.program_name = "test_name"
+        self.headless = headless # Renders into offscreen images instead of a window, frames are read back with read_frame()
+        self.last_image_index = None
         self.window = None 
         self.window_width = 640
         self.window_height = 480
         self.vk_instance = None  
+        self.dispatch = loader.DispatchTable(trace = trace_dispatch) # Extension and per-frame functions, resolved once and shared by every module
         self.vk_surface = None
         self.physical_device = None
+        self.physical_device_selection = physical_device_selection # Device index or name, overrides the automatic choice (see device_selection)
         self.logical_device = None
         self.queue_family_indices = None
         self.graphics_queue = None
         self.present_queue = None
+        self.transfer_queue = None # From a dedicated transfer family, None when the device has none
+        self.compute_queue = None # From a dedicated compute family, None when the device has none
+        self.compute = None # compute.ComputeContext, made the first time get_compute() is called
+        self.uploader = None # transfers.AsyncUploader, streams buffers in through the transfer queue
+        self.pending_meshes = [] # (mesh, uploads) pairs, drawn once every upload is ready
+        self.allocator = None # Hands out device memory from pooled blocks
         self.swapchain_bundle = None
+        self.present_policy = present_policy # One of swapchain.PRESENT_POLICIES, trades latency for power
+        self.swapchain_images = swapchain_images # Requested image count, clamped to what the surface allows. None picks one more than the minimum
+        self.framebuffer_resized = False # Set by GLFW when the window size changes
+        self.deletion_queue = deletion_queue.DeletionQueue() # Resources replaced at runtime, destroyed once the GPU finished the last frame using them
         self.pipeline_bundle = None
+        self.pipeline_cache = None # Persisted to pipeline_cache_dir, None disables it
+        self.pipeline_factory = None # pipeline_factory.PipelineFactory, every pipeline of the program comes from it
+        self.pipeline_workers = pipeline_workers # Threads compiling pipeline variants in the background
+        self.image_format = None # Format rendered images have, which pipelines are made for
+        self.final_layout = None # Layout rendered images are left in, for presenting or for reading back
+        self.startup_timeline = None # startup.StartupTimeline of __init__, plus the first frame once run() renders it
+        self.first_frame_reported = False # report_first_frame() waits for the device, so it only ever runs once
+        self.shader_cache = None # Shader modules shared between pipelines
+        self.frame_uniforms = None # uniforms.UniformRing with one slot per swapchain image
+        self.descriptor_layouts = None # descriptors.DescriptorLayoutCache, every descriptor set layout of the program
+        self.descriptor_allocator = None # descriptors.DescriptorAllocator for sets that live as long as the program, never reset
+        self.descriptor_sets = None # descriptors.DescriptorSetCache over descriptor_allocator, for sets bound by command buffers recorded once
+        self.frame_descriptors = None # descriptors.FrameDescriptors, sets of a single frame, reset once its frame slot comes around again
+        self.view_transform = numpy.identity(4, dtype = numpy.float32) # Written into the frame uniforms every frame
+        self.start_time = time.perf_counter()
+        self.default_draw_data = uniforms.default_draw_data()
         self.command_pool = None
-        self.image_available_semaphore = None
-        self.render_finished_semaphore = None
+        self.recorder = None # recording.ParallelRecorder, records large scenes into secondary command buffers across threads
+        self.capture = None # capture.FrameCapture, streams every frame back to the CPU once start_capture() was called
+        self.capture_writer = None # capture.CaptureWriter fed by process_captures(), when capturing to a file
+        self.profiler = None # profiler.Profiler, only made when profiling. Every use is behind an "if", so it costs nothing otherwise
+
+        # Frames in flight. Each frame slot owns its own command buffer, semaphores and fence, so the CPU can record frame N+1 while the GPU still works on frame N
+        self.max_frames_in_flight = max_frames_in_flight
+        self.current_frame = 0
+        self.image_available_semaphores = []
+        self.render_finished_semaphores = []
+        self.in_flight_fences = []
+        self.images_in_flight = [] # Fence of the frame slot currently using each swapchain image, or VK_NULL_HANDLE
+        self.frame_number = 0 # Number of frames submitted so far
+        self.slot_frame_numbers = [0] * max_frames_in_flight # Frame number last submitted from each frame slot
+        self.completed_frame = 0 # Every frame up to this one is known to be finished by the GPU
+
+        # State the recorded command buffers depend on. Changing it through the setters marks the command buffers dirty
+        self.clear_color = (1.0, 0.5, 0.25, 1.0)
+        self.meshes = [] # buffers.Mesh objects, each drawn with one indexed draw
+        self.triangle_mesh = None
+        self.instance_batches = [] # batches.InstanceBatch objects, each drawn with one instanced draw
+        self.instanced_pipeline_bundle = None # Made the first time a batch is added
+        self.streamed_batches = [] # Instance batches with an update waiting to be copied by the next frame
+        self.update_commandbuffers = [] # One per frame slot, copies the streamed instance updates ahead of the frame's draws
+        self.geometry_pools = [] # draw_list.GeometryPool objects, meshes packed into shared buffers
+        self.draw_lists = [] # draw_list.DrawList objects, each drawn with indirect draws read from a GPU buffer
+
+        # Device features the draw lists use when available, filled in by create_logical_device
+        self.multi_draw_indirect = False
+        self.draw_indirect_first_instance = False
+        self.max_draw_indirect_count = 1
+
+        # Every step below is timed. Independent ones run on a thread pool: SPIR-V and the pipeline cache only need the disk, the instance can be
+        # created while the window opens, and the pipeline compiles while the swapchain, command buffers and meshes are made
+        self.startup_timeline = startup.StartupTimeline(MODULE_START)
+        self.startup_timeline.record("imports", MODULE_START, init_start)
+        scheduler = startup.InitScheduler(self.startup_timeline, init_workers)
+
+        # Shaders are compiled from source when they changed and a compiler is available, otherwise the prebuilt SPIR-V is used
+        scheduler.submit("shaders", self.resolve_shaders)
+
+        # Create a window. GLFW has to be initialized first, since it decides which instance extensions are needed
+        if not self.headless:
+            with self.startup_timeline.step("glfw init"):
+                self.init_glfw()
+
+        # Makes a Vulkan Instance, similar to an OpenGL Context. GLFW windows can only be made on the main thread, so the instance is made on another one
+        scheduler.submit("instance", self.make_instance)
+        if not self.headless:
+            with self.startup_timeline.step("window"):
+                self.build_glfw_window(self.window_width, self.window_height)
+        scheduler.result("instance")
+
+        with self.startup_timeline.step("device"):
+            # Resolves instance level extension functions
+            self.dispatch.load_instance(self.vk_instance)
+
+            # Makes a vk_surface
+            if not self.headless:
+                self.make_surface()
+
+            # Picks the best suited physical device, unless told otherwise
+            self.choose_physical_device()
+
+            # Setting up queue indices. Store indices from first graphics and or present queue found. Queues are created along with logical device
+            self.queue_family_indices = queue_families.find_queue_families(self.physical_device, self.dispatch, self.vk_surface)
+
+            # Creates the logical device and associated queues
+            self.create_logical_device()
+
+            # Resolves device level extension functions
+            self.dispatch.load_device(self.logical_device)
+
+        # Loads the pipeline cache saved by previous runs, so pipelines don't have to be compiled from scratch on every launch
+        if pipeline_cache_dir is not None:
+            scheduler.submit("pipeline cache", pipeline_cache.PipelineCache, self.logical_device, self.physical_device, pipeline_cache_dir)
+
+        with self.startup_timeline.step("allocator and queues"):
+            # Every buffer and image gets its memory through the allocator
+            self.allocator = allocator.MemoryAllocator(self.logical_device, self.physical_device)
+
+            # Caching individual queues
+            self.graphics_queue = vkGetDeviceQueue(self.logical_device, self.queue_family_indices.graphics_family, 0)
+            if not self.headless:
+                self.present_queue = vkGetDeviceQueue(self.logical_device, self.queue_family_indices.present_family, 0)
+            if self.queue_family_indices.transfer_family is not None:
+                self.transfer_queue = vkGetDeviceQueue(self.logical_device, self.queue_family_indices.transfer_family, 0)
+            if self.queue_family_indices.compute_family is not None:
+                self.compute_queue = vkGetDeviceQueue(self.logical_device, self.queue_family_indices.compute_family, 0)
+            print("Queue families: graphics {}, present {}, transfer {}, compute {}".format(self.queue_family_indices.graphics_family, 
+                self.queue_family_indices.present_family, self.queue_family_indices.transfer_family, self.queue_family_indices.compute_family))
+
+            # Asynchronous uploads, through the transfer queue when there is one
+            self.uploader = transfers.AsyncUploader(self.logical_device, self.allocator, self.queue_family_indices.graphics_family, self.graphics_queue,
+                self.queue_family_indices.transfer_family, self.transfer_queue)
+
+            # Per frame uniforms. Command buffers are recorded once per swapchain image, along with the dynamic offset they bind, so slots are
+            # assigned per image rather than per frame slot. The swapchain doesn't exist yet, so there are spare slots for however many images it is
+            # likely to get, resize_frame_uniforms grows the ring when it gets more
+            self.descriptor_layouts = descriptors.DescriptorLayoutCache(self.logical_device)
+            self.descriptor_allocator = descriptors.DescriptorAllocator(self.logical_device)
+            self.descriptor_sets = descriptors.DescriptorSetCache(self.logical_device, self.descriptor_allocator)
+            self.frame_descriptors = descriptors.FrameDescriptors(self.logical_device, self.max_frames_in_flight)
+            self.frame_uniforms = uniforms.UniformRing(self.logical_device, self.physical_device, self.allocator, 
+                max(self.max_frames_in_flight, self.swapchain_images or 0, 8), self.descriptor_layouts, self.descriptor_sets)
+
+        # The pipeline only needs the image format, not the swapchain itself, so it compiles while the swapchain is made
+        if not self.headless:
+            image_format = swapchain.choose_surface_format(self.dispatch.vkGetPhysicalDeviceSurfaceFormatsKHR(self.physical_device, self.vk_surface)).format
+            self.final_layout = VK_IMAGE_LAYOUT_PRESENT_SRC_KHR
+        else:
+            image_format = offscreen.DEFAULT_IMAGE_FORMAT
+            self.final_layout = VK_IMAGE_LAYOUT_TRANSFER_SRC_OPTIMAL
+        self.shader_cache = shader_library.ShaderModuleCache(self.logical_device)
+        scheduler.submit("pipeline", self.compile_pipeline, scheduler, image_format)
+
+        # Makes a swapchain. When headless, a set of offscreen images takes its place, one for each frame slot
+        with self.startup_timeline.step("swapchain"):
+            if not self.headless:
+                self.swapchain_bundle = swapchain.create_swapchain(self.dispatch, self.logical_device, self.physical_device, self.vk_surface, self.window_width, 
+                    self.window_height, self.queue_family_indices, present_policy = self.present_policy, image_count = self.swapchain_images)
+                print(swapchain.describe_swapchain(self.swapchain_bundle))
+            else:
+                self.swapchain_bundle = offscreen.create_offscreen_target(self.logical_device, self.allocator, self.window_width, self.window_height, 
+                    self.max_frames_in_flight, image_format)
+            if len(self.swapchain_bundle.frames) > self.frame_uniforms.slot_count:
+                self.resize_frame_uniforms(len(self.swapchain_bundle.frames))
 
-        # Create a window
-        self.build_glfw_window(self.window_width, self.window_height)
+        # Creates commandbuffers and related structures
+        with self.startup_timeline.step("command buffers"):
+            self.create_command_pool()
+            self.create_commandbuffers()
+            self.create_update_commandbuffers()
+            self.set_recording_workers(recording_workers)
 
-        # Makes a Vulkan Instance, similar to an OpenGL Context
-        self.make_instance()
+        # Uploads the geometry to device local memory, once
+        with self.startup_timeline.step("meshes"):
+            self.create_meshes()
 
-        # Makes a vk_surface
-        self.make_surface()
+        # Creates obejcts that are needed to control the flow of execution, either between GPU and CPU, or just CPU
+        with self.startup_timeline.step("sync objects"):
+            self.create_sync_objects()
 
-        # Gets reference to first physical device supported
-        self.choose_physical_device()
+        # Everything left needs the pipeline's render pass
+        self.pipeline_bundle = scheduler.result("pipeline")
+        if self.pipeline_cache is not None:
+            self.pipeline_cache.report()
 
-        # Setting up queue indices. Store indices from first graphics and or present queue found. Queues are created along with logical device
-        self.queue_family_indices = queue_families.find_queue_families(self.physical_device, self.vk_instance, self.vk_surface)
+        # Populates swapchain_bundle.frames with framebuffers
+        with self.startup_timeline.step("framebuffers"):
+            self.create_framebuffers()
 
-        # Creates the logical device and associated queues
-        self.create_logical_device()
+        # CPU and GPU frame timings. Queries are assigned per image, same as the frame uniform slots
+        if profile:
+            self.profiler = profiler.Profiler(self.logical_device, self.physical_device, self.queue_family_indices.graphics_family, self.frame_uniforms.slot_count,
+                dump_path = profile_dump, dump_every = profile_dump_every)
+            self.mark_commandbuffers_dirty()
 
-        # Caching individual queues
-        self.graphics_queue = vkGetDeviceQueue(self.logical_device, self.queue_family_indices.graphics_family, 0)
-        self.present_queue = vkGetDeviceQueue(self.logical_device, self.queue_family_indices.present_family, 0)
+        scheduler.shutdown()
+        self.startup_timeline.mark("ready")
+        self.startup_timeline.print_timeline()
 
-        # Makes a swapchain
-        self.swapchain_bundle = swapchain.create_swapchain(self.vk_instance, self.logical_device, self.physical_device, self.vk_surface, self.window_width, 
-            self.window_height, self.queue_family_indices)
+    def resolve_shaders(self):
+        return shader_library.get_spirv_path("shaders/mesh.vert", "shaders/mesh.vert.spv"), shader_library.get_spirv_path("shaders/shader.frag", "shaders/frag.spv")
 
-        # Makes a pipeline
-        self.pipeline_bundle = pipeline.create_graphics_pipeline(self.logical_device, self.swapchain_bundle.color_format.format, self.swapchain_bundle.extent, 
-            "shaders/vert.spv", "shaders/frag.spv")
+    def compile_pipeline(self, scheduler, image_format):
 
-        # Populates swapchain_bundle.frames with framebuffers
-        self.create_framebuffers()
+        # Runs on the init thread pool. The steps it depends on were submitted before it, so they are done or running, never waiting behind it
+        vertex_spirv, fragment_spirv = scheduler.result("shaders")
+        if "pipeline cache" in scheduler.futures:
+            self.pipeline_cache = scheduler.result("pipeline cache")
+        self.pipeline_factory = pipeline_factory.PipelineFactory(self.logical_device, self.pipeline_cache, self.shader_cache, self.pipeline_workers)
 
-        # Creates commandbuffers and related structures
-        self.create_commandbuffers()
+        # Makes a pipeline
+        self.image_format = image_format
+        return self.pipeline_factory.get(self.pipeline_description(vertex_spirv, fragment_spirv, buffers.vertex_input_from_dtype(buffers.VERTEX_DTYPE)))
 
-        # Creates obejcts that are needed to control the flow of execution, either between GPU and CPU, or just CPU
-        self.create_sync_objects()
+    def pipeline_description(self, vertex_spirv, fragment_spirv, vertex_input = None, **state):
 
-    def build_glfw_window(self, width, height):
+        # Pipeline drawing into the program's render pass, with the frame uniforms and per draw push constants. state overrides the fixed function
+        # defaults of pipeline_factory.PipelineDescription, such as cull_mode or blend_mode. Pass the result to self.pipeline_factory
+        return pipeline_factory.PipelineDescription(vertex_spirv, fragment_spirv, self.image_format, self.final_layout, vertex_input, [self.frame_uniforms.set_layout,],
+            uniforms.push_constant_ranges(), **state)
+
+    def init_glfw(self):
 
         # Setting up GLFW
+        import_glfw()
         glfw.init()
         glfw.window_hint(GLFW_CONSTANTS.GLFW_CLIENT_API, GLFW_CONSTANTS.GLFW_NO_API)
-        glfw.window_hint(GLFW_CONSTANTS.GLFW_RESIZABLE, GLFW_CONSTANTS.GLFW_FALSE)
-        
-        # Creating window
+        glfw.window_hint(GLFW_CONSTANTS.GLFW_RESIZABLE, GLFW_CONSTANTS.GLFW_TRUE)
+
+    def build_glfw_window(self, width, height):
+
+        # Creating window, GLFW was set up by init_glfw
         self.window = glfw.create_window(width, height, "window_test_name", None, None)
         if self.window is not None:
             print("Successfully made a glfw window called!")
 
+        # The swapchain gets recreated on the next frame, rather than inside the callback
+        glfw.set_framebuffer_size_callback(self.window, self.on_framebuffer_resize)
+
+    def on_framebuffer_resize(self, window, width, height):
+        self.framebuffer_resized = True
+
     def make_instance(self):
 
         # Gives us a values with byte flags that indicate the most recent version of Vulkan that is supported by the system
@@ -91,7 +314,7 @@ class Program:
         layers = []
 
         #In our simple case, we only need to make sure our system supports the VK_KHR_surface extension, since GLFW will need that to create a vk_surface
-        extensions = glfw.get_required_instance_extensions()
+        extensions = glfw.get_required_instance_extensions() if not self.headless else []
 
         # Get supported extensions
         supported_extensions = [extension.extensionName for extension in vkEnumerateInstanceExtensionProperties(None)]
@@ -125,19 +348,12 @@ class Program:
         self.vk_surface = c_style_pointer[0]
     
     def choose_physical_device(self):
-        # Get all available devices
-        available_devices = vkEnumeratePhysicalDevices(self.vk_instance)
-
-        # Return the first device that supports our required extension
-        for device in available_devices:
 
-            supported_extensions = [extension.extensionName for extension in vkEnumerateDeviceExtensionProperties(device, None)]
-
-            # The only device extension we need to make sure is available is VK_KHR_SWAPCHAIN_EXTENSION_NAME
-            if VK_KHR_SWAPCHAIN_EXTENSION_NAME in supported_extensions:
-                self.physical_device = device
-            else:
-                print("ERROR: Device Extension is NOT supported!")
+        # The only device extension we need to make sure is available is VK_KHR_SWAPCHAIN_EXTENSION_NAME, and not even that one when headless.
+        # Every device that has it is scored, by type first, then memory, queues and limits
+        required_extensions = [VK_KHR_SWAPCHAIN_EXTENSION_NAME] if not self.headless else []
+        self.physical_device = device_selection.choose_physical_device(self.vk_instance, self.dispatch, self.vk_surface, required_extensions, 
+            self.physical_device_selection)
 
     def create_logical_device(self):
 
@@ -149,10 +365,16 @@ class Program:
                 VkDeviceQueueCreateInfo(queueFamilyIndex = index, queueCount = 1, pQueuePriorities = [1.0,])
             )
 
-        # Setting up the rest of the info needed to create the device
-        device_features = VkPhysicalDeviceFeatures()
+        # Setting up the rest of the info needed to create the device. Draw lists only need multiDrawIndirect to submit all their draws in one call,
+        # so it is enabled when supported, and they fall back to one indirect draw each when it isn't
+        supported_features = vkGetPhysicalDeviceFeatures(self.physical_device)
+        self.multi_draw_indirect = bool(supported_features.multiDrawIndirect)
+        self.draw_indirect_first_instance = bool(supported_features.drawIndirectFirstInstance)
+        if self.multi_draw_indirect:
+            self.max_draw_indirect_count = vkGetPhysicalDeviceProperties(self.physical_device).limits.maxDrawIndirectCount
+        device_features = VkPhysicalDeviceFeatures(multiDrawIndirect = self.multi_draw_indirect, drawIndirectFirstInstance = self.draw_indirect_first_instance)
         enabled_layers = []
-        device_extensions = [VK_KHR_SWAPCHAIN_EXTENSION_NAME]
+        device_extensions = [VK_KHR_SWAPCHAIN_EXTENSION_NAME] if not self.headless else []
 
         # Creating the info package
         create_info = VkDeviceCreateInfo(queueCreateInfoCount = len(queue_create_info), pQueueCreateInfos = queue_create_info, enabledExtensionCount = len(device_extensions), 
@@ -173,7 +395,7 @@ class Program:
             except:
                 print("ERROR: making Framebuffer!")
 
-    def create_commandbuffers(self):
+    def create_command_pool(self):
         # Command Pool
         pool_info = VkCommandPoolCreateInfo(sType=VK_STRUCTURE_TYPE_COMMAND_POOL_CREATE_INFO, flags=VK_COMMAND_POOL_CREATE_RESET_COMMAND_BUFFER_BIT, 
             queueFamilyIndex=self.queue_family_indices.graphics_family)
@@ -181,9 +403,9 @@ class Program:
             self.command_pool = vkCreateCommandPool(self.logical_device, pool_info, None)
         except:
             print("ERROR:Failed to create command pool")
-            return 
 
-        # Command Buffers
+    def create_commandbuffers(self):
+        # Command Buffers. Each swapchain image gets its own, which is recorded once and then replayed every frame
         allocInfo = VkCommandBufferAllocateInfo(sType=VK_STRUCTURE_TYPE_COMMAND_BUFFER_ALLOCATE_INFO, commandPool=self.command_pool, level=VK_COMMAND_BUFFER_LEVEL_PRIMARY, 
             commandBufferCount=1)
         # for each frame
@@ -191,25 +413,209 @@ class Program:
 
             try:
                 frame.commandbuffer = vkAllocateCommandBuffers(self.logical_device, allocInfo)[0]
+                frame.dirty = True
             except:
                 print("ERROR: Failed to allocate command buffer for frame")
 
+    def create_update_commandbuffers(self):
+
+        # Recorded every frame that has something to copy, once the slot's fence says the previous recording is done
+        alloc_info = VkCommandBufferAllocateInfo(commandPool = self.command_pool, level = VK_COMMAND_BUFFER_LEVEL_PRIMARY, commandBufferCount = self.max_frames_in_flight)
+        self.update_commandbuffers = vkAllocateCommandBuffers(self.logical_device, alloc_info)
+
+    def set_recording_workers(self, worker_count):
+
+        # 0 records everything inline on the calling thread. Secondary command buffers belong to the recorder's pools, so the old recorder
+        # is retired along with them and everything is re-recorded
+        if self.recorder is not None:
+            for frame in self.swapchain_bundle.frames:
+                frame.secondary_commandbuffers = [] # Freed with the recorder's pools
+            self.retire(self.recorder.destroy, "recorder")
+            self.recorder = None
+
+        if worker_count > 0:
+            self.recorder = recording.ParallelRecorder(self.logical_device, self.queue_family_indices.graphics_family, worker_count)
+        self.mark_commandbuffers_dirty()
+
+    def mark_commandbuffers_dirty(self):
+        # Recorded command buffers are replayed as they are, so any change to the state they were recorded with needs to trigger a re-record.
+        # Buffers are only re-recorded right before their image is used again, once the GPU is done with them
+        for frame in self.swapchain_bundle.frames:
+            frame.dirty = True
+
+    def set_clear_color(self, r, g, b, a = 1.0):
+        self.clear_color = (r, g, b, a)
+        self.mark_commandbuffers_dirty()
+
+    def create_meshes(self):
+
+        # Same triangle the OpenGL version draws, with Vulkan's Y axis pointing down
+        triangle_vertices = numpy.array([
+                ((0.0, -0.5), (1.0, 0.0, 0.0)),
+                ((0.5, 0.5), (0.0, 1.0, 0.0)),
+                ((-0.5, 0.5), (0.0, 0.0, 1.0))
+            ], dtype = buffers.VERTEX_DTYPE)
+        triangle_indices = numpy.array([0, 1, 2], dtype = numpy.uint16)
+
+        self.triangle_mesh = self.add_mesh(triangle_vertices, triangle_indices)
+
+    def add_mesh(self, vertices, indices = None):
+
+        # vertices is a structured NumPy array with buffers.VERTEX_DTYPE, the layout the pipeline was made with
+        mesh = buffers.create_mesh(self.allocator, self.command_pool, self.graphics_queue, vertices, indices)
+        self.meshes.append(mesh)
+        self.mark_commandbuffers_dirty()
+        return mesh
+
+    def add_mesh_async(self, vertices, indices = None):
+
+        # Same as add_mesh, but returns right away. The mesh gets drawn from the first frame after its upload finished
+        mesh, uploads = transfers.create_mesh_async(self.uploader, vertices, indices)
+        self.pending_meshes.append((mesh, uploads))
+        self.process_uploads()
+        return mesh
+
+    def process_uploads(self):
+
+        # Called every frame, never waits for the transfer queue
+        self.uploader.poll()
+
+        still_pending = []
+        for mesh, uploads in self.pending_meshes:
+            if all(upload.ready for upload in uploads):
+                self.meshes.append(mesh)
+                self.mark_commandbuffers_dirty()
+            else:
+                still_pending.append((mesh, uploads))
+        self.pending_meshes = still_pending
+
+    def set_mesh_placement(self, mesh, offset = (0.0, 0.0), scale = 1.0):
+
+        # Push constants are recorded into the command buffers, so moving a mesh means re-recording them. Anything that changes
+        # every frame belongs in the frame uniforms instead
+        mesh.draw_data = uniforms.default_draw_data()
+        mesh.draw_data["offset"] = offset
+        mesh.draw_data["scale"] = scale
+        self.mark_commandbuffers_dirty()
+
+    def set_view_transform(self, transform):
+
+        # 4x4 matrix applied to everything drawn. Goes through the frame uniforms, so it takes effect on the next frame without any re-recording
+        self.view_transform = numpy.asarray(transform, dtype = numpy.float32).reshape(4, 4)
+
+    def update_frame_uniforms(self, image_index):
+
+        # The slot of this image is only read by the frame that last rendered to it, which is known to be done. The mapped memory is
+        # coherent, so the writes are visible to the GPU once the frame is submitted
+        slot = self.frame_uniforms.slots[image_index]
+        slot["transform"] = self.view_transform.T
+        slot["time"] = time.perf_counter() - self.start_time
+
+    def set_meshes(self, meshes):
+        # The caller owns meshes that are removed from the list
+        self.meshes = list(meshes)
+        self.mark_commandbuffers_dirty()
+
+    def remove_mesh(self, mesh):
+
+        # Stops drawing mesh and destroys its buffers once the frames in flight are done with them. Instance batches drawing it must be gone first
+        self.meshes = [item for item in self.meshes if item is not mesh]
+        self.mark_commandbuffers_dirty()
+        self.retire(lambda: buffers.destroy_mesh(self.allocator, mesh), "mesh")
+
+    def add_instance_batch(self, instances, capacity = None, mesh = None):
+
+        # instances is a structured NumPy array with batches.INSTANCE_DTYPE, drawn as copies of mesh (the triangle by default)
+        if self.instanced_pipeline_bundle is None:
+            vertex_shader = shader_library.get_spirv_path("shaders/instanced.vert", "shaders/instanced.vert.spv")
+            fragment_shader = shader_library.get_spirv_path("shaders/shader.frag", "shaders/frag.spv")
+            self.instanced_pipeline_bundle = self.pipeline_factory.get(self.pipeline_description(vertex_shader, fragment_shader, batches.instanced_vertex_input()))
+
+        batch = batches.create_instance_batch(self.allocator, self.command_pool, self.graphics_queue, mesh or self.triangle_mesh, instances, capacity)
+        self.instance_batches.append(batch)
+        self.mark_commandbuffers_dirty()
+        return batch
+
+    def update_instance_batch(self, batch, instances):
+
+        # Never waits for the GPU. The instances go into the batch's staging ring and are copied as part of the next frame's submission, so frames
+        # already in flight still draw the old instances. Only a different instance count needs a re-record
+        if batch.staging is None:
+            batches.create_staging_ring(self.allocator, batch, self.max_frames_in_flight + 1)
+        if batches.stream_instance_batch(batch, instances):
+            self.mark_commandbuffers_dirty()
+        if not any(batch is streamed for streamed in self.streamed_batches):
+            self.streamed_batches.append(batch)
+
+    def add_geometry_pool(self, pool):
+
+        # Uploads the meshes added to a draw_list.GeometryPool. The program owns it from then on
+        pool.upload(self.allocator, self.command_pool, self.graphics_queue)
+        self.geometry_pools.append(pool)
+        return pool
+
+    def add_draw_list(self, pool, mesh_ids, instance_counts = 1, first_instances = 0):
+
+        # Draws the meshes of an uploaded pool, one draw per entry of mesh_ids (repeats allowed). Drawn with the mesh pipeline
+        if not self.draw_indirect_first_instance and numpy.any(first_instances):
+            print("ERROR: drawIndirectFirstInstance is NOT supported, firstInstance is ignored!")
+            first_instances = 0
+
+        my_draw_list = draw_list.create_draw_list(self.allocator, self.command_pool, self.graphics_queue, pool, mesh_ids, instance_counts, first_instances)
+        self.draw_lists.append(my_draw_list)
+        self.mark_commandbuffers_dirty()
+        return my_draw_list
+
+    def get_compute(self):
+
+        # Compute shaders over NumPy arrays, see compute.ComputeContext. Runs on the dedicated compute queue when there is one, so it doesn't
+        # queue up behind rendering
+        if self.compute is None:
+            if self.compute_queue is not None:
+                family, queue = self.queue_family_indices.compute_family, self.compute_queue
+            else:
+                family, queue = self.queue_family_indices.graphics_family, self.graphics_queue
+            cache_handle = self.pipeline_cache.cache if self.pipeline_cache is not None else VK_NULL_HANDLE
+            self.compute = compute.ComputeContext(self.logical_device, self.allocator, family, queue, cache_handle, self.shader_cache, self.descriptor_layouts)
+        return self.compute
+
+    def set_pipeline(self, pipeline_bundle):
+
+        # Hot-swaps the pipeline. The previous bundle is destroyed once no frame uses it anymore, unless it came from self.pipeline_factory
+        previous = self.pipeline_bundle
+        self.pipeline_bundle = pipeline_bundle
+        self.mark_commandbuffers_dirty()
+        if previous is not None and previous is not pipeline_bundle and not self.pipeline_factory.owns(previous):
+            self.retire(lambda: pipeline.destroy_graphics_pipeline(self.logical_device, previous), "pipeline")
+
+    def retire(self, destroy, name = None):
+
+        # Anything released at runtime goes through here instead of vkDeviceWaitIdle. Command buffers are marked dirty along with the change,
+        # so no frame after the last submitted one uses the resource anymore
+        self.deletion_queue.push(self.frame_number, destroy, name)
+
     def create_sync_objects(self):
 
-        # Semaphores
         semaphore_info = VkSemaphoreCreateInfo()
-        try:
-            self.image_available_semaphore = vkCreateSemaphore(self.logical_device, semaphore_info, None)
-            self.render_finished_semaphore = vkCreateSemaphore(self.logical_device, semaphore_info, None)
-        except:
-            print("Failed to create semaphore")
-        
+
         # Fence. VK_FENCE_CREATE_SIGNALED_BIT is used so that the fence is created in a signal stage, allowing flow of execution to pass in the first frame
         fence_info = VkFenceCreateInfo(flags = VK_FENCE_CREATE_SIGNALED_BIT)
-        try:
-            self.in_flight_fence =  vkCreateFence(self.logical_device, fence_info, None)
-        except:
-            print("Failed to create fence")
+
+        # One set of semaphores and a fence for each frame slot
+        for i in range(self.max_frames_in_flight):
+            try:
+                self.image_available_semaphores.append(vkCreateSemaphore(self.logical_device, semaphore_info, None))
+                self.render_finished_semaphores.append(vkCreateSemaphore(self.logical_device, semaphore_info, None))
+            except:
+                print("Failed to create semaphore")
+
+            try:
+                self.in_flight_fences.append(vkCreateFence(self.logical_device, fence_info, None))
+            except:
+                print("Failed to create fence")
+
+        # No swapchain image is in use by any frame slot yet
+        self.images_in_flight = [VK_NULL_HANDLE] * len(self.swapchain_bundle.frames)
 
     def record_draw_commands(self, command_buffer, image_index):
 
@@ -224,18 +630,35 @@ class Program:
         renderpass_info = VkRenderPassBeginInfo(sType=VK_STRUCTURE_TYPE_RENDER_PASS_BEGIN_INFO, renderPass=self.pipeline_bundle.renderpass, 
             framebuffer=self.swapchain_bundle.frames[image_index].framebuffer, renderArea = [[0,0], self.swapchain_bundle.extent])
         # Defining clear values to be used by VK_ATTACHMENT_LOAD_OP_CLEAR, which will be used as load operation for the color attachment
-        clear_color = VkClearValue([[1.0, 0.5, 0.25, 1.0]])
+        clear_color = VkClearValue([list(self.clear_color)])
         renderpass_info.clearValueCount = 1
         renderpass_info.pClearValues = ffi.addressof(clear_color)
         
-        # Begin render pass instance
-        vkCmdBeginRenderPass(command_buffer, renderpass_info, VK_SUBPASS_CONTENTS_INLINE)
-        # Bind pipeline
-        vkCmdBindPipeline(command_buffer, VK_PIPELINE_BIND_POINT_GRAPHICS, self.pipeline_bundle.pipeline)
-        # Actual draw command
-        vkCmdDraw(command_buffer, 3,  1,  0, 0)
+        # GPU time is measured around the render pass
+        if self.profiler:
+            self.profiler.write_timestamps_begin(command_buffer, image_index)
+
+        # Large scenes are recorded across threads into secondary command buffers, which is all the render pass contains then
+        draws = self.collect_draws()
+        frame = self.swapchain_bundle.frames[image_index]
+        if self.recorder is not None and self.recorder.should_record(len(draws)):
+            vkCmdBeginRenderPass(command_buffer, renderpass_info, VK_SUBPASS_CONTENTS_SECONDARY_COMMAND_BUFFERS)
+            secondary_commandbuffers = self.recorder.record(frame, self.pipeline_bundle.renderpass, frame.framebuffer, draws, 
+                lambda secondary, draw_slice: self.record_draws(secondary, draw_slice, image_index))
+            vkCmdExecuteCommands(command_buffer, len(secondary_commandbuffers), secondary_commandbuffers)
+        else:
+            # Begin render pass instance
+            vkCmdBeginRenderPass(command_buffer, renderpass_info, VK_SUBPASS_CONTENTS_INLINE)
+            self.record_draws(command_buffer, draws, image_index)
         # End render pass instance
         vkCmdEndRenderPass(command_buffer)
+
+        if self.profiler:
+            self.profiler.write_timestamps_end(command_buffer, image_index)
+
+        # Offscreen images are copied into their readback buffer as part of the same submission
+        if self.headless:
+            offscreen.record_readback(command_buffer, self.swapchain_bundle.frames[image_index], self.swapchain_bundle.extent)
         
         # End recording
         try:
@@ -243,36 +666,286 @@ class Program:
         except:
             print("Failed to end recording command buffer")
     
-    def render(self):
-
-        vkWaitForFences(device = self.logical_device, fenceCount = 1, pFences = [self.in_flight_fence,], waitAll = VK_TRUE, timeout = 1000000000)
-        vkResetFences(device = self.logical_device, fenceCount = 1, pFences = [self.in_flight_fence,])
-
-        # Get next image 
-        vkAcquireNextImageKHR = vkGetDeviceProcAddr(self.logical_device, 'vkAcquireNextImageKHR')
-        image_index = vkAcquireNextImageKHR(device = self.logical_device, swapchain = self.swapchain_bundle.swapchain, timeout = 1000000000, semaphore = self.image_available_semaphore, 
-            fence = VK_NULL_HANDLE)
-
-        # Setup command buffer from intended swapchain image
-        command_buffer = self.swapchain_bundle.frames[image_index].commandbuffer
-        vkResetCommandBuffer(commandBuffer = command_buffer, flags = 0)
+    def collect_draws(self):
+
+        # Everything drawn in the render pass, in order, as (pipeline bundle, mesh / draw list / instance batch) pairs
+        draws = [(self.pipeline_bundle, mesh) for mesh in self.meshes]
+        draws.extend((self.pipeline_bundle, my_draw_list) for my_draw_list in self.draw_lists)
+        draws.extend((self.instanced_pipeline_bundle, batch) for batch in self.instance_batches)
+        return draws
+
+    def record_draws(self, command_buffer, draws, image_index):
+
+        # Records a run of draws, binding the state they need along the way. Used both inline and for secondary command buffers,
+        # which don't inherit any state from their primary
+        current_pipeline = None
+        for pipeline_bundle, item in draws:
+
+            # Bind pipeline
+            if pipeline_bundle is not current_pipeline:
+                vkCmdBindPipeline(command_buffer, VK_PIPELINE_BIND_POINT_GRAPHICS, pipeline_bundle.pipeline)
+
+                # Viewport, scissor and frame uniforms carry over between pipelines, since they are dynamic state and the pipeline layouts
+                # are compatible, so they are only set once
+                if current_pipeline is None:
+                    # Viewport and scissor are dynamic state, so they follow the current extent without rebuilding the pipeline
+                    extent = self.swapchain_bundle.extent
+                    vkCmdSetViewport(command_buffer, 0, 1, [VkViewport(0.0, 0.0, extent.width, extent.height, 0.0, 1.0)])
+                    vkCmdSetScissor(command_buffer, 0, 1, [VkRect2D([0,0], extent)])
+                    # Frame uniforms, the slot of this image is picked with a dynamic offset
+                    self.frame_uniforms.bind(command_buffer, pipeline_bundle.pipeline_layout, image_index)
+                current_pipeline = pipeline_bundle
+
+            # Actual draw commands
+            if isinstance(item, buffers.Mesh):
+                uniforms.push_draw_data(command_buffer, pipeline_bundle.pipeline_layout, item.draw_data if item.draw_data is not None else self.default_draw_data)
+                buffers.record_mesh_draw(command_buffer, item)
+            elif isinstance(item, draw_list.DrawList):
+                # Draw lists take a fixed number of calls no matter how many draws they hold, as long as multiDrawIndirect is supported
+                uniforms.push_draw_data(command_buffer, pipeline_bundle.pipeline_layout, self.default_draw_data)
+                draw_list.record_draw_list(command_buffer, item, self.multi_draw_indirect, self.max_draw_indirect_count)
+            else:
+                batches.record_instance_batch_draw(command_buffer, item)
 
-        # Record Draw Command
-        self.record_draw_commands(command_buffer, image_index)
+    def render(self):
 
-        # Submit command to queue
-        submit_info = VkSubmitInfo(waitSemaphoreCount = 1, pWaitSemaphores = [self.image_available_semaphore,], pWaitDstStageMask=[VK_PIPELINE_STAGE_COLOR_ATTACHMENT_OUTPUT_BIT,],
-            commandBufferCount = 1, pCommandBuffers = [command_buffer,], signalSemaphoreCount = 1, pSignalSemaphores = [self.render_finished_semaphore,])
+        # Phases are timed only when profiling, the local avoids an attribute lookup for each of them
+        frame_profiler = self.profiler
+        if frame_profiler:
+            frame_profiler.begin_frame()
+
+        # Sync objects of the current frame slot
+        in_flight_fence = self.in_flight_fences[self.current_frame]
+        image_available_semaphore = self.image_available_semaphores[self.current_frame]
+        render_finished_semaphore = self.render_finished_semaphores[self.current_frame]
+
+        # Only wait for the frame that last used this slot, the other slots may still be in flight
+        self.dispatch.vkWaitForFences(device = self.logical_device, fenceCount = 1, pFences = [in_flight_fence,], waitAll = VK_TRUE, timeout = 1000000000)
+        if frame_profiler:
+            frame_profiler.mark("cpu_fence_wait")
+
+        # Frames finish in submission order, so everything up to the one this slot submitted is done
+        self.completed_frame = max(self.completed_frame, self.slot_frame_numbers[self.current_frame])
+
+        # Descriptor sets the slot's previous frame used can go, all at once
+        self.frame_descriptors.begin_frame(self.current_frame)
+        self.deletion_queue.flush(self.completed_frame)
+
+        # Meshes whose upload finished start being drawn with this frame
+        if self.pending_meshes or self.uploader.acquiring:
+            self.process_uploads()
+        if frame_profiler:
+            frame_profiler.mark("cpu_housekeeping")
+
+        # Get next image. Offscreen images are owned by their frame slot, so there is nothing to acquire
+        if not self.headless:
+            # Our own pointer is passed in, so the image index can still be read when the call raises VkSuboptimalKhr, which means the image was acquired anyway
+            image_index_pointer = ffi.new('uint32_t*')
+            try:
+                self.dispatch.vkAcquireNextImageKHR(device = self.logical_device, swapchain = self.swapchain_bundle.swapchain, timeout = 1000000000, 
+                    semaphore = image_available_semaphore, fence = VK_NULL_HANDLE, pImageIndex = image_index_pointer)
+            except VkErrorOutOfDateKhr:
+                # The swapchain can't be presented to anymore. Nothing was submitted, so the fence of this slot is still signaled and the frame is skipped
+                self.framebuffer_resized = True
+                self.recreate_swapchain()
+                return
+            except VkSuboptimalKhr:
+                # Still usable, it gets recreated after presenting
+                self.framebuffer_resized = True
+            image_index = image_index_pointer[0]
+        else:
+            image_index = self.current_frame
+
+        # The acquired image may still be used by another frame slot, in which case we wait for that slot to be done with it
+        image_fence = self.images_in_flight[image_index]
+        if image_fence != VK_NULL_HANDLE and image_fence != in_flight_fence:
+            self.dispatch.vkWaitForFences(device = self.logical_device, fenceCount = 1, pFences = [image_fence,], waitAll = VK_TRUE, timeout = 1000000000)
+        self.images_in_flight[image_index] = in_flight_fence
+        if frame_profiler:
+            frame_profiler.mark("cpu_acquire")
+            # The image's previous frame is done, so its GPU timestamps can be read without waiting
+            frame_profiler.collect_gpu(image_index)
+
+        # Written straight into mapped memory, the command buffer doesn't change
+        self.update_frame_uniforms(image_index)
+
+        # Fence is only reset once we know we will submit work that signals it
+        self.dispatch.vkResetFences(device = self.logical_device, fenceCount = 1, pFences = [in_flight_fence,])
+
+        # Command buffer from intended swapchain image. It is only re-recorded when the state it depends on changed,
+        # which is safe at this point since we just made sure no frame slot is using this image anymore
+        frame = self.swapchain_bundle.frames[image_index]
+        command_buffer = frame.commandbuffer
+        if frame.dirty:
+            self.dispatch.vkResetCommandBuffer(commandBuffer = command_buffer, flags = 0)
+            self.record_draw_commands(command_buffer, image_index)
+            frame.dirty = False
+        if frame_profiler:
+            frame_profiler.mark("cpu_record")
+
+        # Streamed instance updates are copied ahead of the draws, in the same submission. This slot's previous recording is done since its fence was waited on
+        command_buffers = [command_buffer,]
+        if self.streamed_batches:
+            update_command_buffer = self.update_commandbuffers[self.current_frame]
+            self.dispatch.vkResetCommandBuffer(commandBuffer = update_command_buffer, flags = 0)
+            batches.record_instance_copies(update_command_buffer, self.streamed_batches)
+            command_buffers.insert(0, update_command_buffer)
+            self.streamed_batches = []
+
+        # Captured frames are copied by a command buffer of their own, submitted along with the frame's so the fence and the semaphore presenting
+        # waits on cover the copy too. Nothing the copy reads can then be destroyed before the frame is known to be done
+        capture_slot = self.capture.acquire(self.frame_number + 1, self.swapchain_bundle.extent) if self.capture else None
+        if capture_slot is not None:
+            command_buffers.append(self.capture.record(capture_slot, frame.image, self.swapchain_bundle.color_format.format, self.final_layout,
+                self.swapchain_bundle.extent))
+
+        # Submit command to queue. Without a swapchain there is no acquire or present to synchronize with, only the fence
+        if not self.headless:
+            submit_info = VkSubmitInfo(waitSemaphoreCount = 1, pWaitSemaphores = [image_available_semaphore,], pWaitDstStageMask=[VK_PIPELINE_STAGE_COLOR_ATTACHMENT_OUTPUT_BIT,],
+                commandBufferCount = len(command_buffers), pCommandBuffers = command_buffers, signalSemaphoreCount = 1, pSignalSemaphores = [render_finished_semaphore,])
+        else:
+            submit_info = VkSubmitInfo(commandBufferCount = len(command_buffers), pCommandBuffers = command_buffers)
         try:
-            vkQueueSubmit(queue = self.graphics_queue, submitCount = 1, pSubmits = submit_info, fence = self.in_flight_fence)
+            self.dispatch.vkQueueSubmit(queue = self.graphics_queue, submitCount = 1, pSubmits = submit_info, fence = in_flight_fence)
+            if capture_slot is not None:
+                self.capture.submitted(capture_slot, in_flight_fence)
         except:
             print("Failed to submit draw commands")
+        if frame_profiler:
+            frame_profiler.mark("cpu_submit")
+            frame_profiler.submitted(image_index)
+
+        self.frame_number += 1
+        self.slot_frame_numbers[self.current_frame] = self.frame_number
+        self.last_image_index = image_index
         
         # Present
-        present_info = VkPresentInfoKHR(waitSemaphoreCount = 1, pWaitSemaphores = [self.render_finished_semaphore,], swapchainCount = 1, pSwapchains = [self.swapchain_bundle.swapchain,],
-            pImageIndices = [image_index,])
-        vkQueuePresentKHR = vkGetDeviceProcAddr(self.logical_device, 'vkQueuePresentKHR')
-        vkQueuePresentKHR(self.present_queue, present_info)
+        if not self.headless:
+            present_info = VkPresentInfoKHR(waitSemaphoreCount = 1, pWaitSemaphores = [render_finished_semaphore,], swapchainCount = 1, pSwapchains = [self.swapchain_bundle.swapchain,],
+                pImageIndices = [image_index,])
+            try:
+                self.dispatch.vkQueuePresentKHR(self.present_queue, present_info)
+            except (VkErrorOutOfDateKhr, VkSuboptimalKhr):
+                self.framebuffer_resized = True
+
+            if self.framebuffer_resized:
+                self.recreate_swapchain()
+        # Hands over the captures that finished, usually the previous frame's
+        if self.capture:
+            self.process_captures()
+        if frame_profiler:
+            frame_profiler.mark("cpu_present")
+            frame_profiler.end_frame()
+
+        # Move on to the next frame slot
+        self.current_frame = (self.current_frame + 1) % self.max_frames_in_flight
+
+    def recreate_swapchain(self):
+
+        # Only the swapchain, its image views and framebuffers depend on the window size. The render pass and pipeline are reused as they are
+        width, height = glfw.get_framebuffer_size(self.window)
+
+        # A minimized window has no size, so there is nothing to render to until it comes back
+        if width == 0 or height == 0:
+            return
+        self.framebuffer_resized = False
+
+        # No vkDeviceWaitIdle here. Frames in flight keep using the old swapchain, which goes to the deletion queue and is destroyed once the GPU is done with them
+        old_bundle = self.swapchain_bundle
+        self.swapchain_bundle = swapchain.create_swapchain(self.dispatch, self.logical_device, self.physical_device, self.vk_surface, width, height, 
+            self.queue_family_indices, old_bundle.swapchain, self.present_policy, self.swapchain_images)
+        if len(self.swapchain_bundle.frames) != len(old_bundle.frames) or self.swapchain_bundle.present_mode != old_bundle.present_mode:
+            print(swapchain.describe_swapchain(self.swapchain_bundle))
+        self.deletion_queue.push(self.frame_number, lambda recorder = self.recorder: self.destroy_retired_swapchain(old_bundle, recorder), "swapchain")
+
+        if self.swapchain_bundle.color_format.format != old_bundle.color_format.format:
+            print("WARNING: Swapchain format changed, the render pass is no longer compatible")
+        if len(self.swapchain_bundle.frames) > self.frame_uniforms.slot_count:
+            self.resize_frame_uniforms(len(self.swapchain_bundle.frames))
+
+        self.create_framebuffers()
+        self.create_commandbuffers()
+
+        # Image i writes uniform slot i, which frames from the old swapchain may still be reading, so their fences are kept. Entries past the new
+        # image count stay too, in case the swapchain grows back into slots that are still in use
+        image_count = len(self.swapchain_bundle.frames)
+        self.images_in_flight = self.images_in_flight + [VK_NULL_HANDLE] * (image_count - len(self.images_in_flight))
+        if self.profiler:
+            self.profiler.reset_images()
+
+    def resize_frame_uniforms(self, slot_count):
+
+        # Each swapchain image has its own slot, so a swapchain with more images needs a bigger ring. The set layout comes from the cache and stays
+        # the same, so pipelines are unaffected. Frames in flight still read the old ring, which is retired, and every command buffer is re-recorded
+        # with the new one
+        old_uniforms = self.frame_uniforms
+        self.frame_uniforms = uniforms.UniformRing(self.logical_device, self.physical_device, self.allocator, slot_count, self.descriptor_layouts,
+            self.descriptor_sets)
+        self.retire(old_uniforms.destroy, "frame uniforms")
+
+        # The profiler's queries are assigned per image the same way
+        if self.profiler:
+            old_pool = self.profiler.resize_images(slot_count)
+            if old_pool is not None:
+                self.retire(lambda: vkDestroyQueryPool(self.logical_device, old_pool, None), "query pool")
+        self.mark_commandbuffers_dirty()
+
+    def destroy_retired_swapchain(self, bundle, recorder):
+
+        # recorder is the one the bundle's secondary command buffers came from, if any
+        command_buffers = [frame.commandbuffer for frame in bundle.frames]
+        vkFreeCommandBuffers(self.logical_device, self.command_pool, len(command_buffers), command_buffers)
+        if recorder is not None:
+            for frame in bundle.frames:
+                recorder.free(frame)
+        swapchain.destroy_swapchain(self.dispatch, self.logical_device, bundle)
+
+    def read_frame(self):
+
+        # Returns the last rendered frame as a (height, width, 4) uint8 NumPy array. Only available when headless
+        if not self.headless or self.last_image_index is None:
+            return None
+
+        # Waits for that frame only, frames submitted after it keep running
+        fence = self.images_in_flight[self.last_image_index]
+        self.dispatch.vkWaitForFences(device = self.logical_device, fenceCount = 1, pFences = [fence,], waitAll = VK_TRUE, timeout = 1000000000)
+
+        # The readback memory gets overwritten the next time this image is rendered, so the caller gets a copy
+        return self.swapchain_bundle.frames[self.last_image_index].readback_pixels.copy()
+
+    def start_capture(self, path = None, ring_size = capture.DEFAULT_RING_SIZE, fps = 60):
+
+        # Captures every frame rendered from now on. With a path, frames are written to it as raw pixels, or as video when it ends in .y4m.
+        # Without one, they are read through self.capture.frames()
+        if not self.swapchain_bundle.capturable:
+            print("ERROR: Swapchain images can't be copied from on this surface, frames can't be captured!")
+            return None
+
+        self.capture = capture.FrameCapture(self.logical_device, self.allocator, self.queue_family_indices.graphics_family, ring_size)
+        if path is not None:
+            self.capture_writer = capture.CaptureWriter(path, fps = fps)
+        return self.capture
+
+    def process_captures(self, wait = False):
+
+        # Queues finished frames for the writer. Without a writer they stay in the ring until self.capture.frames() is iterated
+        self.capture.poll(self.completed_frame)
+        if self.capture_writer is not None:
+            for captured_frame in self.capture.frames(wait):
+                self.capture_writer.write(captured_frame)
+
+    def stop_capture(self):
+
+        # Every frame submitted so far is written before returning
+        if self.capture is None:
+            return
+        if self.capture_writer is not None:
+            self.process_captures(wait = True)
+            self.capture_writer.close()
+            print("Captured {} frames to {}, {} dropped".format(self.capture_writer.frames_written, self.capture_writer.path, self.capture.dropped))
+            self.capture_writer = None
+        self.capture.destroy()
+        self.capture = None
 
     def engine_close(self):
 
@@ -281,51 +954,162 @@ class Program:
 
         print("ENGINE CLOSE")
 
-        vkDestroyFence(self.logical_device, self.in_flight_fence, None)
-        vkDestroySemaphore(self.logical_device, self.image_available_semaphore, None)
-        vkDestroySemaphore(self.logical_device, self.render_finished_semaphore, None)
+        self.stop_capture()
 
-        vkDestroyCommandPool(self.logical_device, self.command_pool, None)
+        # Resources retired at runtime, oldest first. Old swapchains still free their command buffers from the command pool
+        self.deletion_queue.drain()
 
-        vkDestroyPipeline(self.logical_device, self.pipeline_bundle.pipeline, None)
-        vkDestroyPipelineLayout(self.logical_device, self.pipeline_bundle.pipeline_layout, None)
-        vkDestroyRenderPass(self.logical_device, self.pipeline_bundle.renderpass, None)
-        
-        for frame in self.swapchain_bundle.frames:
-            vkDestroyImageView(
-                device = self.logical_device, imageView = frame.image_view, pAllocator = None
-            )
-            vkDestroyFramebuffer(
-                device = self.logical_device, framebuffer = frame.framebuffer, pAllocator = None
-            )
+        for i in range(self.max_frames_in_flight):
+            vkDestroyFence(self.logical_device, self.in_flight_fences[i], None)
+            vkDestroySemaphore(self.logical_device, self.image_available_semaphores[i], None)
+            vkDestroySemaphore(self.logical_device, self.render_finished_semaphores[i], None)
+
+        vkDestroyCommandPool(self.logical_device, self.command_pool, None)
+        if self.profiler:
+            self.profiler.print_report()
+            if self.profiler.dump_path:
+                self.profiler.dump(self.profiler.dump_path)
+            self.profiler.destroy()
+        if self.recorder is not None:
+            self.recorder.destroy()
+
+        for batch in self.instance_batches:
+            batches.destroy_instance_batch(self.allocator, batch)
+
+        for mesh in self.meshes:
+            buffers.destroy_mesh(self.allocator, mesh)
+
+        # Buffers of meshes still uploading are destroyed by the uploader, unless they were already handed over
+        for mesh, uploads in self.pending_meshes:
+            for upload in uploads:
+                if upload.ready:
+                    buffers.destroy_buffer(self.allocator, upload.destination)
+        self.uploader.destroy()
+
+        for my_draw_list in self.draw_lists:
+            draw_list.destroy_draw_list(self.allocator, my_draw_list)
+        for pool in self.geometry_pools:
+            pool.destroy(self.allocator)
+
+        if self.compute is not None:
+            self.compute.destroy()
+
+        # Pipelines from the factory are destroyed along with it, one set through set_pipeline may have been made elsewhere. Background compiles
+        # still use the pipeline cache, so they are waited for first
+        if not self.pipeline_factory.owns(self.pipeline_bundle):
+            pipeline.destroy_graphics_pipeline(self.logical_device, self.pipeline_bundle)
+        self.pipeline_factory.report()
+        self.pipeline_factory.destroy()
+
+        # Pipeline cache is written to disk for the next launch
+        if self.pipeline_cache is not None:
+            self.pipeline_cache.save()
+            self.pipeline_cache.destroy()
+
+        self.shader_cache.destroy()
+        self.frame_uniforms.destroy()
+        self.frame_descriptors.destroy()
+        self.descriptor_allocator.destroy()
+        self.descriptor_layouts.destroy()
         
-        DestroySwapchain = vkGetDeviceProcAddr(self.logical_device, 'vkDestroySwapchainKHR')
-        DestroySwapchain(self.logical_device, self.swapchain_bundle.swapchain, None)
+        if self.headless:
+            offscreen.destroy_offscreen_target(self.logical_device, self.allocator, self.swapchain_bundle)
+        else:
+            swapchain.destroy_swapchain(self.dispatch, self.logical_device, self.swapchain_bundle)
+
+        # All resources are gone at this point, so the allocator can release its memory blocks
+        memory_stats = self.allocator.stats()
+        print("GPU memory: {} bytes used, {} bytes reserved in {} device allocations".format(memory_stats["bytes_used"], memory_stats["bytes_reserved"],
+            memory_stats["device_memory_allocations"]))
+        self.allocator.destroy()
 
         vkDestroyDevice(device = self.logical_device, pAllocator = None)
         
-        DestroySurface = vkGetInstanceProcAddr(self.vk_instance, "vkDestroySurfaceKHR")
-        DestroySurface(self.vk_instance, self.vk_surface, None)
+        if not self.headless:
+            self.dispatch.vkDestroySurfaceKHR(self.vk_instance, self.vk_surface, None)
 
         vkDestroyInstance(self.vk_instance, None)
 
-        glfw.terminate()
+        if not self.headless:
+            glfw.terminate()
+
+        # Only prints anything when the program was created with trace_dispatch = True
+        if self.dispatch.trace:
+            self.dispatch.print_report()
+
+    def run(self, frame_count = None):
+
+        # Without a window there is nothing to close, so headless runs render frame_count frames (DEFAULT_HEADLESS_FRAMES when None) and report
+        # the throughput. With a window, frame_count is ignored and frames are rendered until it is closed
+        if self.headless:
+            if frame_count is None:
+                frame_count = DEFAULT_HEADLESS_FRAMES
+            if frame_count < 1:
+                raise ValueError("Headless runs need at least one frame, got {}".format(frame_count))
+            start = time.perf_counter()
+            for i in range(frame_count):
+                self.render()
+                if not self.first_frame_reported:
+                    self.report_first_frame()
+            vkDeviceWaitIdle(self.logical_device)
+            elapsed = time.perf_counter() - start
+            print("Rendered {} frames in {:.3f}s ({:.1f} FPS)".format(frame_count, elapsed, frame_count / elapsed))
+            return
 
-    def run(self):
         while not glfw.window_should_close(self.window):
 
             # Needs to be called in order to be able to interact with window buttons, such as the close button
             glfw.poll_events() 
 
+            # While minimized, the swapchain can't be recreated, so we just wait for the window to come back
+            if self.framebuffer_resized:
+                self.recreate_swapchain()
+                if self.framebuffer_resized:
+                    glfw.wait_events()
+                    continue
+
+            # render() can return before submitting anything, so the first frame is the first one that actually went out
             self.render()
+            if not self.first_frame_reported and self.frame_number > 0:
+                self.report_first_frame()
+
+    def report_first_frame(self):
+
+        # Time to first frame counts from the first import, and ends once the GPU finished it
+        self.first_frame_reported = True
+        vkDeviceWaitIdle(self.logical_device)
+        self.startup_timeline.mark("first frame")
+        print("Time to first frame: {:.1f} ms".format(self.startup_timeline.total() * 1000.0))
 
 
 #MAIN ENTRY POINT   
 if __name__ == "__main__":
-    
-    my_program = Program()
 
-    my_program.run()
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--headless", action = "store_true", help = "Render offscreen, without a window. Works on software drivers such as lavapipe")
+    parser.add_argument("--frames", type = int, default = DEFAULT_HEADLESS_FRAMES, help = "Number of frames to render when headless")
+    parser.add_argument("--frames-in-flight", type = int, default = 2)
+    parser.add_argument("--recording-workers", type = int, default = 0, help = "Threads recording secondary command buffers, 0 records inline")
+    parser.add_argument("--present-policy", default = "low_latency", choices = sorted(swapchain.PRESENT_POLICIES))
+    parser.add_argument("--swapchain-images", type = int, default = None, help = "Requested swapchain image count, clamped to what the surface allows")
+    parser.add_argument("--profile", action = "store_true", help = "Time each phase of a frame on the CPU, and the render pass on the GPU")
+    parser.add_argument("--profile-dump", default = None, help = "Writes the profile to this .csv or .json file, at exit and every --profile-dump-every frames")
+    parser.add_argument("--profile-dump-every", type = int, default = 0)
+    parser.add_argument("--init-workers", type = int, default = 4, help = "Threads running independent startup steps, 0 runs them in order")
+    parser.add_argument("--capture", default = None, help = "Writes every frame to this file, as Y4M video when it ends in .y4m, raw RGBA/BGRA otherwise")
+    parser.add_argument("--device", default = None, help = "Physical device index or part of its name. Also read from " + device_selection.DEVICE_ENVIRONMENT_VARIABLE)
+    args = parser.parse_args()
+    
+    my_program = Program(max_frames_in_flight = args.frames_in_flight, headless = args.headless, recording_workers = args.recording_workers,
+        physical_device_selection = args.device, present_policy = args.present_policy, swapchain_images = args.swapchain_images,
+        profile = args.profile or args.profile_dump is not None, profile_dump = args.profile_dump, profile_dump_every = args.profile_dump_every,
+        init_workers = args.init_workers)
+    if args.capture:
+        my_program.start_capture(args.capture)
+
+    my_program.run(args.frames)
     
     # Executed when main loop that gets kicked off in run() stops
     my_program.engine_close()
\ No newline at end of file
@@ -0,0 +1,15 @@
+from vulkan import *
+
+def find_memory_type(physical_device, type_filter, properties):
+
+    # type_filter comes from VkMemoryRequirements.memoryTypeBits, with one bit set for every memory type the resource can live in.
+    # From those, we pick the first one that also has all the property flags we asked for
+    memory_properties = vkGetPhysicalDeviceMemoryProperties(physical_device)
+
+    for i in range(memory_properties.memoryTypeCount):
+        supported = type_filter & (1 << i)
+        has_properties = (memory_properties.memoryTypes[i].propertyFlags & properties) == properties
+        if supported and has_properties:
+            return i
+
+    return None
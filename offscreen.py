@@ -0,0 +1,96 @@
+import numpy
+
+from vulkan import *
+
+# Pixels are read back as 8 bit RGBA
+DEFAULT_IMAGE_FORMAT = VK_FORMAT_R8G8B8A8_UNORM
+
+class OffscreenFrame:
+
+    def __init__(self):
+
+        self.image = None
+        self.image_allocation = None
+        self.image_view = None
+        self.framebuffer = None
+        self.commandbuffer = None
+        self.secondary_commandbuffers = [] # Recorded by a recording.ParallelRecorder, when one is in use
+        self.dirty = True # Command buffer needs to be (re)recorded before being submitted
+
+        # Host visible buffer the rendered image gets copied into, kept mapped for the whole lifetime of the frame
+        self.readback_buffer = None
+        self.readback_allocation = None
+        self.readback_pixels = None # NumPy view of the mapped readback memory, shaped (height, width, 4)
+
+class OffscreenBundle:
+
+    # Mirrors SwapChainBundle, so the rest of the engine (framebuffers, command buffers, render loop) can work the same way with or without a window
+    def __init__(self):
+
+        self.frames = [] # Populated with OffscreenFrames
+        self.color_format = None # Same type as the one the swapchain reports, a VkSurfaceFormatKHR
+        self.extent = None
+        self.capturable = True # Images can always be copied from, same flag as SwapChainBundle
+
+def create_offscreen_target(logicalDevice, allocator, width, height, image_count, image_format = DEFAULT_IMAGE_FORMAT):
+
+    my_bundle = OffscreenBundle()
+    my_bundle.color_format = VkSurfaceFormatKHR(format = image_format, colorSpace = VK_COLOR_SPACE_SRGB_NONLINEAR_KHR)
+    my_bundle.extent = VkExtent2D(width, height)
+
+    # Pixels are read back as 8 bit RGBA
+    readback_size = width * height * 4
+
+    for i in range(image_count):
+
+        offscreen_frame = OffscreenFrame()
+
+        # Image we render into. It plays the role of a swapchain image, so it is a color attachment that can also be copied from
+        image_info = VkImageCreateInfo(imageType = VK_IMAGE_TYPE_2D, format = image_format, extent = VkExtent3D(width, height, 1), mipLevels = 1, arrayLayers = 1,
+            samples = VK_SAMPLE_COUNT_1_BIT, tiling = VK_IMAGE_TILING_OPTIMAL, usage = VK_IMAGE_USAGE_COLOR_ATTACHMENT_BIT | VK_IMAGE_USAGE_TRANSFER_SRC_BIT,
+            sharingMode = VK_SHARING_MODE_EXCLUSIVE, initialLayout = VK_IMAGE_LAYOUT_UNDEFINED)
+        offscreen_frame.image, offscreen_frame.image_allocation = allocator.create_image(image_info, VK_MEMORY_PROPERTY_DEVICE_LOCAL_BIT)
+
+        # Image View, same setup as the ones made for swapchain images
+        components = VkComponentMapping(r = VK_COMPONENT_SWIZZLE_IDENTITY, g = VK_COMPONENT_SWIZZLE_IDENTITY, b = VK_COMPONENT_SWIZZLE_IDENTITY, a = VK_COMPONENT_SWIZZLE_IDENTITY)
+        subresourceRange = VkImageSubresourceRange(aspectMask = VK_IMAGE_ASPECT_COLOR_BIT, baseMipLevel = 0, levelCount = 1, baseArrayLayer = 0, layerCount = 1)
+        view_info = VkImageViewCreateInfo(image = offscreen_frame.image, viewType = VK_IMAGE_VIEW_TYPE_2D, format = image_format, components = components,
+            subresourceRange = subresourceRange)
+        offscreen_frame.image_view = vkCreateImageView(device = logicalDevice, pCreateInfo = view_info, pAllocator = None)
+
+        # Readback buffer. Cached memory is preferred since the CPU reads every byte of it
+        host_visible = VK_MEMORY_PROPERTY_HOST_VISIBLE_BIT | VK_MEMORY_PROPERTY_HOST_COHERENT_BIT
+        offscreen_frame.readback_buffer, offscreen_frame.readback_allocation = allocator.create_buffer(readback_size, VK_BUFFER_USAGE_TRANSFER_DST_BIT, 
+            host_visible | VK_MEMORY_PROPERTY_HOST_CACHED_BIT, host_visible)
+
+        # The allocator keeps host visible memory mapped, so a NumPy view over it means reading a frame back is a single memcpy
+        offscreen_frame.readback_pixels = numpy.frombuffer(offscreen_frame.readback_allocation.mapped, dtype = numpy.uint8, count = readback_size).reshape(height, width, 4)
+
+        my_bundle.frames.append(offscreen_frame)
+
+    return my_bundle
+
+def record_readback(command_buffer, frame, extent):
+
+    # The render pass leaves the image in VK_IMAGE_LAYOUT_TRANSFER_SRC_OPTIMAL, and its outgoing dependency orders the copy after the color writes
+    region = VkBufferImageCopy(bufferOffset = 0, bufferRowLength = 0, bufferImageHeight = 0,
+        imageSubresource = VkImageSubresourceLayers(aspectMask = VK_IMAGE_ASPECT_COLOR_BIT, mipLevel = 0, baseArrayLayer = 0, layerCount = 1),
+        imageOffset = VkOffset3D(0, 0, 0), imageExtent = VkExtent3D(extent.width, extent.height, 1))
+    vkCmdCopyImageToBuffer(command_buffer, frame.image, VK_IMAGE_LAYOUT_TRANSFER_SRC_OPTIMAL, frame.readback_buffer, 1, [region,])
+
+    # Makes the transfer writes visible to the host once the frame's fence is signaled
+    barrier = VkBufferMemoryBarrier(srcAccessMask = VK_ACCESS_TRANSFER_WRITE_BIT, dstAccessMask = VK_ACCESS_HOST_READ_BIT, srcQueueFamilyIndex = VK_QUEUE_FAMILY_IGNORED,
+        dstQueueFamilyIndex = VK_QUEUE_FAMILY_IGNORED, buffer = frame.readback_buffer, offset = 0, size = VK_WHOLE_SIZE)
+    vkCmdPipelineBarrier(command_buffer, VK_PIPELINE_STAGE_TRANSFER_BIT, VK_PIPELINE_STAGE_HOST_BIT, 0, 0, None, 1, [barrier,], 0, None)
+
+def destroy_offscreen_target(logicalDevice, allocator, bundle):
+
+    for frame in bundle.frames:
+        frame.readback_pixels = None
+        vkDestroyBuffer(logicalDevice, frame.readback_buffer, None)
+        allocator.free(frame.readback_allocation)
+
+        vkDestroyFramebuffer(logicalDevice, frame.framebuffer, None)
+        vkDestroyImageView(logicalDevice, frame.image_view, None)
+        vkDestroyImage(logicalDevice, frame.image, None)
+        allocator.free(frame.image_allocation)
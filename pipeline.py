@@ -1,27 +1,40 @@
 from vulkan import *
 
+# Shader modules are created from memory mapped SPIR-V
+from shader_library import create_shader_module
+
 class OuputBundle:
 
-    def __init__(self, pipeline_layout, render_pass, pipeline):
+    def __init__(self, pipeline_layout, render_pass, pipeline, shader_cache=None, shader_files=()):
 
         self.pipeline_layout = pipeline_layout
         self.renderpass = render_pass
         self.pipeline = pipeline
 
-def create_shader_module(device, filename):
+        # Shader modules held in a ShaderModuleCache on behalf of this pipeline, released when it gets destroyed
+        self.shader_cache = shader_cache
+        self.shader_files = list(shader_files)
+
+class ComputeBundle:
+
+    def __init__(self, pipeline_layout, pipeline, set_layout, binding_count, push_constant_size, shader_cache=None, shader_files=(), owns_set_layout=True):
 
-    code = None
-    with open(filename, 'rb') as file:
-        code = file.read()
+        self.pipeline_layout = pipeline_layout
+        self.pipeline = pipeline
+        self.set_layout = set_layout # Storage buffers at bindings 0 to binding_count - 1, in set 0
+        self.owns_set_layout = owns_set_layout # False when the layout belongs to a descriptors.DescriptorLayoutCache
+        self.binding_count = binding_count
+        self.push_constant_size = push_constant_size
 
-    create_info = VkShaderModuleCreateInfo(sType=VK_STRUCTURE_TYPE_SHADER_MODULE_CREATE_INFO, codeSize=len(code), pCode=code)
-    return vkCreateShaderModule(device = device, pCreateInfo = create_info, pAllocator = None)
+        self.shader_cache = shader_cache
+        self.shader_files = list(shader_files)
 
-def create_render_pass(device, swapchain_image_format):
+def create_render_pass(device, swapchain_image_format, final_layout=VK_IMAGE_LAYOUT_PRESENT_SRC_KHR):
     
-    # We will only be using a color attachement
+    # We will only be using a color attachement. The final layout is the one expected by whoever consumes the image after rendering, the presentation
+    # engine by default or a transfer when rendering offscreen
     color_attachment = VkAttachmentDescription(format=swapchain_image_format, samples=VK_SAMPLE_COUNT_1_BIT, loadOp=VK_ATTACHMENT_LOAD_OP_CLEAR, storeOp=VK_ATTACHMENT_STORE_OP_STORE,
-        stencilLoadOp=VK_ATTACHMENT_LOAD_OP_DONT_CARE, stencilStoreOp=VK_ATTACHMENT_STORE_OP_DONT_CARE, initialLayout=VK_IMAGE_LAYOUT_UNDEFINED, finalLayout=VK_IMAGE_LAYOUT_PRESENT_SRC_KHR)
+        stencilLoadOp=VK_ATTACHMENT_LOAD_OP_DONT_CARE, stencilStoreOp=VK_ATTACHMENT_STORE_OP_DONT_CARE, initialLayout=VK_IMAGE_LAYOUT_UNDEFINED, finalLayout=final_layout)
 
     # Ref is used by subpasses to get the info defined in color attachment up above
     color_attachment_ref = VkAttachmentReference(attachment=0, layout=VK_IMAGE_LAYOUT_COLOR_ATTACHMENT_OPTIMAL)
@@ -29,38 +42,71 @@ def create_render_pass(device, swapchain_image_format):
     # Our subpass will only have a color attachment, but it may have a depth stencil attachment for example
     subpass = VkSubpassDescription(pipelineBindPoint=VK_PIPELINE_BIND_POINT_GRAPHICS, colorAttachmentCount=1, pColorAttachments=color_attachment_ref)
 
+    # Dependencies. The incoming one makes the layout transition at the start wait for the image to be acquired (the semaphore wait is at the color
+    # attachment output stage). The implicit outgoing one only waits on BOTTOM_OF_PIPE, which nothing can chain with, so ours makes the color writes
+    # and the final layout transition visible to transfers (readbacks, captures) and to barriers at the color attachment output stage
+    incoming = VkSubpassDependency(srcSubpass=VK_SUBPASS_EXTERNAL, dstSubpass=0, srcStageMask=VK_PIPELINE_STAGE_COLOR_ATTACHMENT_OUTPUT_BIT, srcAccessMask=0,
+        dstStageMask=VK_PIPELINE_STAGE_COLOR_ATTACHMENT_OUTPUT_BIT, dstAccessMask=VK_ACCESS_COLOR_ATTACHMENT_WRITE_BIT)
+    outgoing = VkSubpassDependency(srcSubpass=0, dstSubpass=VK_SUBPASS_EXTERNAL, srcStageMask=VK_PIPELINE_STAGE_COLOR_ATTACHMENT_OUTPUT_BIT, 
+        srcAccessMask=VK_ACCESS_COLOR_ATTACHMENT_WRITE_BIT, dstStageMask=VK_PIPELINE_STAGE_COLOR_ATTACHMENT_OUTPUT_BIT | VK_PIPELINE_STAGE_TRANSFER_BIT,
+        dstAccessMask=VK_ACCESS_TRANSFER_READ_BIT if final_layout == VK_IMAGE_LAYOUT_TRANSFER_SRC_OPTIMAL else 0)
+
     # Render Pass Info. Render pass holds more info needed for the pipeline
-    render_pass_info = VkRenderPassCreateInfo(sType=VK_STRUCTURE_TYPE_RENDER_PASS_CREATE_INFO, attachmentCount=1, pAttachments=color_attachment, subpassCount=1, pSubpasses=subpass)
+    render_pass_info = VkRenderPassCreateInfo(sType=VK_STRUCTURE_TYPE_RENDER_PASS_CREATE_INFO, attachmentCount=1, pAttachments=color_attachment, subpassCount=1, pSubpasses=subpass,
+        dependencyCount=2, pDependencies=[incoming, outgoing])
 
     return vkCreateRenderPass(device, render_pass_info, None)
 
-def create_graphics_pipeline(device, swapchain_image_format, swapchain_extent, vertex_filepath, fragment_filepath):
-
-    # Vertex Input. This structure describes the format of the vertex data in case any data is passed onto the vertex shader
-    vertex_input_info = VkPipelineVertexInputStateCreateInfo(sType=VK_STRUCTURE_TYPE_PIPELINE_VERTEX_INPUT_STATE_CREATE_INFO, vertexBindingDescriptionCount=0, 
-        vertexAttributeDescriptionCount=0)
+# Color blending create_pipeline_info supports, as (source factor, destination factor). None writes the fragment color as it is
+BLEND_MODES = {
+    None: None,
+    "alpha": (VK_BLEND_FACTOR_SRC_ALPHA, VK_BLEND_FACTOR_ONE_MINUS_SRC_ALPHA),
+    "additive": (VK_BLEND_FACTOR_ONE, VK_BLEND_FACTOR_ONE),
+}
+
+def create_pipeline_layout(device, set_layouts=(), push_constant_ranges=()):
+
+    # Pipeline Layout holds info about values that can be updated at draw time. Descriptor sets (such as uniforms.UniformRing) are bound per frame,
+    # push constants carry small per draw data
+    set_layouts = list(set_layouts)
+    push_constant_ranges = list(push_constant_ranges)
+    pipeline_layout_info = VkPipelineLayoutCreateInfo(sType=VK_STRUCTURE_TYPE_PIPELINE_LAYOUT_CREATE_INFO, setLayoutCount = len(set_layouts), 
+        pSetLayouts = set_layouts or None, pushConstantRangeCount = len(push_constant_ranges), pPushConstantRanges = push_constant_ranges or None)
+    return vkCreatePipelineLayout(device=device, pCreateInfo=pipeline_layout_info, pAllocator=None)
+
+def create_pipeline_info(vertex_shader_module, fragment_shader_module, pipeline_layout, render_pass, vertex_input=None, topology=VK_PRIMITIVE_TOPOLOGY_TRIANGLE_LIST,
+    cull_mode=VK_CULL_MODE_BACK_BIT, front_face=VK_FRONT_FACE_CLOCKWISE, polygon_mode=VK_POLYGON_MODE_FILL, blend_mode=None):
+
+    # Vertex Input. This structure describes the format of the vertex data in case any data is passed onto the vertex shader, see buffers.vertex_input_from_dtype
+    if vertex_input is not None:
+        vertex_input_info = VkPipelineVertexInputStateCreateInfo(sType=VK_STRUCTURE_TYPE_PIPELINE_VERTEX_INPUT_STATE_CREATE_INFO, 
+            vertexBindingDescriptionCount=len(vertex_input.bindings), pVertexBindingDescriptions=vertex_input.bindings, 
+            vertexAttributeDescriptionCount=len(vertex_input.attributes), pVertexAttributeDescriptions=vertex_input.attributes)
+    else:
+        vertex_input_info = VkPipelineVertexInputStateCreateInfo(sType=VK_STRUCTURE_TYPE_PIPELINE_VERTEX_INPUT_STATE_CREATE_INFO, vertexBindingDescriptionCount=0, 
+            vertexAttributeDescriptionCount=0)
 
     #Input Assembly
-    input_assembly_info = VkPipelineInputAssemblyStateCreateInfo(sType=VK_STRUCTURE_TYPE_PIPELINE_INPUT_ASSEMBLY_STATE_CREATE_INFO, topology=VK_PRIMITIVE_TOPOLOGY_TRIANGLE_LIST,
+    input_assembly_info = VkPipelineInputAssemblyStateCreateInfo(sType=VK_STRUCTURE_TYPE_PIPELINE_INPUT_ASSEMBLY_STATE_CREATE_INFO, topology=topology,
         primitiveRestartEnable=VK_FALSE)
     
     # Vertex Shader. The module struct wraps our custom shader code
-    vertex_shader_module = create_shader_module(device, vertex_filepath)
     vertex_shader_info = VkPipelineShaderStageCreateInfo(sType=VK_STRUCTURE_TYPE_PIPELINE_SHADER_STAGE_CREATE_INFO, stage=VK_SHADER_STAGE_VERTEX_BIT, module=vertex_shader_module,
         pName="main")
 
-    # Viewport. Defines how stuff gets rendered from a framebuffer 
-    viewport = VkViewport(0.0, 0.0, swapchain_extent.width, swapchain_extent.height, 0.0, 1.0)
-    scissor = VkRect2D([0,0], swapchain_extent)
-    viewport_state_info = VkPipelineViewportStateCreateInfo(sType=VK_STRUCTURE_TYPE_PIPELINE_VIEWPORT_STATE_CREATE_INFO, viewportCount=1, pViewports=viewport, scissorCount=1, 
-        pScissors=scissor)
+    # Viewport. Defines how stuff gets rendered from a framebuffer. Both viewport and scissor are dynamic state, set when recording commands,
+    # so the pipeline doesn't depend on the swapchain extent and survives a window resize
+    viewport_state_info = VkPipelineViewportStateCreateInfo(sType=VK_STRUCTURE_TYPE_PIPELINE_VIEWPORT_STATE_CREATE_INFO, viewportCount=1, pViewports=None, scissorCount=1, 
+        pScissors=None)
+    dynamic_states = [VK_DYNAMIC_STATE_VIEWPORT, VK_DYNAMIC_STATE_SCISSOR]
+    dynamic_state_info = VkPipelineDynamicStateCreateInfo(sType=VK_STRUCTURE_TYPE_PIPELINE_DYNAMIC_STATE_CREATE_INFO, dynamicStateCount=len(dynamic_states), 
+        pDynamicStates=dynamic_states)
 
     # Rasterizer. Creates the fragments
     raterizer_info = VkPipelineRasterizationStateCreateInfo(sType=VK_STRUCTURE_TYPE_PIPELINE_RASTERIZATION_STATE_CREATE_INFO, depthClampEnable=VK_FALSE, rasterizerDiscardEnable=VK_FALSE,
-        polygonMode=VK_POLYGON_MODE_FILL,lineWidth=1.0,cullMode=VK_CULL_MODE_BACK_BIT,frontFace=VK_FRONT_FACE_CLOCKWISE, depthBiasEnable=VK_FALSE)
+        polygonMode=polygon_mode,lineWidth=1.0,cullMode=cull_mode,frontFace=front_face, depthBiasEnable=VK_FALSE)
 
     # Fragment Shader 
-    fragment_shader_module = create_shader_module(device, fragment_filepath)
     fragment_shader_info = VkPipelineShaderStageCreateInfo(sType=VK_STRUCTURE_TYPE_PIPELINE_SHADER_STAGE_CREATE_INFO, stage=VK_SHADER_STAGE_FRAGMENT_BIT, module=fragment_shader_module,
         pName="main")
 
@@ -68,30 +114,106 @@ def create_graphics_pipeline(device, swapchain_image_format, swapchain_extent, v
     multisampling_info = VkPipelineMultisampleStateCreateInfo(sType=VK_STRUCTURE_TYPE_PIPELINE_MULTISAMPLE_STATE_CREATE_INFO, sampleShadingEnable=VK_FALSE,
         rasterizationSamples=VK_SAMPLE_COUNT_1_BIT)
 
-    #Color Blending. Currently disabled, but can be used to blend the color output from the fragment shader with a color already on the framebuffer.
-    color_blend_attachment = VkPipelineColorBlendAttachmentState(colorWriteMask=VK_COLOR_COMPONENT_R_BIT | VK_COLOR_COMPONENT_G_BIT | VK_COLOR_COMPONENT_B_BIT | VK_COLOR_COMPONENT_A_BIT,
-        blendEnable=VK_FALSE )
+    #Color Blending. Disabled by default, blend_mode picks one of BLEND_MODES to blend the color output from the fragment shader with a color already on the framebuffer.
+    color_write_mask = VK_COLOR_COMPONENT_R_BIT | VK_COLOR_COMPONENT_G_BIT | VK_COLOR_COMPONENT_B_BIT | VK_COLOR_COMPONENT_A_BIT
+    blend_factors = BLEND_MODES[blend_mode]
+    if blend_factors is None:
+        color_blend_attachment = VkPipelineColorBlendAttachmentState(colorWriteMask=color_write_mask, blendEnable=VK_FALSE )
+    else:
+        color_blend_attachment = VkPipelineColorBlendAttachmentState(colorWriteMask=color_write_mask, blendEnable=VK_TRUE, srcColorBlendFactor=blend_factors[0],
+            dstColorBlendFactor=blend_factors[1], colorBlendOp=VK_BLEND_OP_ADD, srcAlphaBlendFactor=VK_BLEND_FACTOR_ONE, dstAlphaBlendFactor=blend_factors[1],
+            alphaBlendOp=VK_BLEND_OP_ADD)
     color_blend_info = VkPipelineColorBlendStateCreateInfo(sType=VK_STRUCTURE_TYPE_PIPELINE_COLOR_BLEND_STATE_CREATE_INFO, logicOpEnable=VK_FALSE, attachmentCount=1, 
         pAttachments=color_blend_attachment)
 
-    # Pipeline Layout holds info about values that can be updated at draw time
-    pipeline_layout_info = VkPipelineLayoutCreateInfo(sType=VK_STRUCTURE_TYPE_PIPELINE_LAYOUT_CREATE_INFO, pushConstantRangeCount = 0, setLayoutCount = 0)
-    pipeline_layout = vkCreatePipelineLayout(device=device, pCreateInfo=pipeline_layout_info, pAllocator=None)
-
-    # Renderpass
-    render_pass = create_render_pass(device, swapchain_image_format)
-
     # Creating Pipeline info
     shader_stages = [vertex_shader_info, fragment_shader_info]
-    pipelineInfo = VkGraphicsPipelineCreateInfo(sType=VK_STRUCTURE_TYPE_GRAPHICS_PIPELINE_CREATE_INFO,stageCount=2, pStages=shader_stages, pVertexInputState=vertex_input_info, 
+    return VkGraphicsPipelineCreateInfo(sType=VK_STRUCTURE_TYPE_GRAPHICS_PIPELINE_CREATE_INFO,stageCount=2, pStages=shader_stages, pVertexInputState=vertex_input_info, 
         pInputAssemblyState=input_assembly_info, pViewportState=viewport_state_info, pRasterizationState=raterizer_info, pMultisampleState=multisampling_info, pDepthStencilState=None,
-        pColorBlendState=color_blend_info, layout=pipeline_layout, renderPass=render_pass, subpass=0)
+        pColorBlendState=color_blend_info, pDynamicState=dynamic_state_info, layout=pipeline_layout, renderPass=render_pass, subpass=0)
+
+def create_graphics_pipeline(device, swapchain_image_format, vertex_filepath, fragment_filepath, final_layout=VK_IMAGE_LAYOUT_PRESENT_SRC_KHR, 
+    pipeline_cache=VK_NULL_HANDLE, shader_cache=None, vertex_input=None, set_layouts=(), push_constant_ranges=()):
+
+    # With a shader cache, modules are shared with any other pipeline that uses the same SPIR-V
+    vertex_shader_module = shader_cache.acquire(vertex_filepath) if shader_cache else create_shader_module(device, vertex_filepath)
+    fragment_shader_module = shader_cache.acquire(fragment_filepath) if shader_cache else create_shader_module(device, fragment_filepath)
+
+    pipeline_layout = create_pipeline_layout(device, set_layouts, push_constant_ranges)
+
+    # Renderpass
+    render_pass = create_render_pass(device, swapchain_image_format, final_layout)
+
+    pipelineInfo = create_pipeline_info(vertex_shader_module, fragment_shader_module, pipeline_layout, render_pass, vertex_input)
+
+    # Create Pipeline. With a pipeline cache, the driver can skip compiling anything it has already seen in a previous run
+    pipeline = vkCreateGraphicsPipelines(device, pipeline_cache, 1, pipelineInfo, None)[0]
 
-    # Create Pipeline
-    pipeline = vkCreateGraphicsPipelines(device, VK_NULL_HANDLE, 1, pipelineInfo, None)[0]
+    # Shader Modules are not needed anymore, unless they are shared through the cache
+    if shader_cache:
+        return OuputBundle(pipeline_layout = pipeline_layout, render_pass = render_pass, pipeline = pipeline, shader_cache = shader_cache, 
+            shader_files = [vertex_filepath, fragment_filepath])
 
-    # Shader Modules are not needed anymore
     vkDestroyShaderModule(device, vertex_shader_module, None)
     vkDestroyShaderModule(device, fragment_shader_module, None)
 
-    return OuputBundle(pipeline_layout = pipeline_layout, render_pass = render_pass, pipeline = pipeline)
\ No newline at end of file
+    return OuputBundle(pipeline_layout = pipeline_layout, render_pass = render_pass, pipeline = pipeline)
+
+def destroy_graphics_pipeline(device, bundle):
+
+    vkDestroyPipeline(device, bundle.pipeline, None)
+    vkDestroyPipelineLayout(device, bundle.pipeline_layout, None)
+    vkDestroyRenderPass(device, bundle.renderpass, None)
+
+    # Gives back the shader modules this pipeline was holding
+    if bundle.shader_cache:
+        for filename in bundle.shader_files:
+            bundle.shader_cache.release(filename)
+
+def storage_buffer_bindings(binding_count, stages=VK_SHADER_STAGE_COMPUTE_BIT):
+    # One storage buffer per binding, numbered from 0
+    return [(i, VK_DESCRIPTOR_TYPE_STORAGE_BUFFER, 1, stages) for i in range(binding_count)]
+
+def create_storage_buffer_set_layout(device, binding_count, stages=VK_SHADER_STAGE_COMPUTE_BIT):
+
+    bindings = [VkDescriptorSetLayoutBinding(binding=binding, descriptorType=descriptor_type, descriptorCount=count, stageFlags=binding_stages)
+        for binding, descriptor_type, count, binding_stages in storage_buffer_bindings(binding_count, stages)]
+    layout_info = VkDescriptorSetLayoutCreateInfo(bindingCount=len(bindings), pBindings=bindings or None)
+    return vkCreateDescriptorSetLayout(device, layout_info, None)
+
+def create_compute_pipeline(device, compute_filepath, binding_count, push_constant_size=0, pipeline_cache=VK_NULL_HANDLE, shader_cache=None, layout_cache=None):
+
+    # Compute Shader. Same module handling as the graphics stages
+    compute_shader_module = shader_cache.acquire(compute_filepath) if shader_cache else create_shader_module(device, compute_filepath)
+    compute_shader_info = VkPipelineShaderStageCreateInfo(sType=VK_STRUCTURE_TYPE_PIPELINE_SHADER_STAGE_CREATE_INFO, stage=VK_SHADER_STAGE_COMPUTE_BIT, module=compute_shader_module,
+        pName="main")
+
+    # Pipeline Layout. The storage buffers are the shader's inputs and outputs, push constants carry small parameters
+    # With a layout cache, pipelines taking the same number of buffers share one set layout
+    set_layout = layout_cache.get(storage_buffer_bindings(binding_count)) if layout_cache else create_storage_buffer_set_layout(device, binding_count)
+    push_constant_ranges = [VkPushConstantRange(stageFlags=VK_SHADER_STAGE_COMPUTE_BIT, offset=0, size=push_constant_size)] if push_constant_size else []
+    pipeline_layout_info = VkPipelineLayoutCreateInfo(sType=VK_STRUCTURE_TYPE_PIPELINE_LAYOUT_CREATE_INFO, setLayoutCount=1, pSetLayouts=[set_layout,],
+        pushConstantRangeCount=len(push_constant_ranges), pPushConstantRanges=push_constant_ranges or None)
+    pipeline_layout = vkCreatePipelineLayout(device=device, pCreateInfo=pipeline_layout_info, pAllocator=None)
+
+    # Create Pipeline. No render pass or fixed function state, just the shader and its layout
+    pipelineInfo = VkComputePipelineCreateInfo(sType=VK_STRUCTURE_TYPE_COMPUTE_PIPELINE_CREATE_INFO, stage=compute_shader_info, layout=pipeline_layout)
+    pipeline = vkCreateComputePipelines(device, pipeline_cache, 1, pipelineInfo, None)[0]
+
+    # Shader Module is not needed anymore, unless it is shared through the cache
+    if shader_cache:
+        return ComputeBundle(pipeline_layout, pipeline, set_layout, binding_count, push_constant_size, shader_cache, [compute_filepath,], not layout_cache)
+
+    vkDestroyShaderModule(device, compute_shader_module, None)
+    return ComputeBundle(pipeline_layout, pipeline, set_layout, binding_count, push_constant_size, owns_set_layout=not layout_cache)
+
+def destroy_compute_pipeline(device, bundle):
+
+    vkDestroyPipeline(device, bundle.pipeline, None)
+    vkDestroyPipelineLayout(device, bundle.pipeline_layout, None)
+    if bundle.owns_set_layout:
+        vkDestroyDescriptorSetLayout(device, bundle.set_layout, None)
+
+    if bundle.shader_cache:
+        for filename in bundle.shader_files:
+            bundle.shader_cache.release(filename)
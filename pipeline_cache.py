@@ -0,0 +1,144 @@
+import os
+import struct
+import zlib
+
+from vulkan import *
+
+# Our own header, written in front of the data the driver gives us. It lets us reject files made by another device or driver version
+# before the driver ever sees them, and carries the compile time measured without a cache so we can tell how much time the cache saves.
+# Layout: magic, vendor ID, driver version, pipeline cache UUID, cold compile time in seconds, data size, CRC32 of the data
+CACHE_MAGIC = b"VHTPCCH1"
+CACHE_HEADER = struct.Struct("<8sII16sdQI")
+
+# Header the driver puts at the start of its own data (VkPipelineCacheHeaderVersionOne): header size, header version, vendor ID, device ID, UUID
+VK_CACHE_HEADER = struct.Struct("<IIII16s")
+
+class PipelineCache:
+
+    def __init__(self, device, physical_device, directory = ".pipeline_cache"):
+
+        self.device = device
+        self.cache = VK_NULL_HANDLE
+
+        # The cache is only valid for the exact same device and driver, so those make up the key
+        properties = vkGetPhysicalDeviceProperties(physical_device)
+        self.vendor_id = properties.vendorID
+        self.device_id = properties.deviceID
+        self.driver_version = properties.driverVersion
+        self.uuid = bytes(list(properties.pipelineCacheUUID))
+        self.path = os.path.join(directory, "{:04x}_{:08x}_{}.bin".format(self.vendor_id, self.driver_version, self.uuid.hex()))
+
+        # Statistics
+        self.hit = False # Whether valid data was loaded from disk
+        self.cold_compile_time = None # Seconds it took to compile pipelines without a cache, stored alongside the data
+        self.compile_time = 0.0 # Seconds spent compiling pipelines in this run
+
+        initial_data = self.load()
+
+        # Creating the cache with the loaded data. Drivers validate it themselves, but a corrupted file can still make them fail, in which case we start fresh
+        try:
+            self.cache = self.create(initial_data)
+        except VkError:
+            print("WARNING: Pipeline cache rejected by the driver, starting with an empty one")
+            self.hit = False
+            self.discard()
+            self.cache = self.create(None)
+
+    def create(self, initial_data):
+
+        if initial_data:
+            create_info = VkPipelineCacheCreateInfo(initialDataSize = len(initial_data), pInitialData = ffi.from_buffer(initial_data))
+        else:
+            create_info = VkPipelineCacheCreateInfo(initialDataSize = 0, pInitialData = None)
+
+        return vkCreatePipelineCache(self.device, create_info, None)
+
+    def load(self):
+
+        # Returns the driver data stored on disk, or None if there is no usable file
+        try:
+            with open(self.path, 'rb') as file:
+                contents = file.read()
+        except OSError:
+            return None
+
+        if len(contents) < CACHE_HEADER.size:
+            return self.reject("truncated file")
+
+        magic, vendor_id, driver_version, uuid, cold_compile_time, data_size, checksum = CACHE_HEADER.unpack_from(contents, 0)
+        data = contents[CACHE_HEADER.size:]
+
+        if magic != CACHE_MAGIC:
+            return self.reject("unknown format")
+        if vendor_id != self.vendor_id or driver_version != self.driver_version or uuid != self.uuid:
+            return self.reject("made by a different device or driver")
+        if data_size != len(data) or zlib.crc32(data) != checksum:
+            return self.reject("corrupted data")
+
+        # The driver's own header has to agree with ours as well
+        if len(data) < VK_CACHE_HEADER.size:
+            return self.reject("truncated driver data")
+        header_size, header_version, vk_vendor_id, vk_device_id, vk_uuid = VK_CACHE_HEADER.unpack_from(data, 0)
+        if header_version != VK_PIPELINE_CACHE_HEADER_VERSION_ONE or vk_vendor_id != self.vendor_id or vk_device_id != self.device_id or vk_uuid != self.uuid:
+            return self.reject("driver header mismatch")
+
+        self.hit = True
+        self.cold_compile_time = cold_compile_time
+        return data
+
+    def reject(self, reason):
+
+        print("WARNING: Discarding pipeline cache {} ({})".format(self.path, reason))
+        self.discard()
+        return None
+
+    def discard(self):
+
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def record_compile(self, seconds):
+        # Called with the time it took to create pipelines using this cache
+        self.compile_time += seconds
+
+    def save(self):
+
+        # First call gets the size, second one the data
+        data_size = ffi.new("size_t*")
+        result = lib.vkGetPipelineCacheData(self.device, self.cache, data_size, ffi.NULL)
+        if result != VK_SUCCESS or data_size[0] == 0:
+            return
+
+        data_buffer = ffi.new("char[]", data_size[0])
+        result = lib.vkGetPipelineCacheData(self.device, self.cache, data_size, data_buffer)
+        if result != VK_SUCCESS:
+            return
+        data = ffi.buffer(data_buffer, data_size[0])[:]
+
+        # A run that missed the cache gives us the cold compile time, a run that hit it keeps the one already stored
+        cold_compile_time = self.cold_compile_time if self.hit else self.compile_time
+
+        header = CACHE_HEADER.pack(CACHE_MAGIC, self.vendor_id, self.driver_version, self.uuid, cold_compile_time, len(data), zlib.crc32(data))
+
+        # Written to a temporary file first, so a crash midway never leaves a half written cache behind
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok = True)
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, 'wb') as file:
+            file.write(header)
+            file.write(data)
+        os.replace(temporary_path, self.path)
+
+    def report(self):
+
+        if self.hit:
+            saved = self.cold_compile_time - self.compile_time
+            print("Pipeline cache hit: compiled in {:.2f} ms, {:.2f} ms saved".format(self.compile_time * 1000.0, saved * 1000.0))
+        else:
+            print("Pipeline cache miss: compiled in {:.2f} ms".format(self.compile_time * 1000.0))
+
+    def destroy(self):
+
+        vkDestroyPipelineCache(self.device, self.cache, None)
+        self.cache = VK_NULL_HANDLE
@@ -0,0 +1,291 @@
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from vulkan import *
+
+import pipeline
+from shader_library import create_shader_module
+
+def handle_id(handle):
+    # Vulkan handles are cffi pointers, their address identifies them
+    return int(ffi.cast("uintptr_t", handle))
+
+class PipelineDescription:
+
+    # Everything a graphics pipeline is built from. Descriptions with the same key() get the same VkPipeline from a PipelineFactory
+    def __init__(self, vertex_shader, fragment_shader, color_format, final_layout = VK_IMAGE_LAYOUT_PRESENT_SRC_KHR, vertex_input = None, set_layouts = (),
+        push_constant_ranges = (), topology = VK_PRIMITIVE_TOPOLOGY_TRIANGLE_LIST, cull_mode = VK_CULL_MODE_BACK_BIT, front_face = VK_FRONT_FACE_CLOCKWISE,
+        polygon_mode = VK_POLYGON_MODE_FILL, blend_mode = None):
+
+        # SPIR-V paths. The shader library names compiled shaders after their content hash, so a path identifies the code as well
+        self.vertex_shader = vertex_shader
+        self.fragment_shader = fragment_shader
+
+        # Render pass, shared by every description with the same format and final layout
+        self.color_format = color_format
+        self.final_layout = final_layout
+
+        # Pipeline layout, shared by every description with the same set layouts and push constant ranges
+        self.set_layouts = tuple(set_layouts)
+        self.push_constant_ranges = tuple(push_constant_ranges)
+
+        # Fixed function state, see pipeline.create_pipeline_info
+        self.vertex_input = vertex_input # buffers.VertexInputDescription or None
+        self.topology = topology
+        self.cull_mode = cull_mode
+        self.front_face = front_face
+        self.polygon_mode = polygon_mode
+        self.blend_mode = blend_mode # Key of pipeline.BLEND_MODES
+
+        self.cached_key = None
+
+    def render_pass_key(self):
+        return (self.color_format, self.final_layout)
+
+    def layout_key(self):
+        return (tuple(handle_id(set_layout) for set_layout in self.set_layouts),
+            tuple((push_range.stageFlags, push_range.offset, push_range.size) for push_range in self.push_constant_ranges))
+
+    def vertex_input_key(self):
+
+        if self.vertex_input is None:
+            return None
+        return (tuple((binding.binding, binding.stride, binding.inputRate) for binding in self.vertex_input.bindings),
+            tuple((attribute.location, attribute.binding, attribute.format, attribute.offset) for attribute in self.vertex_input.attributes))
+
+    def key(self):
+
+        # Hash of the whole state, computed once since descriptions are not meant to change after being handed to a factory
+        if self.cached_key is None:
+            state = (os.path.abspath(self.vertex_shader), os.path.abspath(self.fragment_shader), self.render_pass_key(), self.layout_key(), self.vertex_input_key(),
+                self.topology, self.cull_mode, self.front_face, self.polygon_mode, self.blend_mode)
+            self.cached_key = hashlib.sha256(repr(state).encode()).hexdigest()
+        return self.cached_key
+
+class PipelineFactory:
+
+    # Hands out graphics pipelines by description, compiling each distinct one once. Render passes and pipeline layouts are shared between
+    # every pipeline that is compatible, which also keeps descriptor sets bound when switching between them. New variants compile in batches,
+    # with one vkCreateGraphicsPipelines call each, either right away or on a thread pool so the render loop doesn't hitch.
+    # The factory owns everything it made: its bundles must not be passed to pipeline.destroy_graphics_pipeline, destroy() takes care of them
+    def __init__(self, device, pipeline_cache = None, shader_cache = None, worker_count = 0):
+
+        self.device = device
+        self.pipeline_cache = pipeline_cache # pipeline_cache.PipelineCache, or None
+        self.shader_cache = shader_cache
+        self.lock = threading.Lock()
+
+        self.render_passes = {} # render_pass_key -> VkRenderPass
+        self.layouts = {} # layout_key -> VkPipelineLayout
+        self.pipelines = {} # key -> pipeline.OuputBundle
+        self.compiling = {} # key -> Future of the batch compiling it on the thread pool
+
+        self.worker_count = worker_count
+        self.executor = ThreadPoolExecutor(max_workers = worker_count, thread_name_prefix = "pipelines") if worker_count > 0 else None
+
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0
+        self.compile_time = 0.0
+
+    def get_render_pass(self, description):
+
+        key = description.render_pass_key()
+        with self.lock:
+            render_pass = self.render_passes.get(key)
+            if render_pass is None:
+                render_pass = self.render_passes[key] = pipeline.create_render_pass(self.device, description.color_format, description.final_layout)
+            return render_pass
+
+    def get_layout(self, description):
+
+        key = description.layout_key()
+        with self.lock:
+            pipeline_layout = self.layouts.get(key)
+            if pipeline_layout is None:
+                pipeline_layout = self.layouts[key] = pipeline.create_pipeline_layout(self.device, description.set_layouts, description.push_constant_ranges)
+            return pipeline_layout
+
+    def get(self, description):
+
+        # Returns the pipeline for description, compiling it now if needed. Waits for it when it is already compiling on the thread pool
+        key = description.key()
+        with self.lock:
+            bundle = self.pipelines.get(key)
+            future = self.compiling.get(key)
+            if bundle is not None:
+                self.hits += 1
+                return bundle
+
+        if future is not None:
+            future.result()
+            return self.pipelines[key]
+        return self.compile([description,])[0]
+
+    def get_if_ready(self, description):
+
+        # Never blocks. Returns None while the pipeline compiles in the background, so the caller can skip or fall back for a frame or two
+        key = description.key()
+        with self.lock:
+            bundle = self.pipelines.get(key)
+            future = self.compiling.get(key)
+            if bundle is not None:
+                self.hits += 1
+                return bundle
+
+        if future is None:
+            self.compile_async([description,])
+            with self.lock:
+                return self.pipelines.get(key)
+        if future.done():
+            future.result() # Re-raises when compiling failed
+        return None
+
+    def missing(self, descriptions):
+
+        # Descriptions neither compiled nor compiling, without duplicates
+        unique = {}
+        with self.lock:
+            for description in descriptions:
+                key = description.key()
+                if key not in self.pipelines and key not in self.compiling:
+                    unique.setdefault(key, description)
+        return list(unique.values())
+
+    def compile(self, descriptions):
+
+        # Compiles every missing description in a single vkCreateGraphicsPipelines call, and returns the pipelines in order
+        missing = self.missing(descriptions)
+        if missing:
+            self.create_batch(missing)
+
+        bundles = []
+        for description in descriptions:
+            key = description.key()
+            with self.lock:
+                future = self.compiling.get(key)
+            if future is not None:
+                future.result() # Re-raises when compiling failed
+            with self.lock:
+                bundle = self.pipelines.get(key)
+            if bundle is None:
+                # A background batch failed and was already done before we could wait on it. Compiling here raises its error again
+                self.create_batch([description,])
+                bundle = self.pipelines[key]
+            bundles.append(bundle)
+        return bundles
+
+    def compile_async(self, descriptions):
+
+        # Starts compiling the missing descriptions on the thread pool, one batch per worker. Without workers they compile right away
+        missing = self.missing(descriptions)
+        if not missing:
+            return
+        if self.executor is None:
+            self.create_batch(missing)
+            return
+
+        for i in range(min(self.worker_count, len(missing))):
+            chunk = missing[i::self.worker_count]
+            with self.lock:
+                future = self.executor.submit(self.create_batch, chunk)
+                for description in chunk:
+                    self.compiling[description.key()] = future
+            future.add_done_callback(lambda done, chunk = chunk: self.finish_async(chunk))
+
+    def finish_async(self, chunk):
+        with self.lock:
+            for description in chunk:
+                self.compiling.pop(description.key(), None)
+
+    def create_batch(self, descriptions):
+
+        modules = [] # (filename, module), every module acquired or created for this batch
+        created = None
+        try:
+            pipeline_infos = []
+            for description in descriptions:
+                vertex_shader_module = self.shader_cache.acquire(description.vertex_shader) if self.shader_cache else create_shader_module(self.device,
+                    description.vertex_shader)
+                modules.append((description.vertex_shader, vertex_shader_module))
+                fragment_shader_module = self.shader_cache.acquire(description.fragment_shader) if self.shader_cache else create_shader_module(self.device,
+                    description.fragment_shader)
+                modules.append((description.fragment_shader, fragment_shader_module))
+
+                pipeline_infos.append(pipeline.create_pipeline_info(vertex_shader_module, fragment_shader_module, self.get_layout(description),
+                    self.get_render_pass(description), description.vertex_input, description.topology, description.cull_mode, description.front_face,
+                    description.polygon_mode, description.blend_mode))
+
+            # Pipeline caches are internally synchronized, so batches on different threads can share it
+            cache_handle = self.pipeline_cache.cache if self.pipeline_cache is not None else VK_NULL_HANDLE
+            compile_start = time.perf_counter()
+            created = vkCreateGraphicsPipelines(self.device, cache_handle, len(pipeline_infos), pipeline_infos, None)
+            elapsed = time.perf_counter() - compile_start
+        finally:
+            # Shader Modules are not needed anymore, unless they are shared through the cache. Cached ones stay acquired by the new pipelines,
+            # or are released right away when compiling failed
+            if created is None or not self.shader_cache:
+                for filename, module in modules:
+                    if self.shader_cache:
+                        self.shader_cache.release(filename)
+                    else:
+                        vkDestroyShaderModule(self.device, module, None)
+
+        duplicates = [] # Compiled by another thread in the meantime
+        with self.lock:
+            for description, new_pipeline in zip(descriptions, created):
+                if description.key() in self.pipelines:
+                    duplicates.append((description, new_pipeline))
+                    continue
+                pipeline_layout = self.layouts[description.layout_key()]
+                render_pass = self.render_passes[description.render_pass_key()]
+                if self.shader_cache:
+                    bundle = pipeline.OuputBundle(pipeline_layout = pipeline_layout, render_pass = render_pass, pipeline = new_pipeline, shader_cache = self.shader_cache,
+                        shader_files = [description.vertex_shader, description.fragment_shader])
+                else:
+                    bundle = pipeline.OuputBundle(pipeline_layout = pipeline_layout, render_pass = render_pass, pipeline = new_pipeline)
+                self.pipelines[description.key()] = bundle
+
+            self.misses += len(descriptions)
+            self.batches += 1
+            self.compile_time += elapsed
+            if self.pipeline_cache is not None:
+                self.pipeline_cache.record_compile(elapsed)
+
+        for description, new_pipeline in duplicates:
+            vkDestroyPipeline(self.device, new_pipeline, None)
+            if self.shader_cache:
+                self.shader_cache.release(description.vertex_shader)
+                self.shader_cache.release(description.fragment_shader)
+
+    def owns(self, bundle):
+        with self.lock:
+            return any(bundle is owned for owned in self.pipelines.values())
+
+    def report(self):
+        print("Pipeline factory: {} pipelines, {} render passes, {} layouts, {} hits, {} compiled in {} batches ({:.2f} ms)".format(len(self.pipelines),
+            len(self.render_passes), len(self.layouts), self.hits, self.misses, self.batches, self.compile_time * 1000.0))
+
+    def destroy(self):
+
+        # Waits for compiles still running, the GPU has to be done with every pipeline
+        if self.executor is not None:
+            self.executor.shutdown(wait = True)
+            self.executor = None
+
+        for bundle in self.pipelines.values():
+            vkDestroyPipeline(self.device, bundle.pipeline, None)
+            if bundle.shader_cache:
+                for filename in bundle.shader_files:
+                    bundle.shader_cache.release(filename)
+        for pipeline_layout in self.layouts.values():
+            vkDestroyPipelineLayout(self.device, pipeline_layout, None)
+        for render_pass in self.render_passes.values():
+            vkDestroyRenderPass(self.device, render_pass, None)
+
+        self.pipelines = {}
+        self.layouts = {}
+        self.render_passes = {}
@@ -0,0 +1,180 @@
+import csv
+import json
+import time
+
+import numpy
+
+from vulkan import *
+
+# Frames kept by each rolling series
+DEFAULT_HISTORY = 600
+
+class RollingSeries:
+
+    # Fixed size ring of samples, so adding one never allocates
+    def __init__(self, history):
+
+        self.samples = numpy.zeros(history)
+        self.count = 0 # Total samples ever added
+
+    def add(self, value):
+        self.samples[self.count % len(self.samples)] = value
+        self.count += 1
+
+    def values(self):
+        return self.samples[:min(self.count, len(self.samples))]
+
+    def summary(self):
+
+        values = self.values()
+        if len(values) == 0:
+            return {"count": 0}
+
+        p50, p95, p99 = numpy.percentile(values, [50, 95, 99])
+        return {"count": len(values), "mean": float(values.mean()), "p50": float(p50), "p95": float(p95), "p99": float(p99), "max": float(values.max())}
+
+    def histogram(self, bins):
+        return numpy.histogram(self.values(), bins = bins)
+
+class Profiler:
+
+    # CPU time of each phase of Program.render, and GPU time of the render pass through timestamp queries. Everything is in milliseconds and
+    # kept in rolling series. The program only holds a Profiler when profiling is on, so the disabled cost is one "if" per phase.
+    # Command buffers are recorded once per swapchain image, so each image gets its own pair of queries, read back once the image's fence
+    # says its previous frame finished
+    def __init__(self, device, physical_device, queue_family_index, image_count, history = DEFAULT_HISTORY, dump_path = None, dump_every = 0):
+
+        self.device = device
+        self.history = history
+        self.series = {}
+        self.frame_start = None
+        self.last_mark = None
+        self.frames = 0
+
+        # Written every dump_every frames when both are set, as CSV or JSON depending on the extension
+        self.dump_path = dump_path
+        self.dump_every = dump_every
+
+        # Timestamps count ticks of timestampPeriod nanoseconds. Queues with timestampValidBits == 0 don't support them at all
+        self.timestamp_period = vkGetPhysicalDeviceProperties(physical_device).limits.timestampPeriod
+        valid_bits = vkGetPhysicalDeviceQueueFamilyProperties(physical_device)[queue_family_index].timestampValidBits
+        self.timestamp_mask = (1 << valid_bits) - 1 if valid_bits < 64 else 0xFFFFFFFFFFFFFFFF
+        self.gpu_supported = valid_bits > 0
+
+        self.query_pool = None
+        self.image_count = image_count
+        self.queries_written = [False] * image_count # Whether a submitted command buffer wrote the image's queries
+        self.query_results = ffi.new("uint64_t[2]")
+        if self.gpu_supported:
+            self.query_pool = self.create_query_pool(image_count)
+        else:
+            print("WARNING: Timestamp queries are NOT supported, GPU times won't be available")
+
+    def create_query_pool(self, image_count):
+
+        # Two timestamps per image, at the start and the end of its render pass
+        pool_info = VkQueryPoolCreateInfo(queryType = VK_QUERY_TYPE_TIMESTAMP, queryCount = image_count * 2)
+        return vkCreateQueryPool(self.device, pool_info, None)
+
+    def add(self, name, value):
+
+        series = self.series.get(name)
+        if series is None:
+            series = self.series[name] = RollingSeries(self.history)
+        series.add(value)
+
+    def begin_frame(self):
+        self.frame_start = self.last_mark = time.perf_counter()
+
+    def mark(self, phase):
+
+        # Time since the previous mark is accounted to phase
+        now = time.perf_counter()
+        self.add(phase, (now - self.last_mark) * 1000.0)
+        self.last_mark = now
+
+    def end_frame(self):
+
+        self.add("cpu_frame", (time.perf_counter() - self.frame_start) * 1000.0)
+        self.frames += 1
+        if self.dump_path and self.dump_every and self.frames % self.dump_every == 0:
+            self.dump(self.dump_path)
+
+    def write_timestamps_begin(self, command_buffer, image_index):
+
+        # Outside of the render pass, queries can't be reset inside one
+        if self.gpu_supported and image_index < self.image_count:
+            vkCmdResetQueryPool(command_buffer, self.query_pool, image_index * 2, 2)
+            vkCmdWriteTimestamp(command_buffer, VK_PIPELINE_STAGE_TOP_OF_PIPE_BIT, self.query_pool, image_index * 2)
+
+    def write_timestamps_end(self, command_buffer, image_index):
+        if self.gpu_supported and image_index < self.image_count:
+            vkCmdWriteTimestamp(command_buffer, VK_PIPELINE_STAGE_BOTTOM_OF_PIPE_BIT, self.query_pool, image_index * 2 + 1)
+
+    def collect_gpu(self, image_index):
+
+        # Called once the image's previous frame is known to be finished, so the results are there without waiting
+        if not self.gpu_supported or image_index >= self.image_count or not self.queries_written[image_index]:
+            return
+
+        try:
+            vkGetQueryPoolResults(self.device, self.query_pool, image_index * 2, 2, ffi.sizeof(self.query_results), self.query_results, 8, VK_QUERY_RESULT_64_BIT)
+        except VkNotReady:
+            return
+
+        ticks = ((self.query_results[1] & self.timestamp_mask) - (self.query_results[0] & self.timestamp_mask)) & self.timestamp_mask
+        self.add("gpu_render_pass", ticks * self.timestamp_period / 1000000.0)
+
+    def submitted(self, image_index):
+        if image_index < self.image_count:
+            self.queries_written[image_index] = True
+
+    def reset_images(self):
+        # After the swapchain was recreated, images start over without results
+        self.queries_written = [False] * self.image_count
+
+    def resize_images(self, image_count):
+
+        # For a swapchain with more images. Returns the old query pool, which frames in flight may still write to, for the caller to
+        # destroy once they are done with it
+        old_pool = self.query_pool
+        if self.gpu_supported:
+            self.query_pool = self.create_query_pool(image_count)
+        self.image_count = image_count
+        self.reset_images()
+        return old_pool
+
+    def stats(self):
+        # Summary of every series, keyed by name
+        return {name: series.summary() for name, series in self.series.items()}
+
+    def histogram(self, name, bins = 20):
+        # (counts, bin edges) over the rolling window of a series
+        return self.series[name].histogram(bins)
+
+    def dump(self, path):
+
+        stats = self.stats()
+        if path.endswith(".json"):
+            with open(path, "w") as file:
+                json.dump({"frames": self.frames, "series": stats}, file, indent = 2)
+            return
+
+        columns = ["count", "mean", "p50", "p95", "p99", "max"]
+        with open(path, "w", newline = "") as file:
+            writer = csv.writer(file)
+            writer.writerow(["series"] + columns)
+            for name, summary in sorted(stats.items()):
+                writer.writerow([name] + [summary.get(column, "") for column in columns])
+
+    def print_report(self):
+
+        print("{:<20} {:>8} {:>10} {:>10} {:>10} {:>10}".format("Series (ms)", "Frames", "Mean", "p50", "p99", "Max"))
+        for name, summary in sorted(self.stats().items()):
+            if summary["count"] > 0:
+                print("{:<20} {:>8} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f}".format(name, summary["count"], summary["mean"], summary["p50"], summary["p99"],
+                    summary["max"]))
+
+    def destroy(self):
+        if self.query_pool is not None:
+            vkDestroyQueryPool(self.device, self.query_pool, None)
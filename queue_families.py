@@ -5,21 +5,28 @@ class QueueFamilyIndices:
     def __init__(self):
         self.graphics_family = None
         self.present_family = None
+        self.present_required = True # Headless rendering has no surface to present to
+
+        # Families without graphics support, which usually map to separate hardware (DMA engines, async compute). None when the device has none
+        self.transfer_family = None
+        self.compute_family = None
     
     def is_complete(self):
-        return (self.graphics_family != None and self.present_family != None)
+        return (self.graphics_family != None and (self.present_family != None or not self.present_required))
 
     def get_unique_indices(self):
 
         unique_indices = [self.graphics_family,]
-        if self.graphics_family != self.present_family:
-            unique_indices.append(self.present_family)
+        for index in (self.present_family, self.transfer_family, self.compute_family):
+            if index != None and index not in unique_indices:
+                unique_indices.append(index)
         
         return unique_indices
     
-def find_queue_families(device, instance, surface):
+def find_queue_families(device, dispatch, surface):
         
     indices = QueueFamilyIndices()
+    indices.present_required = surface is not None
 
     # Get all queues
     queueFamilies = vkGetPhysicalDeviceQueueFamilyProperties(device)
@@ -31,11 +38,27 @@ def find_queue_families(device, instance, surface):
             indices.graphics_family = i
         
         # To determine whether a queue family of a physical device supports presentation to a given surface. From khronos docs.
-        surfaceSupport = vkGetInstanceProcAddr(instance, "vkGetPhysicalDeviceSurfaceSupportKHR")
-        if surfaceSupport(device, i, surface):
+        if indices.present_required and dispatch.vkGetPhysicalDeviceSurfaceSupportKHR(device, i, surface):
             indices.present_family = i
 
         if indices.is_complete():
             break
 
+    # Dedicated families. Transfer prefers a family that can only do transfers, and compute one that can't do graphics
+    for i,queueFamily in enumerate(queueFamilies):
+
+        flags = queueFamily.queueFlags
+        if flags & VK_QUEUE_GRAPHICS_BIT:
+            continue
+
+        if flags & VK_QUEUE_TRANSFER_BIT and not flags & VK_QUEUE_COMPUTE_BIT:
+            if indices.transfer_family == None:
+                indices.transfer_family = i
+        elif flags & VK_QUEUE_COMPUTE_BIT and indices.compute_family == None:
+            indices.compute_family = i
+
+    # Compute queues can always do transfers as well, so they are the next best thing
+    if indices.transfer_family == None:
+        indices.transfer_family = indices.compute_family
+
     return indices
\ No newline at end of file
@@ -0,0 +1,86 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from vulkan import *
+
+# Below this many draws per worker, handing work to threads costs more than recording it inline
+DEFAULT_MIN_DRAWS_PER_WORKER = 64
+
+class ParallelRecorder:
+
+    # Records the draws of a render pass into secondary command buffers, one per worker, which the primary command buffer then runs with
+    # vkCmdExecuteCommands. Command pools can only be used by one thread at a time, so every worker slice gets a pool of its own.
+    # cffi releases the GIL while inside Vulkan, so the time spent by the driver recording commands overlaps across threads, while the
+    # Python side of each call still runs one thread at a time
+    def __init__(self, device, queue_family_index, worker_count, min_draws_per_worker = DEFAULT_MIN_DRAWS_PER_WORKER):
+
+        self.device = device
+        self.worker_count = worker_count
+        self.min_draws_per_worker = min_draws_per_worker
+        self.executor = ThreadPoolExecutor(max_workers = worker_count, thread_name_prefix = "recording")
+
+        # Pool i is only ever used by whoever records slice i, so no locking is needed
+        pool_info = VkCommandPoolCreateInfo(flags = VK_COMMAND_POOL_CREATE_RESET_COMMAND_BUFFER_BIT, queueFamilyIndex = queue_family_index)
+        self.command_pools = [vkCreateCommandPool(device, pool_info, None) for i in range(worker_count)]
+
+    def should_record(self, draw_count):
+        # With too few draws, recording inline is faster
+        return draw_count >= self.min_draws_per_worker * 2
+
+    def split(self, draws):
+
+        # Contiguous slices, so executing the secondary command buffers in order keeps the draws in their original order
+        slice_count = max(1, min(self.worker_count, len(draws) // self.min_draws_per_worker))
+        slice_size = (len(draws) + slice_count - 1) // slice_count
+        return [draws[i:i + slice_size] for i in range(0, len(draws), slice_size)]
+
+    def allocate(self, frame):
+
+        # Each frame keeps one secondary command buffer per pool, recorded together with its primary and re-recorded when it gets dirty
+        if frame.secondary_commandbuffers:
+            return
+
+        for command_pool in self.command_pools:
+            alloc_info = VkCommandBufferAllocateInfo(commandPool = command_pool, level = VK_COMMAND_BUFFER_LEVEL_SECONDARY, commandBufferCount = 1)
+            frame.secondary_commandbuffers.append(vkAllocateCommandBuffers(self.device, alloc_info)[0])
+
+    def record_slice(self, command_buffer, render_pass, framebuffer, draws, record_draws):
+
+        vkResetCommandBuffer(command_buffer, 0)
+
+        # Secondary command buffers that run inside a render pass need to know which one, and don't inherit any state from the primary
+        inheritance_info = VkCommandBufferInheritanceInfo(renderPass = render_pass, subpass = 0, framebuffer = framebuffer)
+        begin_info = VkCommandBufferBeginInfo(flags = VK_COMMAND_BUFFER_USAGE_RENDER_PASS_CONTINUE_BIT, pInheritanceInfo = [inheritance_info,])
+        vkBeginCommandBuffer(command_buffer, begin_info)
+        record_draws(command_buffer, draws)
+        vkEndCommandBuffer(command_buffer)
+
+    def record(self, frame, render_pass, framebuffer, draws, record_draws):
+
+        # record_draws(command_buffer, draws) records a slice of draws, binding whatever state it needs. Returns the secondary command
+        # buffers to execute, in order. Must only be called once the GPU is done with the frame's previous recording
+        self.allocate(frame)
+        slices = self.split(draws)
+
+        futures = []
+        for command_buffer, draw_slice in zip(frame.secondary_commandbuffers, slices):
+            futures.append(self.executor.submit(self.record_slice, command_buffer, render_pass, framebuffer, draw_slice, record_draws))
+
+        # result() re-raises anything a worker raised
+        for future in futures:
+            future.result()
+
+        return frame.secondary_commandbuffers[:len(slices)]
+
+    def free(self, frame):
+
+        for command_pool, command_buffer in zip(self.command_pools, frame.secondary_commandbuffers):
+            vkFreeCommandBuffers(self.device, command_pool, 1, [command_buffer,])
+        frame.secondary_commandbuffers = []
+
+    def destroy(self):
+
+        # Destroying the pools frees every command buffer allocated from them
+        self.executor.shutdown(wait = True)
+        for command_pool in self.command_pools:
+            vkDestroyCommandPool(self.device, command_pool, None)
+        self.command_pools = []
@@ -0,0 +1,487 @@
+from vulkan import *
+
+class Usage:
+
+    # How a pass uses an image: the layout it has to be in, the stages touching it and with which access
+    def __init__(self, layout, stages, read_access, write_access, image_usage, attachment = False):
+
+        self.layout = layout
+        self.stages = stages
+        self.read_access = read_access
+        self.write_access = write_access # 0 for usages that can only read
+        self.image_usage = image_usage # Usage flag the image has to be created with
+        self.attachment = attachment # Bound to the pass' render pass instead of being accessed by shaders or transfers
+
+# Names passes declare their reads and writes with
+USAGES = {
+    "color": Usage(VK_IMAGE_LAYOUT_COLOR_ATTACHMENT_OPTIMAL, VK_PIPELINE_STAGE_COLOR_ATTACHMENT_OUTPUT_BIT, VK_ACCESS_COLOR_ATTACHMENT_READ_BIT,
+        VK_ACCESS_COLOR_ATTACHMENT_WRITE_BIT, VK_IMAGE_USAGE_COLOR_ATTACHMENT_BIT, True),
+    "depth": Usage(VK_IMAGE_LAYOUT_DEPTH_STENCIL_ATTACHMENT_OPTIMAL, VK_PIPELINE_STAGE_EARLY_FRAGMENT_TESTS_BIT | VK_PIPELINE_STAGE_LATE_FRAGMENT_TESTS_BIT,
+        VK_ACCESS_DEPTH_STENCIL_ATTACHMENT_READ_BIT, VK_ACCESS_DEPTH_STENCIL_ATTACHMENT_WRITE_BIT, VK_IMAGE_USAGE_DEPTH_STENCIL_ATTACHMENT_BIT, True),
+    "sampled": Usage(VK_IMAGE_LAYOUT_SHADER_READ_ONLY_OPTIMAL, VK_PIPELINE_STAGE_FRAGMENT_SHADER_BIT | VK_PIPELINE_STAGE_COMPUTE_SHADER_BIT, VK_ACCESS_SHADER_READ_BIT,
+        0, VK_IMAGE_USAGE_SAMPLED_BIT),
+    "storage": Usage(VK_IMAGE_LAYOUT_GENERAL, VK_PIPELINE_STAGE_FRAGMENT_SHADER_BIT | VK_PIPELINE_STAGE_COMPUTE_SHADER_BIT, VK_ACCESS_SHADER_READ_BIT,
+        VK_ACCESS_SHADER_WRITE_BIT, VK_IMAGE_USAGE_STORAGE_BIT),
+    "transfer_src": Usage(VK_IMAGE_LAYOUT_TRANSFER_SRC_OPTIMAL, VK_PIPELINE_STAGE_TRANSFER_BIT, VK_ACCESS_TRANSFER_READ_BIT, 0, VK_IMAGE_USAGE_TRANSFER_SRC_BIT),
+    "transfer_dst": Usage(VK_IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL, VK_PIPELINE_STAGE_TRANSFER_BIT, 0, VK_ACCESS_TRANSFER_WRITE_BIT, VK_IMAGE_USAGE_TRANSFER_DST_BIT),
+}
+
+DEPTH_FORMATS = (VK_FORMAT_D16_UNORM, VK_FORMAT_X8_D24_UNORM_PACK32, VK_FORMAT_D32_SFLOAT)
+DEPTH_STENCIL_FORMATS = (VK_FORMAT_D16_UNORM_S8_UINT, VK_FORMAT_D24_UNORM_S8_UINT, VK_FORMAT_D32_SFLOAT_S8_UINT)
+
+def aspect_mask(image_format):
+
+    if image_format in DEPTH_FORMATS:
+        return VK_IMAGE_ASPECT_DEPTH_BIT
+    if image_format in DEPTH_STENCIL_FORMATS:
+        return VK_IMAGE_ASPECT_DEPTH_BIT | VK_IMAGE_ASPECT_STENCIL_BIT
+    return VK_IMAGE_ASPECT_COLOR_BIT
+
+def align_up(value, alignment):
+    return (value + alignment - 1) // alignment * alignment
+
+class HeapRequirements:
+
+    # Same fields as VkMemoryRequirements, for a heap shared by several images. allocator.MemoryAllocator.allocate only reads these three
+    def __init__(self, size, alignment, memoryTypeBits):
+
+        self.size = size
+        self.alignment = alignment
+        self.memoryTypeBits = memoryTypeBits
+
+class GraphResource:
+
+    def __init__(self, name, image_format, extent, imported, clear_value):
+
+        self.name = name
+        self.format = image_format
+        self.extent = extent # VkExtent2D
+        self.imported = imported # Owned by someone else (a swapchain image for example), never culled away or aliased
+        self.clear_value = clear_value # VkClearValue used by the first pass writing the resource, None to keep or discard the contents
+
+        self.image = None
+        self.view = None
+        self.initial_layout = VK_IMAGE_LAYOUT_UNDEFINED # Layout at the start of the graph, for imported images
+        self.initial_stages = VK_PIPELINE_STAGE_TOP_OF_PIPE_BIT # Stages to wait for before the first use, for imported images
+        self.final_layout = None # Layout imported images are left in after the graph, None leaves them in their last layout
+
+        # Filled in by compile
+        self.image_usage = 0
+        self.first = None # Index of the first and last kept pass using it
+        self.last = None
+        self.stages = 0 # Every stage and write access it is used with, what a later user of its memory has to wait for
+        self.write_access = 0
+        self.heap = None # Index in RenderGraph.heaps, and place within it, for transient images
+        self.memory_offset = 0
+        self.memory_size = 0
+
+class GraphPass:
+
+    def __init__(self, name, record, reads, writes, side_effects):
+
+        self.name = name
+        self.record = record # Called as record(command_buffer, graph_pass), inside the pass' render pass when it has attachments
+        self.uses = [(resource, usage, False) for resource, usage in reads.items()] + [(resource, usage, True) for resource, usage in writes.items()]
+        self.side_effects = side_effects # Kept even when nothing reads what it writes
+
+        # Filled in by compile
+        self.index = None
+        self.barriers = [] # (resource name, old layout, new layout, src access, dst access)
+        self.src_stages = 0
+        self.dst_stages = 0
+        self.attachments = [] # Resource names, in attachment order
+        self.load_ops = []
+        self.store_ops = []
+        self.renderpass = None # Made by compile when the pass has attachments. Pipelines drawing in the pass are made against it
+        self.extent = None
+        self.framebuffers = {} # Keyed by the attachments' views, since imported images change from frame to frame
+
+class ResourceState:
+
+    # Tracked while planning barriers, what the last uses of a resource left to synchronize with
+    def __init__(self, layout, write_stages, write_access):
+
+        self.layout = layout
+        self.write_stages = write_stages # Stages of the last write, and its access. Later uses wait for them
+        self.write_access = write_access
+        self.read_stages = 0 # Stages reading since the last write. The next write waits for them, without any access to make visible
+        self.visible = {} # Stages that already waited for the last write (or layout transition), so later reads there need no barrier
+
+def place_resources(resources):
+
+    # Gives each resource an offset, so resources in use at the same time never overlap. Biggest first, each at the lowest offset that fits
+    # between the ones already placed that are alive with it. Returns the size the heap needs
+    placed = []
+    heap_size = 0
+    for resource, requirements in sorted(resources, key = lambda entry: entry[1].size, reverse = True):
+
+        taken = sorted((other.memory_offset, other.memory_offset + other.memory_size) for other in placed
+            if not (other.last < resource.first or resource.last < other.first))
+
+        offset = 0
+        for start, end in taken:
+            if offset + requirements.size <= start:
+                break
+            offset = max(offset, align_up(end, requirements.alignment))
+
+        resource.memory_offset = offset
+        resource.memory_size = requirements.size
+        placed.append(resource)
+        heap_size = max(heap_size, offset + requirements.size)
+
+    return heap_size
+
+class RenderGraph:
+
+    # Passes declare which images they read and write, and how (see USAGES). compile() drops passes whose results nobody uses, works out the
+    # layout transitions and the fewest barriers between passes, and puts transient images whose lifetimes don't overlap in the same memory.
+    # Passes run in the order they were added, which has to be one where every image is written before it is read
+    def __init__(self, device, extent):
+
+        self.device = device
+        self.extent = extent # Default size of the attachments
+        self.resources = {}
+        self.passes = []
+
+        # Filled in by compile
+        self.kept = []
+        self.culled = []
+        self.final_barriers = [] # Moves imported images to their final layout after the last pass
+        self.final_src_stages = 0
+        self.heaps = [] # allocator.Allocation for each group of aliased images
+        self.memory_without_aliasing = 0
+        self.memory_with_aliasing = 0
+        self.allocator = None
+
+    def add_attachment(self, name, image_format, extent = None, clear_value = None):
+
+        # Transient image, made and owned by the graph. Its contents only live for one execution of the graph
+        self.resources[name] = GraphResource(name, image_format, extent or self.extent, False, clear_value)
+
+    def import_image(self, name, image, view, image_format, extent, initial_layout = VK_IMAGE_LAYOUT_UNDEFINED, final_layout = None,
+        initial_stages = VK_PIPELINE_STAGE_TOP_OF_PIPE_BIT, clear_value = None):
+
+        # Image made outside of the graph, such as a swapchain image. Imported images are the graph's outputs, passes writing them are always kept.
+        # For swapchain images, initial_stages should be the stage the acquire semaphore is waited on, so the layout transition waits for it too
+        resource = GraphResource(name, image_format, extent, True, clear_value)
+        resource.image = image
+        resource.view = view
+        resource.initial_layout = initial_layout
+        resource.initial_stages = initial_stages
+        resource.final_layout = final_layout
+        self.resources[name] = resource
+
+    def bind_image(self, name, image, view):
+
+        # Swaps an imported image for another one of the same format and size, typically the next swapchain image. No recompile needed
+        self.resources[name].image = image
+        self.resources[name].view = view
+
+    def add_pass(self, name, record, reads = None, writes = None, side_effects = False):
+
+        # reads and writes map resource names to usage names, in attachment order. Writing an attachment keeps what earlier passes wrote,
+        # unless the pass is the first one writing it
+        reads, writes = reads or {}, writes or {}
+        for resource, usage in list(reads.items()) + list(writes.items()):
+            if resource not in self.resources:
+                raise ValueError("Pass {} uses unknown resource {}".format(name, resource))
+            if usage not in USAGES:
+                raise ValueError("Pass {} uses {} as unknown usage {}".format(name, resource, usage))
+        for resource, usage in writes.items():
+            if USAGES[usage].write_access == 0:
+                raise ValueError("Pass {} can't write {} as {}".format(name, resource, usage))
+
+        graph_pass = GraphPass(name, record, reads, writes, side_effects)
+        self.passes.append(graph_pass)
+        return graph_pass
+
+    def cull(self):
+
+        # Walks the passes backwards from the outputs. A pass is kept when it writes something a kept pass or an output needs, or has side effects
+        needed = {name for name, resource in self.resources.items() if resource.imported}
+        kept = []
+        for graph_pass in reversed(self.passes):
+            if graph_pass.side_effects or any(writes and resource in needed for resource, usage, writes in graph_pass.uses):
+                kept.append(graph_pass)
+                needed.update(resource for resource, usage, writes in graph_pass.uses)
+
+        kept.reverse()
+        self.kept = kept
+        self.culled = [graph_pass for graph_pass in self.passes if graph_pass not in kept]
+
+    def compute_lifetimes(self):
+
+        for resource in self.resources.values():
+            resource.first = resource.last = None
+            resource.image_usage = 0
+            resource.stages = 0
+            resource.write_access = 0
+
+        written = set(name for name, resource in self.resources.items() if resource.imported)
+        for index, graph_pass in enumerate(self.kept):
+            graph_pass.index = index
+            for name, usage_name, writes in graph_pass.uses:
+                resource = self.resources[name]
+                usage = USAGES[usage_name]
+                if not writes and name not in written:
+                    raise ValueError("Pass {} reads {} before any pass writes it".format(graph_pass.name, name))
+                if writes:
+                    written.add(name)
+                    resource.write_access |= usage.write_access
+
+                resource.first = index if resource.first is None else resource.first
+                resource.last = index
+                resource.image_usage |= usage.image_usage
+                resource.stages |= usage.stages
+
+    def create_images(self, allocator):
+
+        # Every transient image still in use gets created, then the ones with compatible memory types share a heap
+        groups = {} # memoryTypeBits -> [(resource, requirements)]
+        for resource in self.resources.values():
+            if resource.imported or resource.first is None:
+                continue
+
+            image_info = VkImageCreateInfo(imageType = VK_IMAGE_TYPE_2D, format = resource.format, extent = VkExtent3D(resource.extent.width, resource.extent.height, 1),
+                mipLevels = 1, arrayLayers = 1, samples = VK_SAMPLE_COUNT_1_BIT, tiling = VK_IMAGE_TILING_OPTIMAL, usage = resource.image_usage,
+                sharingMode = VK_SHARING_MODE_EXCLUSIVE, initialLayout = VK_IMAGE_LAYOUT_UNDEFINED)
+            resource.image = vkCreateImage(self.device, image_info, None)
+            requirements = vkGetImageMemoryRequirements(self.device, resource.image)
+            groups.setdefault(requirements.memoryTypeBits, []).append((resource, requirements))
+            self.memory_without_aliasing += requirements.size
+
+        for memory_type_bits, entries in groups.items():
+
+            heap_size = place_resources(entries)
+            alignment = max(requirements.alignment for resource, requirements in entries)
+            heap = allocator.allocate(HeapRequirements(heap_size, alignment, memory_type_bits), VK_MEMORY_PROPERTY_DEVICE_LOCAL_BIT, linear = False)
+            self.heaps.append(heap)
+            self.memory_with_aliasing += heap_size
+
+            for resource, requirements in entries:
+                resource.heap = len(self.heaps) - 1
+                vkBindImageMemory(self.device, resource.image, heap.memory, heap.offset + resource.memory_offset)
+
+                subresource_range = VkImageSubresourceRange(aspectMask = aspect_mask(resource.format), baseMipLevel = 0, levelCount = 1, baseArrayLayer = 0, layerCount = 1)
+                view_info = VkImageViewCreateInfo(image = resource.image, viewType = VK_IMAGE_VIEW_TYPE_2D, format = resource.format, subresourceRange = subresource_range)
+                resource.view = vkCreateImageView(self.device, view_info, None)
+
+    def overlapping(self, resource):
+
+        # Transient images sharing memory with resource, itself included. The graph runs again every frame, so any of them may have used
+        # that memory last
+        return [other for other in self.resources.values() if not other.imported and other.heap is not None and other.heap == resource.heap and
+            other.memory_offset < resource.memory_offset + resource.memory_size and resource.memory_offset < other.memory_offset + other.memory_size]
+
+    def plan_barriers(self):
+
+        states = {}
+        for graph_pass in self.kept:
+
+            graph_pass.barriers = []
+            graph_pass.src_stages = 0
+            graph_pass.dst_stages = 0
+
+            for name, usage_name, writes in graph_pass.uses:
+                resource = self.resources[name]
+                usage = USAGES[usage_name]
+                access = usage.read_access | (usage.write_access if writes else 0)
+                state = states.get(name)
+
+                if state is None:
+                    # First use. Transient contents are discarded, but the memory may have been used by an aliased image, or by the previous frame
+                    if resource.imported:
+                        src_stages, src_access, old_layout = resource.initial_stages, 0, resource.initial_layout
+                    else:
+                        others = self.overlapping(resource)
+                        src_stages = 0
+                        src_access = 0
+                        for other in others:
+                            src_stages |= other.stages
+                            src_access |= other.write_access
+                        old_layout = VK_IMAGE_LAYOUT_UNDEFINED
+                    self.add_barrier(graph_pass, name, old_layout, usage.layout, src_stages, src_access, usage.stages, access)
+                    state = states[name] = ResourceState(usage.layout, usage.stages, 0)
+
+                elif writes or state.layout != usage.layout:
+                    # Writes wait for every earlier read and write. Layout transitions are writes as well
+                    self.add_barrier(graph_pass, name, state.layout, usage.layout, state.write_stages | state.read_stages, state.write_access, usage.stages, access)
+                    if not writes:
+                        # Readers in other stages have to wait for the transition, same as for a write
+                        state.write_stages, state.write_access, state.read_stages, state.visible = usage.stages, 0, 0, {}
+                    state.layout = usage.layout
+
+                else:
+                    # Read after read needs nothing, read after write only once per stage and access
+                    if state.write_stages and usage.stages not in state.visible:
+                        self.add_barrier(graph_pass, name, state.layout, usage.layout, state.write_stages, state.write_access, usage.stages, access)
+
+                if writes:
+                    state.write_stages = usage.stages
+                    state.write_access = usage.write_access
+                    state.read_stages = 0
+                    state.visible = {}
+                else:
+                    state.read_stages |= usage.stages
+                    state.visible[usage.stages] = state.visible.get(usage.stages, 0) | usage.read_access
+
+        # Imported images end up where their owner expects them
+        self.final_barriers = []
+        self.final_src_stages = 0
+        for name, resource in self.resources.items():
+            state = states.get(name)
+            if resource.imported and resource.final_layout is not None and state is not None and state.layout != resource.final_layout:
+                self.final_barriers.append((name, state.layout, resource.final_layout, state.write_access, 0))
+                self.final_src_stages |= state.write_stages | state.read_stages
+
+    def add_barrier(self, graph_pass, name, old_layout, new_layout, src_stages, src_access, dst_stages, dst_access):
+
+        # Barriers of a pass are recorded together, in a single vkCmdPipelineBarrier before it
+        graph_pass.barriers.append((name, old_layout, new_layout, src_access, dst_access))
+        graph_pass.src_stages |= src_stages
+        graph_pass.dst_stages |= dst_stages
+
+    def create_render_passes(self):
+
+        # One render pass per pass drawing into attachments. Layout changes are done by the graph's barriers, so attachments start and end
+        # in the layout the pass uses them in. Contents nobody reads afterwards aren't stored
+        for graph_pass in self.kept:
+
+            attachment_uses = [(name, USAGES[usage_name]) for name, usage_name, writes in graph_pass.uses if USAGES[usage_name].attachment]
+            if not attachment_uses:
+                continue
+
+            descriptions = []
+            color_refs = []
+            depth_ref = None
+            graph_pass.attachments = []
+            graph_pass.load_ops = []
+            graph_pass.store_ops = []
+            for i, (name, usage) in enumerate(attachment_uses):
+                resource = self.resources[name]
+
+                if graph_pass.index != resource.first:
+                    load_op = VK_ATTACHMENT_LOAD_OP_LOAD
+                elif resource.clear_value is not None:
+                    load_op = VK_ATTACHMENT_LOAD_OP_CLEAR
+                elif resource.imported and resource.initial_layout != VK_IMAGE_LAYOUT_UNDEFINED:
+                    load_op = VK_ATTACHMENT_LOAD_OP_LOAD
+                else:
+                    load_op = VK_ATTACHMENT_LOAD_OP_DONT_CARE
+                store_op = VK_ATTACHMENT_STORE_OP_STORE if resource.imported or graph_pass.index < resource.last else VK_ATTACHMENT_STORE_OP_DONT_CARE
+
+                descriptions.append(VkAttachmentDescription(format = resource.format, samples = VK_SAMPLE_COUNT_1_BIT, loadOp = load_op, storeOp = store_op,
+                    stencilLoadOp = load_op, stencilStoreOp = store_op, initialLayout = usage.layout, finalLayout = usage.layout))
+                if usage is USAGES["depth"]:
+                    depth_ref = VkAttachmentReference(attachment = i, layout = usage.layout)
+                else:
+                    color_refs.append(VkAttachmentReference(attachment = i, layout = usage.layout))
+
+                graph_pass.attachments.append(name)
+                graph_pass.load_ops.append(load_op)
+                graph_pass.store_ops.append(store_op)
+
+            subpass = VkSubpassDescription(pipelineBindPoint = VK_PIPELINE_BIND_POINT_GRAPHICS, colorAttachmentCount = len(color_refs), pColorAttachments = color_refs or None,
+                pDepthStencilAttachment = depth_ref)
+            render_pass_info = VkRenderPassCreateInfo(attachmentCount = len(descriptions), pAttachments = descriptions, subpassCount = 1, pSubpasses = [subpass,])
+            graph_pass.renderpass = vkCreateRenderPass(self.device, render_pass_info, None)
+            graph_pass.extent = self.resources[graph_pass.attachments[0]].extent
+
+    def compile(self, allocator):
+
+        # Can be called again after passes or resources changed, everything made by the previous compile is destroyed first
+        self.destroy()
+        self.allocator = allocator
+
+        self.cull()
+        self.compute_lifetimes()
+        self.create_images(allocator)
+        self.plan_barriers()
+        self.create_render_passes()
+
+    def get_framebuffer(self, graph_pass):
+
+        views = tuple(self.resources[name].view for name in graph_pass.attachments)
+        framebuffer = graph_pass.framebuffers.get(views)
+        if framebuffer is None:
+            framebuffer_info = VkFramebufferCreateInfo(renderPass = graph_pass.renderpass, attachmentCount = len(views), pAttachments = list(views),
+                width = graph_pass.extent.width, height = graph_pass.extent.height, layers = 1)
+            framebuffer = graph_pass.framebuffers[views] = vkCreateFramebuffer(self.device, framebuffer_info, None)
+        return framebuffer
+
+    def record_barriers(self, command_buffer, barriers, src_stages, dst_stages):
+
+        if not barriers:
+            return
+
+        image_barriers = []
+        for name, old_layout, new_layout, src_access, dst_access in barriers:
+            resource = self.resources[name]
+            subresource_range = VkImageSubresourceRange(aspectMask = aspect_mask(resource.format), baseMipLevel = 0, levelCount = 1, baseArrayLayer = 0, layerCount = 1)
+            image_barriers.append(VkImageMemoryBarrier(srcAccessMask = src_access, dstAccessMask = dst_access, oldLayout = old_layout, newLayout = new_layout,
+                srcQueueFamilyIndex = VK_QUEUE_FAMILY_IGNORED, dstQueueFamilyIndex = VK_QUEUE_FAMILY_IGNORED, image = resource.image, subresourceRange = subresource_range))
+
+        vkCmdPipelineBarrier(command_buffer, src_stages or VK_PIPELINE_STAGE_TOP_OF_PIPE_BIT, dst_stages or VK_PIPELINE_STAGE_BOTTOM_OF_PIPE_BIT, 0, 0, None, 0, None,
+            len(image_barriers), image_barriers)
+
+    def execute(self, command_buffer):
+
+        # Records every kept pass, with its barriers, into command_buffer
+        for graph_pass in self.kept:
+
+            self.record_barriers(command_buffer, graph_pass.barriers, graph_pass.src_stages, graph_pass.dst_stages)
+
+            if graph_pass.renderpass is None:
+                graph_pass.record(command_buffer, graph_pass)
+                continue
+
+            clear_values = [self.resources[name].clear_value if self.resources[name].clear_value is not None else VkClearValue() for name in graph_pass.attachments]
+            renderpass_info = VkRenderPassBeginInfo(renderPass = graph_pass.renderpass, framebuffer = self.get_framebuffer(graph_pass),
+                renderArea = [[0,0], graph_pass.extent], clearValueCount = len(clear_values), pClearValues = clear_values)
+            vkCmdBeginRenderPass(command_buffer, renderpass_info, VK_SUBPASS_CONTENTS_INLINE)
+            graph_pass.record(command_buffer, graph_pass)
+            vkCmdEndRenderPass(command_buffer)
+
+        self.record_barriers(command_buffer, self.final_barriers, self.final_src_stages, VK_PIPELINE_STAGE_BOTTOM_OF_PIPE_BIT)
+
+    def stats(self):
+
+        return {"passes": len(self.passes), "culled_passes": [graph_pass.name for graph_pass in self.culled],
+            "barriers": sum(len(graph_pass.barriers) for graph_pass in self.kept) + len(self.final_barriers),
+            "pipeline_barrier_calls": sum(1 for graph_pass in self.kept if graph_pass.barriers) + int(bool(self.final_barriers)),
+            "memory_without_aliasing": self.memory_without_aliasing, "memory_with_aliasing": self.memory_with_aliasing}
+
+    def print_report(self):
+
+        stats = self.stats()
+        print("Render graph: {} of {} passes kept{}".format(len(self.kept), stats["passes"],
+            ", culled " + ", ".join(stats["culled_passes"]) if stats["culled_passes"] else ""))
+        print("Render graph: {} image barriers in {} vkCmdPipelineBarrier calls".format(stats["barriers"], stats["pipeline_barrier_calls"]))
+
+        saved = stats["memory_without_aliasing"] - stats["memory_with_aliasing"]
+        print("Render graph: peak attachment memory {:.2f} MiB without aliasing, {:.2f} MiB with ({:.2f} MiB saved)".format(
+            stats["memory_without_aliasing"] / (1024 * 1024), stats["memory_with_aliasing"] / (1024 * 1024), saved / (1024 * 1024)))
+
+    def destroy(self):
+
+        # The GPU has to be done with every command buffer the graph was executed in
+        for graph_pass in self.kept:
+            for framebuffer in graph_pass.framebuffers.values():
+                vkDestroyFramebuffer(self.device, framebuffer, None)
+            graph_pass.framebuffers = {}
+            if graph_pass.renderpass is not None:
+                vkDestroyRenderPass(self.device, graph_pass.renderpass, None)
+                graph_pass.renderpass = None
+
+        for resource in self.resources.values():
+            if not resource.imported and resource.image is not None:
+                vkDestroyImageView(self.device, resource.view, None)
+                vkDestroyImage(self.device, resource.image, None)
+                resource.image = resource.view = None
+                resource.heap = None
+
+        for heap in self.heaps:
+            self.allocator.free(heap)
+        self.heaps = []
+        self.memory_without_aliasing = 0
+        self.memory_with_aliasing = 0
@@ -0,0 +1,180 @@
+import hashlib
+import mmap
+import os
+import shutil
+import subprocess
+import sys
+import threading
+
+from vulkan import *
+
+# Compiled SPIR-V is stored here, named after the hash of everything that affects the output, so unchanged shaders are never compiled twice
+DEFAULT_CACHE_DIR = os.path.join("shaders", ".spv_cache")
+
+# Stage is deduced from the file extension, same convention glslc uses
+SHADER_STAGES = {
+    ".vert": "vert",
+    ".frag": "frag",
+    ".comp": "comp",
+    ".geom": "geom",
+    ".tesc": "tesc",
+    ".tese": "tese",
+}
+
+def find_compiler():
+
+    # glslc is preferred, glslangValidator works as well. Both ship with the Vulkan SDK and with most Linux distributions
+    search_path = os.environ.get("PATH", "")
+    sdk = os.environ.get("VULKAN_SDK")
+    if sdk:
+        search_path = os.path.join(sdk, "bin") + os.pathsep + search_path
+
+    for name in ("glslc", "glslangValidator"):
+        path = shutil.which(name, path = search_path)
+        if path is not None:
+            return path
+
+    return None
+
+def compiler_arguments(compiler, source_path, output_path, defines):
+
+    stage = SHADER_STAGES[os.path.splitext(source_path)[1]]
+    macro_flags = ["-D{}={}".format(name, value) for name, value in sorted(defines.items())]
+
+    if os.path.basename(compiler).startswith("glslangValidator"):
+        return [compiler, "-V", "-S", stage] + macro_flags + [source_path, "-o", output_path]
+    return [compiler, "-fshader-stage=" + stage] + macro_flags + [source_path, "-o", output_path]
+
+# Compiler path -> its --version output, asked once per process since a build may hash many shaders
+compiler_versions = {}
+compiler_versions_lock = threading.Lock()
+
+def compiler_version(compiler):
+
+    with compiler_versions_lock:
+        version = compiler_versions.get(compiler)
+        if version is None:
+            try:
+                result = subprocess.run([compiler, "--version"], capture_output = True, text = True)
+                version = result.stdout + result.stderr
+            except OSError:
+                version = ""
+            compiler_versions[compiler] = version
+        return version
+
+def content_hash(source_path, compiler, defines):
+
+    # The output only depends on the source, the compiler and its version, and the defines. Shaders using #include are not supported by this hash
+    digest = hashlib.sha256()
+    with open(source_path, 'rb') as file:
+        digest.update(file.read())
+    digest.update(os.path.basename(compiler).encode())
+    digest.update(compiler_version(compiler).encode())
+    for name, value in sorted(defines.items()):
+        digest.update("{}={};".format(name, value).encode())
+
+    return digest.hexdigest()[:16]
+
+def compile_shader(source_path, defines = None, cache_dir = DEFAULT_CACHE_DIR, compiler = None):
+
+    # Returns the path of the SPIR-V for source_path, compiling it only if the cache doesn't already have it
+    defines = defines or {}
+    compiler = compiler or find_compiler()
+    if compiler is None:
+        raise RuntimeError("No GLSL compiler found, install glslc or glslangValidator or set VULKAN_SDK")
+
+    name = os.path.basename(source_path)
+    output_path = os.path.join(cache_dir, "{}.{}.spv".format(name, content_hash(source_path, compiler, defines)))
+    if os.path.exists(output_path):
+        return output_path
+
+    # Compiling into a temporary file and renaming it means that a failed or interrupted build never leaves a bad cache entry
+    os.makedirs(cache_dir, exist_ok = True)
+    temporary_path = "{}.{}.tmp".format(output_path, os.getpid())
+    result = subprocess.run(compiler_arguments(compiler, source_path, temporary_path, defines), capture_output = True, text = True)
+    if result.returncode != 0:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise RuntimeError("Failed to compile {}:\n{}{}".format(source_path, result.stdout, result.stderr))
+
+    os.replace(temporary_path, output_path)
+    return output_path
+
+def get_spirv_path(source_path, prebuilt_path = None, defines = None, cache_dir = DEFAULT_CACHE_DIR):
+
+    # Compiles from source when a compiler is available, otherwise falls back to the SPIR-V shipped with the project
+    if find_compiler() is None and prebuilt_path is not None:
+        return prebuilt_path
+
+    return compile_shader(source_path, defines, cache_dir)
+
+def load_spirv(filename):
+
+    # Memory maps the file, so the OS pages the code in directly instead of copying it through Python. The map stays valid until closed
+    with open(filename, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            raise RuntimeError("Empty SPIR-V file: " + filename)
+        return mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+
+class ShaderModuleCache:
+
+    # Shares VkShaderModules between pipelines. Every acquire needs a matching release, and a module is destroyed once nobody holds it anymore
+    def __init__(self, device):
+
+        self.device = device
+        self.modules = {} # Keyed by absolute path, values are [module, reference count]
+        self.lock = threading.Lock()
+
+    def acquire(self, filename):
+
+        key = os.path.abspath(filename)
+
+        with self.lock:
+            entry = self.modules.get(key)
+            if entry is None:
+                entry = [create_shader_module(self.device, filename), 0]
+                self.modules[key] = entry
+            entry[1] += 1
+            return entry[0]
+
+    def release(self, filename):
+
+        key = os.path.abspath(filename)
+
+        with self.lock:
+            entry = self.modules.get(key)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] <= 0:
+                vkDestroyShaderModule(self.device, entry[0], None)
+                del self.modules[key]
+
+    def destroy(self):
+
+        with self.lock:
+            for module, references in self.modules.values():
+                vkDestroyShaderModule(self.device, module, None)
+            self.modules = {}
+
+def create_shader_module(device, filename):
+
+    # The driver copies the code while creating the module, so the mapping can be closed right after
+    code = load_spirv(filename)
+    try:
+        create_info = VkShaderModuleCreateInfo(sType=VK_STRUCTURE_TYPE_SHADER_MODULE_CREATE_INFO, codeSize=len(code), pCode=code)
+        module = vkCreateShaderModule(device = device, pCreateInfo = create_info, pAllocator = None)
+        del create_info
+        return module
+    finally:
+        code.close()
+
+#BUILD ENTRY POINT. Compiles every shader passed as argument, or every shader in the shaders folder, printing where its SPIR-V ended up
+if __name__ == "__main__":
+
+    sources = sys.argv[1:]
+    if not sources:
+        sources = [os.path.join("shaders", name) for name in sorted(os.listdir("shaders")) if os.path.splitext(name)[1] in SHADER_STAGES]
+
+    for source in sources:
+        print("{} -> {}".format(source, compile_shader(source)))
@@ -1,2 +1,5 @@
 C:\VulkanSDK\1.2.198.1\Bin\glslc.exe shader.vert -o vert.spv
-C:\VulkanSDK\1.2.198.1\Bin\glslc.exe shader.frag -o frag.spv
\ No newline at end of file
+C:\VulkanSDK\1.2.198.1\Bin\glslc.exe shader.frag -o frag.spv
+C:\VulkanSDK\1.2.198.1\Bin\glslc.exe mesh.vert -o mesh.vert.spv
+C:\VulkanSDK\1.2.198.1\Bin\glslc.exe instanced.vert -o instanced.vert.spv
+C:\VulkanSDK\1.2.198.1\Bin\glslc.exe saxpy.comp -o saxpy.comp.spv
\ No newline at end of file
@@ -0,0 +1,3 @@
+#!/bin/sh
+# Linux counterpart of compile_shaders.bat. Compiled SPIR-V goes to shaders/.spv_cache, named after the content hash of its source
+cd "$(dirname "$0")/.." && python shader_library.py "$@"
@@ -0,0 +1,23 @@
+#version 450
+
+// Per vertex
+layout(location = 0) in vec2 position;
+layout(location = 1) in vec3 color;
+
+// Per instance
+layout(location = 2) in vec2 instanceOffset;
+layout(location = 3) in float instanceScale;
+layout(location = 4) in vec3 instanceColor;
+
+// Per frame, shared with mesh.vert
+layout(set = 0, binding = 0) uniform FrameData {
+	mat4 transform;
+	float time;
+} frame;
+
+layout(location = 0) out vec3 fragColor;
+
+void main() {
+	gl_Position = frame.transform * vec4(position * instanceScale + instanceOffset, 0.0, 1.0);
+	fragColor = color * instanceColor;
+}
@@ -0,0 +1,23 @@
+#version 450
+
+layout(location = 0) in vec2 position;
+layout(location = 1) in vec3 color;
+
+// Per frame, from uniforms.UniformRing. Bound with a dynamic offset that selects the frame's slot
+layout(set = 0, binding = 0) uniform FrameData {
+	mat4 transform;
+	float time;
+} frame;
+
+// Per draw, see uniforms.PUSH_CONSTANT_DTYPE
+layout(push_constant) uniform DrawData {
+	vec2 offset;
+	float scale;
+} draw;
+
+layout(location = 0) out vec3 fragColor;
+
+void main() {
+	gl_Position = frame.transform * vec4(position * draw.scale + draw.offset, 0.0, 1.0);
+	fragColor = color;
+}
@@ -0,0 +1,92 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+
+# Width of the bars drawn by StartupTimeline.print_timeline
+TIMELINE_WIDTH = 50
+
+class StartupTimeline:
+
+    # Start and end of every initialization step, relative to origin, along with the thread it ran on
+    def __init__(self, origin = None):
+
+        self.origin = origin if origin is not None else time.perf_counter()
+        self.steps = [] # (name, thread name, start, end) tuples, in seconds
+        self.lock = threading.Lock()
+
+    def record(self, name, start, end):
+        with self.lock:
+            self.steps.append((name, threading.current_thread().name, start - self.origin, end - self.origin))
+
+    def run(self, name, function, *args, **kwargs):
+
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self.record(name, start, time.perf_counter())
+
+    @contextmanager
+    def step(self, name):
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter())
+
+    def mark(self, name):
+        # Zero length step, for milestones such as the first frame
+        now = time.perf_counter()
+        self.record(name, now, now)
+
+    def total(self):
+        return max(end for name, thread, start, end in self.steps) if self.steps else 0.0
+
+    def print_timeline(self):
+
+        total = self.total() or 1.0
+        print("{:<28} {:<14} {:>9} {:>9}  {}".format("Startup step", "Thread", "Start ms", "Took ms", "Timeline ({:.1f} ms)".format(total * 1000.0)))
+        for name, thread, start, end in sorted(self.steps, key = lambda step: step[2]):
+            first = int(start / total * TIMELINE_WIDTH)
+            length = max(1, int(round((end - start) / total * TIMELINE_WIDTH)))
+            bar = " " * first + "#" * min(length, TIMELINE_WIDTH - first)
+            print("{:<28} {:<14} {:>9.1f} {:>9.1f}  |{:<50}|".format(name, thread[:14], start * 1000.0, (end - start) * 1000.0, bar))
+
+class InitScheduler:
+
+    # Runs independent initialization steps on a thread pool while the main thread keeps going with the rest. Vulkan object creation is
+    # thread safe as long as no externally synchronized object (queues, command pools) is shared, and the driver work of vkCreate* calls runs
+    # without the GIL. With 0 workers every step runs right away on the calling thread, which keeps the serial order for comparison
+    def __init__(self, timeline, worker_count = 4):
+
+        self.timeline = timeline
+        self.executor = ThreadPoolExecutor(max_workers = worker_count, thread_name_prefix = "init") if worker_count > 0 else None
+        self.futures = {}
+
+    def submit(self, name, function, *args, **kwargs):
+
+        if self.executor is not None:
+            future = self.executor.submit(self.timeline.run, name, function, *args, **kwargs)
+        else:
+            future = Future()
+            try:
+                future.set_result(self.timeline.run(name, function, *args, **kwargs))
+            except BaseException as error:
+                future.set_exception(error)
+
+        self.futures[name] = future
+        return future
+
+    def result(self, name):
+        # Waits for a step and returns its result, re-raising anything it raised
+        return self.futures[name].result()
+
+    def shutdown(self):
+
+        # Every step has to be finished before the program is usable, errors included
+        for future in self.futures.values():
+            future.result()
+        if self.executor is not None:
+            self.executor.shutdown(wait = True)
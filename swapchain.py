@@ -1,13 +1,30 @@
 from vulkan import *
 
+# Present modes to try for each policy, in order of preference. FIFO is the only mode every device has to support, so it always comes last
+PRESENT_POLICIES = {
+    "low_latency": [VK_PRESENT_MODE_MAILBOX_KHR, VK_PRESENT_MODE_FIFO_KHR], # Newest frame shown at the next refresh, never tears
+    "uncapped": [VK_PRESENT_MODE_IMMEDIATE_KHR, VK_PRESENT_MODE_MAILBOX_KHR, VK_PRESENT_MODE_FIFO_KHR], # Opt-in, lowest latency but tears and renders as fast as it can
+    "vsync": [VK_PRESENT_MODE_FIFO_KHR], # Capped to the refresh rate, lowest power
+    "adaptive": [VK_PRESENT_MODE_FIFO_RELAXED_KHR, VK_PRESENT_MODE_FIFO_KHR], # Like vsync, but late frames tear instead of waiting a whole refresh
+}
+
+PRESENT_MODE_NAMES = {
+    VK_PRESENT_MODE_IMMEDIATE_KHR: "IMMEDIATE",
+    VK_PRESENT_MODE_MAILBOX_KHR: "MAILBOX",
+    VK_PRESENT_MODE_FIFO_KHR: "FIFO",
+    VK_PRESENT_MODE_FIFO_RELAXED_KHR: "FIFO_RELAXED",
+}
+
 class SwapChainFrame:
 
     def __init__(self):
         
         self.image = None
         self.image_view = None
-        self.frame_buffer = None
-        self.command_buffer = None
+        self.framebuffer = None
+        self.commandbuffer = None
+        self.secondary_commandbuffers = [] # Recorded by a recording.ParallelRecorder, when one is in use
+        self.dirty = True # Command buffer needs to be (re)recorded before being submitted
 
 class SwapChainBundle:
 
@@ -18,40 +35,74 @@ class SwapChainBundle:
         self.color_format = None # Color format space
         self.extent = None # Frame sizes
         self.present_mode = None # Mode to present images, such as mailbox or fifo
+        self.present_policy = None # Key of PRESENT_POLICIES the present mode was picked with
+        self.requested_image_count = None # Image count asked for, the driver may create more
         self.surface_capabilities = None
+        self.capturable = False # Images can be copied from, which capture.FrameCapture needs
+
+def choose_surface_format(color_formats):
+
+    # 8 bit BGRA with the standard sRGB color space if available, otherwise whatever the surface lists first
+    for format in color_formats:
+        if (format.format == VK_FORMAT_B8G8R8A8_UNORM and format.colorSpace == VK_COLOR_SPACE_SRGB_NONLINEAR_KHR):
+            return format
+    return color_formats[0]
+
+def choose_present_mode(present_modes, present_policy):
+
+    if present_policy not in PRESENT_POLICIES:
+        print("ERROR: Unknown present policy '{}', using vsync".format(present_policy))
+        present_policy = "vsync"
+
+    for mode in PRESENT_POLICIES[present_policy]:
+        if mode in present_modes:
+            return mode
+    return VK_PRESENT_MODE_FIFO_KHR
+
+def choose_image_count(capabilities, requested_count = None):
+
+    # minImageCount is what the presentation engine holds on to itself, so with exactly that many images we often wait for one to be released.
+    # One more by default. A maxImageCount of 0 means there is no upper limit
+    if requested_count is None:
+        requested_count = capabilities.minImageCount + 1
 
-def create_swapchain(instance, logicalDevice, physicalDevice, surface, width, height, queue_indices):
+    image_count = max(capabilities.minImageCount, requested_count)
+    if capabilities.maxImageCount > 0:
+        image_count = min(capabilities.maxImageCount, image_count)
+    return image_count
+
+def describe_swapchain(bundle):
+    return "Swapchain: {} present mode ({} policy), {} images (requested {}, surface allows {} to {}), {}x{}".format(
+        PRESENT_MODE_NAMES.get(bundle.present_mode, bundle.present_mode), bundle.present_policy, len(bundle.frames), bundle.requested_image_count,
+        bundle.surface_capabilities.minImageCount, bundle.surface_capabilities.maxImageCount or "any", bundle.extent.width, bundle.extent.height)
+
+def create_swapchain(dispatch, logicalDevice, physicalDevice, surface, width, height, queue_indices, old_swapchain = VK_NULL_HANDLE, present_policy = "low_latency",
+    image_count = None):
 
     my_bundle = SwapChainBundle()
 
     # Store surface capabilities
-    vkGetPhysicalDeviceSurfaceCapabilitiesKHR = vkGetInstanceProcAddr(instance, 'vkGetPhysicalDeviceSurfaceCapabilitiesKHR')
-    my_bundle.surface_capabilites = vkGetPhysicalDeviceSurfaceCapabilitiesKHR(physicalDevice, surface)
+    my_bundle.surface_capabilities = dispatch.vkGetPhysicalDeviceSurfaceCapabilitiesKHR(physicalDevice, surface)
 
     # Set color space format
-    vkGetPhysicalDeviceSurfaceFormatsKHR = vkGetInstanceProcAddr(instance, 'vkGetPhysicalDeviceSurfaceFormatsKHR')
-    color_formats = vkGetPhysicalDeviceSurfaceFormatsKHR(physicalDevice, surface)
-
-    for format in color_formats:
-        if (format.format == VK_FORMAT_B8G8R8A8_UNORM and format.colorSpace == VK_COLOR_SPACE_SRGB_NONLINEAR_KHR):
-            my_bundle.color_format =  format
-        else:
-            my_bundle.color_format =  color_formats[0]
+    color_formats = dispatch.vkGetPhysicalDeviceSurfaceFormatsKHR(physicalDevice, surface)
+    my_bundle.color_format = choose_surface_format(color_formats)
 
-    # Set present mode
-    vkGetPhysicalDeviceSurfacePresentModesKHR = vkGetInstanceProcAddr(instance, 'vkGetPhysicalDeviceSurfacePresentModesKHR')
-    present_modes = vkGetPhysicalDeviceSurfacePresentModesKHR(physicalDevice, surface)
+    # Set present mode, the first one the policy lists that the surface supports
+    present_modes = dispatch.vkGetPhysicalDeviceSurfacePresentModesKHR(physicalDevice, surface)
+    my_bundle.present_mode = choose_present_mode(present_modes, present_policy)
+    my_bundle.present_policy = present_policy
 
-    for mode in present_modes:
-        if mode == VK_PRESENT_MODE_MAILBOX_KHR:
-            my_bundle.present_mode = mode
-        else:
-            my_bundle.present_mode = VK_PRESENT_MODE_FIFO_KHR
+    # Set image count. More images let the CPU and GPU run further ahead of the display, at the cost of memory and, with FIFO, latency
+    my_bundle.requested_image_count = choose_image_count(my_bundle.surface_capabilities, image_count)
 
-    # Set extent
+    # Set extent. Most window systems dictate it through currentExtent, the special value 0xFFFFFFFF means we get to pick it ourselves
+    if my_bundle.surface_capabilities.currentExtent.width != 0xFFFFFFFF:
+        width = my_bundle.surface_capabilities.currentExtent.width
+        height = my_bundle.surface_capabilities.currentExtent.height
     extent = VkExtent2D(width, height)
-    extent.width = min(my_bundle.surface_capabilites.maxImageExtent.width, max(my_bundle.surface_capabilites.minImageExtent.width, extent.width))
-    extent.height = min(my_bundle.surface_capabilites.maxImageExtent.height,max(my_bundle.surface_capabilites.minImageExtent.height, extent.height))
+    extent.width = min(my_bundle.surface_capabilities.maxImageExtent.width, max(my_bundle.surface_capabilities.minImageExtent.width, extent.width))
+    extent.height = min(my_bundle.surface_capabilities.maxImageExtent.height,max(my_bundle.surface_capabilities.minImageExtent.height, extent.height))
     my_bundle.extent = extent
 
     # Additional info setup for swapchain creation. In our case, the families should be the same
@@ -64,23 +115,27 @@ def create_swapchain(instance, logicalDevice, physicalDevice, surface, width, he
         queue_family_index_count = 0 # Number of family queues that access swapchain's images. Only needs to be set if sharing mode is Concurrent.
         pointer_queue_family_indices = None
 
+    # Images are also copied from when supported, so frames can be captured. Rendering doesn't need it
+    image_usage = VK_IMAGE_USAGE_COLOR_ATTACHMENT_BIT
+    if my_bundle.surface_capabilities.supportedUsageFlags & VK_IMAGE_USAGE_TRANSFER_SRC_BIT:
+        image_usage |= VK_IMAGE_USAGE_TRANSFER_SRC_BIT
+        my_bundle.capturable = True
+
     # Info for swapchain creation
     createInfo = VkSwapchainCreateInfoKHR(
-        surface = surface, minImageCount = my_bundle.surface_capabilites.minImageCount, imageFormat = my_bundle.color_format.format,
+        surface = surface, minImageCount = my_bundle.requested_image_count, imageFormat = my_bundle.color_format.format,
         imageColorSpace = my_bundle.color_format.colorSpace, imageExtent = my_bundle.extent, imageArrayLayers = 1,
-        imageUsage = VK_IMAGE_USAGE_COLOR_ATTACHMENT_BIT, imageSharingMode = img_sharing_mode,
+        imageUsage = image_usage, imageSharingMode = img_sharing_mode,
         queueFamilyIndexCount = queue_family_index_count, pQueueFamilyIndices = pointer_queue_family_indices,
-        preTransform = my_bundle.surface_capabilites.currentTransform, compositeAlpha = VK_COMPOSITE_ALPHA_OPAQUE_BIT_KHR,
-        presentMode = my_bundle.present_mode, clipped = VK_TRUE
+        preTransform = my_bundle.surface_capabilities.currentTransform, compositeAlpha = VK_COMPOSITE_ALPHA_OPAQUE_BIT_KHR,
+        presentMode = my_bundle.present_mode, clipped = VK_TRUE,
+        oldSwapchain = old_swapchain # When recreating, lets the driver hand resources over from the old swapchain, which stays valid until we destroy it
     )
 
     # Create actual swapchain
-    vkCreateSwapchainKHR = vkGetDeviceProcAddr(logicalDevice, 'vkCreateSwapchainKHR')
-    my_bundle.swapchain = vkCreateSwapchainKHR(logicalDevice, createInfo, None)
-    
+    my_bundle.swapchain = dispatch.vkCreateSwapchainKHR(logicalDevice, createInfo, None)
 
-    vkGetSwapchainImagesKHR = vkGetDeviceProcAddr(logicalDevice, 'vkGetSwapchainImagesKHR')
-    images = vkGetSwapchainImagesKHR(logicalDevice, my_bundle.swapchain)
+    images = dispatch.vkGetSwapchainImagesKHR(logicalDevice, my_bundle.swapchain)
 
     # Creating an Image View for each image in swapchain
     for image in images:
@@ -99,4 +154,14 @@ def create_swapchain(instance, logicalDevice, physicalDevice, surface, width, he
         # Set frames, made up by the swapchain/drivers images and ImageViews
         my_bundle.frames.append(swapchain_frame)
     
-    return my_bundle
\ No newline at end of file
+    return my_bundle
+
+def destroy_swapchain(dispatch, logicalDevice, bundle):
+
+    # Framebuffers are made by the engine, but they belong to a single swapchain image so they go away along with it
+    for frame in bundle.frames:
+        if frame.framebuffer is not None:
+            vkDestroyFramebuffer(device = logicalDevice, framebuffer = frame.framebuffer, pAllocator = None)
+        vkDestroyImageView(device = logicalDevice, imageView = frame.image_view, pAllocator = None)
+
+    dispatch.vkDestroySwapchainKHR(logicalDevice, bundle.swapchain, None)
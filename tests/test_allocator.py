@@ -0,0 +1,71 @@
+import types
+
+import allocator
+
+def test_alignment_padding_goes_back_to_free_list():
+
+    block = allocator.MemoryBlock(None, 1024, 0)
+    assert block.allocate(10, 1) == 0
+    assert block.allocate(100, 256) == 256
+
+    # The 246 bytes skipped to reach the alignment stay usable
+    assert block.free_ranges == [(10, 246), (356, 668)]
+    assert block.used == 110
+    assert block.allocate(200, 1) == 10
+
+def test_free_merges_with_both_neighbours():
+
+    block = allocator.MemoryBlock(None, 300, 0)
+    offsets = [block.allocate(100, 1) for i in range(3)]
+    assert offsets == [0, 100, 200]
+
+    block.free(0, 100)
+    block.free(200, 100)
+    assert block.free_ranges == [(0, 100), (200, 100)]
+
+    block.free(100, 100)
+    assert block.free_ranges == [(0, 300)]
+    assert block.used == 0
+
+def test_largest_free_range_after_fragmentation():
+
+    block = allocator.MemoryBlock(None, 1000, 0)
+    offsets = [block.allocate(100, 1) for i in range(10)]
+    for offset in offsets[::2]:
+        block.free(offset, 100)
+
+    # Half the block is free, but only in 100 byte pieces
+    assert block.largest_free_range() == 100
+    assert block.allocate(200, 1) is None
+
+    block.free(offsets[1], 100)
+    assert block.largest_free_range() == 300
+    assert block.allocate(300, 1) == 0
+
+def make_allocator(monkeypatch, block_size, dedicated_threshold):
+
+    # Only the bookkeeping is exercised, the Vulkan calls it makes are replaced
+    monkeypatch.setattr(allocator.memory, "find_memory_type", lambda physical_device, type_bits, properties: 0)
+    monkeypatch.setattr(allocator, "vkGetPhysicalDeviceMemoryProperties", lambda physical_device: types.SimpleNamespace(
+        memoryTypes = [types.SimpleNamespace(propertyFlags = 0)]), raising = False)
+    monkeypatch.setattr(allocator, "VkMemoryAllocateInfo", lambda allocationSize, memoryTypeIndex: allocationSize, raising = False)
+    monkeypatch.setattr(allocator, "vkAllocateMemory", lambda device, alloc_info, callbacks: "memory of {}".format(alloc_info), raising = False)
+    return allocator.MemoryAllocator(None, None, block_size, dedicated_threshold)
+
+def test_bigger_than_a_block_is_dedicated(monkeypatch):
+
+    memory_allocator = make_allocator(monkeypatch, 1024, 4096)
+    allocation = memory_allocator.allocate(types.SimpleNamespace(size = 2000, alignment = 16, memoryTypeBits = 1), 0)
+
+    assert allocation.block is None
+    assert allocation.offset == 0
+    assert memory_allocator.dedicated == [allocation]
+
+def test_small_allocations_share_a_block(monkeypatch):
+
+    memory_allocator = make_allocator(monkeypatch, 1024, None)
+    first = memory_allocator.allocate(types.SimpleNamespace(size = 100, alignment = 64, memoryTypeBits = 1), 0)
+    second = memory_allocator.allocate(types.SimpleNamespace(size = 100, alignment = 64, memoryTypeBits = 1), 0)
+
+    assert first.block is second.block
+    assert (first.offset, second.offset) == (0, 128)
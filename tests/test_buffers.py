@@ -0,0 +1,22 @@
+import numpy
+import pytest
+
+import buffers
+
+def test_empty_upload_raises():
+
+    # Raised before the allocator is touched, so no buffer of size 0 ever reaches Vulkan
+    with pytest.raises(ValueError):
+        buffers.upload_array(None, None, None, numpy.zeros(0, dtype = numpy.float32), 0)
+
+def test_mesh_rejects_other_dtypes():
+
+    with pytest.raises(ValueError):
+        buffers.create_mesh(None, None, None, numpy.zeros(15, dtype = numpy.float32))
+
+def test_mesh_rejects_empty_arrays():
+
+    with pytest.raises(ValueError):
+        buffers.create_mesh(None, None, None, numpy.zeros(0, dtype = buffers.VERTEX_DTYPE))
+    with pytest.raises(ValueError):
+        buffers.create_mesh(None, None, None, numpy.zeros(3, dtype = buffers.VERTEX_DTYPE), numpy.zeros(0, dtype = numpy.uint16))
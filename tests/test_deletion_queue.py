@@ -0,0 +1,56 @@
+import deletion_queue
+
+def make_queue(entries):
+
+    # entries are (frame number, name) pairs, destroying one appends its name to the returned list
+    destroyed = []
+    queue = deletion_queue.DeletionQueue()
+    for frame_number, name in entries:
+        queue.push(frame_number, lambda name = name: destroyed.append(name), name)
+    return queue, destroyed
+
+def test_flush_waits_for_the_frame():
+
+    queue, destroyed = make_queue([(1, "pipeline"), (3, "swapchain")])
+
+    queue.flush(0)
+    assert destroyed == []
+
+    queue.flush(1)
+    assert destroyed == ["pipeline"]
+    assert queue.pending() == ["swapchain"]
+
+    queue.flush(2)
+    assert destroyed == ["pipeline"]
+
+    queue.flush(3)
+    assert destroyed == ["pipeline", "swapchain"]
+    assert len(queue) == 0
+    assert queue.destroyed == 2
+
+def test_flush_keeps_push_order():
+
+    queue, destroyed = make_queue([(2, "first"), (2, "second"), (4, "third")])
+    queue.flush(10)
+    assert destroyed == ["first", "second", "third"]
+
+def test_out_of_order_push_is_clamped():
+
+    # Tagged with an older frame than the entry before it, so it waits for that entry's frame instead of jumping the queue
+    queue, destroyed = make_queue([(5, "newer"), (2, "older")])
+    assert queue.entries[1][0] == 5
+
+    queue.flush(4)
+    assert destroyed == []
+
+    queue.flush(5)
+    assert destroyed == ["newer", "older"]
+
+def test_drain_destroys_everything_in_order():
+
+    queue, destroyed = make_queue([(1, "a"), (7, "b"), (9, "c")])
+    queue.flush(1)
+    queue.drain()
+
+    assert destroyed == ["a", "b", "c"]
+    assert len(queue) == 0
@@ -0,0 +1,81 @@
+import numpy
+import pytest
+
+import buffers
+import draw_list
+
+def triangle():
+
+    vertices = numpy.zeros(3, dtype = buffers.VERTEX_DTYPE)
+    return vertices, [0, 1, 2]
+
+def quad():
+
+    vertices = numpy.zeros(4, dtype = buffers.VERTEX_DTYPE)
+    return vertices, [0, 1, 2, 2, 3, 0]
+
+def test_mesh_ids_and_table_after_several_adds():
+
+    pool = draw_list.GeometryPool()
+    ids = [pool.add_mesh(*triangle()), pool.add_mesh(*quad()), pool.add_mesh(*triangle())]
+    assert ids == [0, 1, 2]
+
+    index_counts, first_indices, vertex_offsets = pool.mesh_table()
+    assert list(index_counts) == [3, 6, 3]
+    assert list(first_indices) == [0, 3, 9]
+    assert list(vertex_offsets) == [0, 3, 7]
+
+    # The table is rebuilt once another mesh shows up
+    assert pool.add_mesh(*quad()) == 3
+    index_counts, first_indices, vertex_offsets = pool.mesh_table()
+    assert list(first_indices) == [0, 3, 9, 12]
+    assert list(vertex_offsets) == [0, 3, 7, 10]
+
+def test_draw_commands_follow_the_table():
+
+    pool = draw_list.GeometryPool()
+    pool.add_mesh(*triangle())
+    pool.add_mesh(*quad())
+
+    commands = draw_list.build_draw_commands(pool, [1, 0, 1], instance_counts = 2)
+    assert list(commands["indexCount"]) == [6, 3, 6]
+    assert list(commands["firstIndex"]) == [3, 0, 3]
+    assert list(commands["vertexOffset"]) == [3, 0, 3]
+    assert list(commands["instanceCount"]) == [2, 2, 2]
+
+def test_add_after_upload_raises():
+
+    pool = draw_list.GeometryPool()
+    pool.add_mesh(*triangle())
+    pool.vertex_buffer = object() # Stands in for what upload() leaves behind
+    with pytest.raises(RuntimeError):
+        pool.add_mesh(*triangle())
+
+def test_empty_upload_raises():
+
+    with pytest.raises(ValueError):
+        draw_list.GeometryPool().upload(None, None, None)
+
+def test_out_of_range_mesh_ids_raise():
+
+    pool = draw_list.GeometryPool()
+    pool.add_mesh(*triangle())
+    pool.add_mesh(*quad())
+
+    # A negative id would otherwise wrap around to the last mesh
+    with pytest.raises(ValueError):
+        draw_list.build_draw_commands(pool, [0, -1])
+    with pytest.raises(ValueError):
+        draw_list.build_draw_commands(pool, [2])
+
+def test_empty_draw_list_has_no_buffer():
+
+    pool = draw_list.GeometryPool()
+    pool.add_mesh(*triangle())
+
+    # Nothing is uploaded, so no allocator or queue is needed
+    empty = draw_list.create_draw_list(None, None, None, pool, [])
+    assert empty.draw_count == 0
+    assert empty.indirect_buffer is None
+    draw_list.record_draw_list(None, empty, True)
+    draw_list.destroy_draw_list(None, empty)
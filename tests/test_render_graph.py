@@ -0,0 +1,95 @@
+import types
+
+import pytest
+
+import render_graph
+
+EXTENT = types.SimpleNamespace(width = 64, height = 64)
+
+def record(command_buffer, graph_pass):
+    pass
+
+def make_graph(attachments):
+
+    graph = render_graph.RenderGraph(None, EXTENT)
+    graph.import_image("out", None, None, 0, EXTENT)
+    for name in attachments:
+        graph.add_attachment(name, 0)
+    return graph
+
+def make_chain():
+
+    # a -> b -> c -> out, each pass reading what the previous one wrote
+    graph = make_graph(["a", "b", "c", "unused"])
+    graph.add_pass("first", record, writes = {"a": "color"})
+    graph.add_pass("second", record, reads = {"a": "sampled"}, writes = {"b": "color"})
+    graph.add_pass("third", record, reads = {"b": "sampled"}, writes = {"c": "color"})
+    graph.add_pass("last", record, reads = {"c": "sampled"}, writes = {"out": "color"})
+    graph.add_pass("dead end", record, reads = {"a": "sampled"}, writes = {"unused": "color"})
+    return graph
+
+def test_cull_drops_passes_feeding_no_output():
+
+    graph = make_chain()
+    graph.add_pass("feeds dead end", record, writes = {"unused": "color"})
+    graph.cull()
+
+    assert [graph_pass.name for graph_pass in graph.kept] == ["first", "second", "third", "last"]
+    assert sorted(graph_pass.name for graph_pass in graph.culled) == ["dead end", "feeds dead end"]
+
+def test_cull_keeps_side_effects():
+
+    graph = make_graph(["a"])
+    graph.add_pass("upload", record, writes = {"a": "transfer_dst"}, side_effects = True)
+    graph.cull()
+
+    assert [graph_pass.name for graph_pass in graph.kept] == ["upload"]
+
+def test_read_before_write_raises():
+
+    graph = make_graph(["a"])
+    graph.add_pass("reader", record, reads = {"a": "sampled"}, writes = {"out": "color"})
+    graph.cull()
+
+    with pytest.raises(ValueError):
+        graph.compute_lifetimes()
+
+def test_unknown_resource_raises():
+
+    graph = make_graph([])
+    with pytest.raises(ValueError):
+        graph.add_pass("reader", record, reads = {"missing": "sampled"})
+
+def test_lifetimes_alias_only_when_disjoint():
+
+    graph = make_chain()
+    graph.cull()
+    graph.compute_lifetimes()
+
+    a, b, c = graph.resources["a"], graph.resources["b"], graph.resources["c"]
+    assert (a.first, a.last) == (0, 1)
+    assert (b.first, b.last) == (1, 2)
+    assert (c.first, c.last) == (2, 3)
+    assert graph.resources["unused"].first is None
+
+    entries = [(resource, render_graph.HeapRequirements(1000, 1024, 1)) for resource in (a, b, c)]
+    heap_size = render_graph.place_resources(entries)
+
+    # a and c are never alive together, b overlaps both
+    assert a.memory_offset == c.memory_offset == 0
+    assert b.memory_offset == 1024
+    assert heap_size == 2024
+
+def test_read_after_read_needs_no_barrier():
+
+    graph = make_graph(["a", "b"])
+    graph.add_pass("write", record, writes = {"a": "color"})
+    graph.add_pass("read", record, reads = {"a": "sampled"}, writes = {"b": "color"})
+    graph.add_pass("read again", record, reads = {"a": "sampled", "b": "sampled"}, writes = {"out": "color"})
+    graph.cull()
+    graph.compute_lifetimes()
+    graph.plan_barriers()
+
+    read, read_again = graph.kept[1], graph.kept[2]
+    assert "a" in [barrier[0] for barrier in read.barriers]
+    assert [barrier[0] for barrier in read_again.barriers if barrier[0] != "out"] == ["b"]
@@ -0,0 +1,190 @@
+from vulkan import *
+
+import buffers
+
+class Upload:
+
+    # One buffer on its way from the transfer queue to the graphics queue
+    def __init__(self, destination, staging, dst_stage, dst_access):
+
+        self.destination = destination # buffers.BufferBundle, usable on the graphics queue once ready is set
+        self.staging = staging
+        self.dst_stage = dst_stage # How the graphics queue is going to use the buffer
+        self.dst_access = dst_access
+        self.ready = False
+
+        self.transfer_commandbuffer = None
+        self.transfer_fence = None
+        self.semaphore = None # Signaled by the transfer submission, waited on by the acquire one
+        self.acquire_commandbuffer = None
+        self.acquire_fence = None
+
+def fence_signaled(device, fence):
+
+    # vkGetFenceStatus reports an unsignaled fence as VK_NOT_READY, which the binding raises
+    try:
+        vkGetFenceStatus(device, fence)
+        return True
+    except VkNotReady:
+        return False
+
+def ownership_barrier(buffer, src_family, dst_family, src_access, dst_access):
+
+    # The same barrier is recorded twice: on the source queue to release the buffer, and on the destination queue to acquire it
+    return VkBufferMemoryBarrier(srcAccessMask = src_access, dstAccessMask = dst_access, srcQueueFamilyIndex = src_family, dstQueueFamilyIndex = dst_family,
+        buffer = buffer, offset = 0, size = VK_WHOLE_SIZE)
+
+class AsyncUploader:
+
+    # Copies buffers on a dedicated transfer queue, so large uploads run alongside rendering instead of in front of it.
+    # The destination buffers are exclusive to one queue family at a time, so each one is released by the transfer family and acquired by the
+    # graphics family, with a semaphore ordering the two. Acquires are only submitted once poll() sees the copy finished, so the graphics
+    # queue never waits on the transfer queue. Without a dedicated transfer family, uploads go through the graphics queue and are ready right away
+    def __init__(self, device, allocator, graphics_family, graphics_queue, transfer_family = None, transfer_queue = None):
+
+        self.device = device
+        self.allocator = allocator
+        self.graphics_family = graphics_family
+        self.graphics_queue = graphics_queue
+        self.transfer_family = transfer_family
+        self.transfer_queue = transfer_queue
+        self.pending = [] # Uploads submitted to the transfer queue, not acquired yet
+        self.acquiring = [] # Uploads whose acquire was submitted, kept until it finishes so their objects can be destroyed
+
+        pool_info = VkCommandPoolCreateInfo(flags = VK_COMMAND_POOL_CREATE_TRANSIENT_BIT, queueFamilyIndex = graphics_family)
+        self.graphics_pool = vkCreateCommandPool(device, pool_info, None)
+        self.transfer_pool = None
+        if self.is_async():
+            pool_info = VkCommandPoolCreateInfo(flags = VK_COMMAND_POOL_CREATE_TRANSIENT_BIT, queueFamilyIndex = transfer_family)
+            self.transfer_pool = vkCreateCommandPool(device, pool_info, None)
+
+    def is_async(self):
+        return self.transfer_queue is not None and self.transfer_family != self.graphics_family
+
+    def upload_array(self, array, usage, dst_stage, dst_access):
+
+        # Returns an Upload whose destination buffer may only be used on the graphics queue once its ready flag is set
+        buffers.check_array(array)
+        if not self.is_async():
+            destination = buffers.upload_array(self.allocator, self.graphics_pool, self.graphics_queue, array, usage)
+            upload = Upload(destination, None, dst_stage, dst_access)
+            upload.ready = True
+            return upload
+
+        size = array.nbytes
+        staging = buffers.create_buffer(self.allocator, size, VK_BUFFER_USAGE_TRANSFER_SRC_BIT, VK_MEMORY_PROPERTY_HOST_VISIBLE_BIT | VK_MEMORY_PROPERTY_HOST_COHERENT_BIT)
+        buffers.write_array(staging, array)
+        destination = buffers.create_buffer(self.allocator, size, usage | VK_BUFFER_USAGE_TRANSFER_DST_BIT, VK_MEMORY_PROPERTY_DEVICE_LOCAL_BIT)
+        upload = Upload(destination, staging, dst_stage, dst_access)
+
+        # Copy, then release the buffer to the graphics family. The destination half of a release barrier is ignored
+        upload.transfer_commandbuffer = buffers.begin_single_time_commands(self.device, self.transfer_pool)
+        vkCmdCopyBuffer(upload.transfer_commandbuffer, staging.buffer, destination.buffer, 1, [VkBufferCopy(srcOffset = 0, dstOffset = 0, size = size)])
+        release = ownership_barrier(destination.buffer, self.transfer_family, self.graphics_family, VK_ACCESS_TRANSFER_WRITE_BIT, 0)
+        vkCmdPipelineBarrier(upload.transfer_commandbuffer, VK_PIPELINE_STAGE_TRANSFER_BIT, VK_PIPELINE_STAGE_BOTTOM_OF_PIPE_BIT, 0, 0, None, 1, [release,], 0, None)
+        vkEndCommandBuffer(upload.transfer_commandbuffer)
+
+        upload.semaphore = vkCreateSemaphore(self.device, VkSemaphoreCreateInfo(), None)
+        upload.transfer_fence = vkCreateFence(self.device, VkFenceCreateInfo(), None)
+        submit_info = VkSubmitInfo(commandBufferCount = 1, pCommandBuffers = [upload.transfer_commandbuffer,], signalSemaphoreCount = 1,
+            pSignalSemaphores = [upload.semaphore,])
+        vkQueueSubmit(self.transfer_queue, 1, submit_info, upload.transfer_fence)
+
+        self.pending.append(upload)
+        return upload
+
+    def acquire(self, upload):
+
+        # Acquire barrier on the graphics queue. The source half of an acquire barrier is ignored. The semaphore wait blocks the stage the buffer
+        # is used in, and the barrier starts from that same stage, so everything submitted afterwards sees the copied data
+        upload.acquire_commandbuffer = buffers.begin_single_time_commands(self.device, self.graphics_pool)
+        acquire = ownership_barrier(upload.destination.buffer, self.transfer_family, self.graphics_family, 0, upload.dst_access)
+        vkCmdPipelineBarrier(upload.acquire_commandbuffer, upload.dst_stage, upload.dst_stage, 0, 0, None, 1, [acquire,], 0, None)
+        vkEndCommandBuffer(upload.acquire_commandbuffer)
+
+        upload.acquire_fence = vkCreateFence(self.device, VkFenceCreateInfo(), None)
+        submit_info = VkSubmitInfo(waitSemaphoreCount = 1, pWaitSemaphores = [upload.semaphore,], pWaitDstStageMask = [upload.dst_stage,], commandBufferCount = 1,
+            pCommandBuffers = [upload.acquire_commandbuffer,])
+        vkQueueSubmit(self.graphics_queue, 1, submit_info, upload.acquire_fence)
+
+        upload.ready = True
+        self.acquiring.append(upload)
+
+    def poll(self):
+
+        # Called once per frame. Acquires every finished copy and returns the uploads that became ready, never blocks
+        ready = []
+        still_pending = []
+        for upload in self.pending:
+            if fence_signaled(self.device, upload.transfer_fence):
+                self.acquire(upload)
+                ready.append(upload)
+            else:
+                still_pending.append(upload)
+        self.pending = still_pending
+
+        still_acquiring = []
+        for upload in self.acquiring:
+            if fence_signaled(self.device, upload.acquire_fence):
+                self.release_resources(upload)
+            else:
+                still_acquiring.append(upload)
+        self.acquiring = still_acquiring
+
+        return ready
+
+    def wait(self, upload):
+
+        # Blocks until the upload is ready
+        if upload.ready:
+            return
+
+        vkWaitForFences(self.device, 1, [upload.transfer_fence,], VK_TRUE, 0xFFFFFFFFFFFFFFFF)
+        self.pending.remove(upload)
+        self.acquire(upload)
+
+    def release_resources(self, upload):
+
+        # Everything but the destination buffer, once both submissions are done
+        vkFreeCommandBuffers(self.device, self.transfer_pool, 1, [upload.transfer_commandbuffer,])
+        vkFreeCommandBuffers(self.device, self.graphics_pool, 1, [upload.acquire_commandbuffer,])
+        vkDestroyFence(self.device, upload.transfer_fence, None)
+        vkDestroyFence(self.device, upload.acquire_fence, None)
+        vkDestroySemaphore(self.device, upload.semaphore, None)
+        buffers.destroy_buffer(self.allocator, upload.staging)
+        upload.staging = None
+
+    def destroy(self):
+
+        # The device has to be idle. Destinations of uploads that never got acquired are destroyed too, since nobody could use them yet
+        for upload in self.pending:
+            vkDestroyFence(self.device, upload.transfer_fence, None)
+            vkDestroySemaphore(self.device, upload.semaphore, None)
+            buffers.destroy_buffer(self.allocator, upload.staging)
+            buffers.destroy_buffer(self.allocator, upload.destination)
+        for upload in self.acquiring:
+            self.release_resources(upload)
+        self.pending = []
+        self.acquiring = []
+
+        if self.transfer_pool is not None:
+            vkDestroyCommandPool(self.device, self.transfer_pool, None)
+        vkDestroyCommandPool(self.device, self.graphics_pool, None)
+
+def create_mesh_async(uploader, vertices, indices = None):
+
+    # Same as buffers.create_mesh, except the mesh can only be drawn once both of the returned uploads are ready
+    buffers.check_vertices(vertices)
+    my_mesh = buffers.Mesh()
+    indices, my_mesh.index_type = buffers.prepare_indices(len(vertices), indices)
+    buffers.check_array(indices)
+
+    my_mesh.vertex_count = len(vertices)
+    vertex_upload = uploader.upload_array(vertices, VK_BUFFER_USAGE_VERTEX_BUFFER_BIT, VK_PIPELINE_STAGE_VERTEX_INPUT_BIT, VK_ACCESS_VERTEX_ATTRIBUTE_READ_BIT)
+    my_mesh.vertex_buffer = vertex_upload.destination
+
+    my_mesh.index_count = len(indices)
+    index_upload = uploader.upload_array(indices, VK_BUFFER_USAGE_INDEX_BUFFER_BIT, VK_PIPELINE_STAGE_VERTEX_INPUT_BIT, VK_ACCESS_INDEX_READ_BIT)
+    my_mesh.index_buffer = index_upload.destination
+
+    return my_mesh, [vertex_upload, index_upload]
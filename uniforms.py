@@ -0,0 +1,78 @@
+import numpy
+
+from vulkan import *
+
+import buffers
+import descriptors
+
+# Per frame data, laid out following std140 so it matches the FrameData block in the shaders. Matrices are column major in GLSL,
+# so they have to be transposed when written from a row major NumPy array
+FRAME_UNIFORM_DTYPE = numpy.dtype([("transform", numpy.float32, (4, 4)), ("time", numpy.float32), ("padding", numpy.float32, 3)])
+
+# Per draw data, small enough to go through push constants. Matches the DrawData block in the shaders
+PUSH_CONSTANT_DTYPE = numpy.dtype([("offset", numpy.float32, 2), ("scale", numpy.float32), ("padding", numpy.float32)])
+PUSH_CONSTANT_STAGES = VK_SHADER_STAGE_VERTEX_BIT
+
+# Descriptor set and binding the ring is exposed at
+FRAME_UNIFORM_SET = 0
+FRAME_UNIFORM_BINDING = 0
+
+def push_constant_ranges():
+
+    # Every pipeline that binds the frame uniforms declares the same range, so their layouts stay compatible and
+    # the descriptor set remains bound when switching between them
+    return [VkPushConstantRange(stageFlags = PUSH_CONSTANT_STAGES, offset = 0, size = PUSH_CONSTANT_DTYPE.itemsize)]
+
+def default_draw_data():
+
+    draw_data = numpy.zeros(1, dtype = PUSH_CONSTANT_DTYPE)
+    draw_data["scale"] = 1.0
+    return draw_data
+
+def push_draw_data(command_buffer, pipeline_layout, draw_data):
+
+    # draw_data is a one element array with PUSH_CONSTANT_DTYPE, its bytes are recorded straight into the command buffer
+    vkCmdPushConstants(command_buffer, pipeline_layout, PUSH_CONSTANT_STAGES, 0, PUSH_CONSTANT_DTYPE.itemsize, ffi.from_buffer(draw_data))
+
+class UniformRing:
+
+    # A single uniform buffer split into slots, one for each frame that can be in flight. It lives in host visible, coherent memory that the
+    # allocator keeps mapped, so a frame's data is written straight through a NumPy view, with no map/unmap and no flush. Every slot is
+    # exposed through the same descriptor set, the slot in use is picked with a dynamic offset when binding it
+    def __init__(self, device, physical_device, allocator, slot_count, layout_cache, descriptor_sets, dtype = FRAME_UNIFORM_DTYPE, stages = VK_SHADER_STAGE_VERTEX_BIT):
+
+        self.device = device
+        self.allocator = allocator
+        self.descriptor_sets = descriptor_sets
+        self.dtype = numpy.dtype(dtype)
+        self.slot_count = slot_count
+
+        # Dynamic offsets have to be multiples of minUniformBufferOffsetAlignment, so every slot gets rounded up to it
+        alignment = vkGetPhysicalDeviceProperties(physical_device).limits.minUniformBufferOffsetAlignment
+        self.stride = (self.dtype.itemsize + alignment - 1) // alignment * alignment
+
+        self.buffer = buffers.create_buffer(allocator, self.stride * slot_count, VK_BUFFER_USAGE_UNIFORM_BUFFER_BIT,
+            VK_MEMORY_PROPERTY_HOST_VISIBLE_BIT | VK_MEMORY_PROPERTY_HOST_COHERENT_BIT)
+
+        # One record per slot, strided over the mapped memory. Writing to slots[i] writes to the GPU visible buffer
+        self.slots = numpy.ndarray(shape = (slot_count,), dtype = self.dtype, buffer = self.buffer.allocation.mapped, strides = (self.stride,))
+
+        # A single set covers every slot. The layout comes from the shared descriptors.DescriptorLayoutCache, and the set from a persistent
+        # descriptors.DescriptorSetCache, since command buffers recorded once keep binding it. Both own what they hand out
+        self.set_layout = layout_cache.get([(FRAME_UNIFORM_BINDING, VK_DESCRIPTOR_TYPE_UNIFORM_BUFFER_DYNAMIC, 1, stages),])
+
+        # The range covers one slot, the dynamic offset moves it along the buffer
+        self.descriptor_set = descriptor_sets.get(self.set_layout, [descriptors.buffer_binding(FRAME_UNIFORM_BINDING, VK_DESCRIPTOR_TYPE_UNIFORM_BUFFER_DYNAMIC,
+            self.buffer.buffer, 0, self.dtype.itemsize),])
+
+    def offset(self, slot):
+        return slot * self.stride
+
+    def bind(self, command_buffer, pipeline_layout, slot):
+        vkCmdBindDescriptorSets(command_buffer, VK_PIPELINE_BIND_POINT_GRAPHICS, pipeline_layout, FRAME_UNIFORM_SET, 1, [self.descriptor_set,], 1, [self.offset(slot),])
+
+    def destroy(self):
+
+        self.slots = None
+        self.descriptor_sets.evict(self.buffer.buffer)
+        buffers.destroy_buffer(self.allocator, self.buffer)